@@ -0,0 +1,146 @@
+"""Stock-take reconciliation: post counted quantities as ledger corrections.
+
+Counts are matched to products on SKU a chunk at a time. Each chunk locks
+its products (in id order, as checkout does), sets the counted stock with
+one UPDATE and records the differences with one Transaction bulk insert.
+Because the input is absolute counts, posting the same file twice is
+harmless: the second run finds nothing to correct.
+"""
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from . import dashboard, shards
+from .imports import read_rows
+from .models import Product, Transaction, normalize_sku
+
+CHUNK_SIZE = 500
+
+
+@dataclass
+class AdjustmentResult:
+    rows: int = 0
+    adjusted: int = 0
+    unchanged: int = 0
+    rejected: list = field(default_factory=list)  # (line, sku, error)
+    diffs: list = field(default_factory=list)     # dicts: sku, name, stock, counted, delta
+    seconds: float = 0.0
+
+
+def parse_counts(entries):
+    """Yield (line, sku, counted, error) from (line, {"sku": ..., "counted": ...}) entries.
+
+    ``error`` is None for a usable row; otherwise ``counted`` is None.
+    """
+    for line, row in entries:
+        sku = normalize_sku(row.get("sku"))
+        raw = str(row.get("counted", "")).strip()
+        try:
+            counted = Decimal(raw)
+            if not counted.is_finite() or counted < 0 or counted != int(counted):
+                raise InvalidOperation
+        except InvalidOperation:
+            yield line, sku, None, "counted must be a whole number of 0 or more"
+            continue
+        if not sku:
+            yield line, sku, None, "sku is required"
+            continue
+        yield line, sku, int(counted), None
+
+
+def read_counts(fileobj, fmt="csv"):
+    """Entries for ``adjust_stock`` from a CSV/XLSX file with sku and counted columns."""
+    _, records = read_rows(fileobj, fmt, required={"sku", "counted"})
+    return records
+
+
+def _apply_chunk(chunk, user, reason, dry_run, result):
+    """Reconcile one chunk of {sku: (line, counted)}; returns the rows changed."""
+    with transaction.atomic():
+        products = Product.objects.filter(sku__in=list(chunk)).order_by("id")
+        if not dry_run:
+            locked = list(products.select_for_update().values_list("id", flat=True))
+            # Sharded products: fold unsold shard stock back so Product.stock is exact
+            shards.drain(locked)
+        found = {
+            sku: (pk, name, stock)
+            for pk, sku, name, stock in products.annotate(exact=F("stock") - shards.sold_since_fold())
+            .values_list("id", "sku", "name", "exact")
+        }
+
+        changes = []
+        for sku, (line, counted) in chunk.items():
+            if sku not in found:
+                result.rejected.append((line, sku, "unknown sku"))
+                continue
+            pk, name, stock = found[sku]
+            if counted == stock:
+                result.unchanged += 1
+                continue
+            changes.append((pk, stock, counted))
+            result.diffs.append({
+                "sku": sku, "name": name, "stock": stock, "counted": counted, "delta": counted - stock,
+            })
+
+        if dry_run or not changes:
+            return len(changes)
+
+        Product.objects.filter(id__in=[pk for pk, _, _ in changes]).update(
+            stock=Case(
+                *[When(id=pk, then=Value(counted)) for pk, _, counted in changes],
+                output_field=IntegerField(),
+            ),
+            version=F("version") + 1,
+            updated_at=Now(),
+        )
+        note = f" ({reason})" if reason else ""
+        Transaction.objects.bulk_create([
+            Transaction(
+                product_id=pk,
+                type="in" if counted > stock else "out",
+                quantity=abs(counted - stock),
+                user=user,
+                remarks=f"Stock-take adjustment: counted {counted}, system had {stock}{note}",
+            )
+            for pk, stock, counted in changes
+        ])
+    return len(changes)
+
+
+def adjust_stock(entries, user=None, reason="", dry_run=False, chunk_size=CHUNK_SIZE):
+    """Set each product's stock to its counted quantity, recording the deltas.
+
+    ``entries`` yields (line, {"sku": ..., "counted": ...}). With
+    ``dry_run`` nothing is written and ``result.diffs`` is the would-be
+    change list. A SKU listed twice in one chunk keeps its last count.
+    """
+    result = AdjustmentResult()
+    started = time.perf_counter()
+    chunk = {}
+
+    def flush():
+        result.adjusted += _apply_chunk(chunk, user, reason, dry_run, result)
+        chunk.clear()
+
+    for line, sku, counted, error in parse_counts(entries):
+        result.rows += 1
+        if error:
+            result.rejected.append((line, sku, error))
+            continue
+        if sku in chunk:
+            result.rejected.append((chunk[sku][0], sku, f"superseded by line {line}"))
+        chunk[sku] = (line, counted)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    result.seconds = time.perf_counter() - started
+    if result.adjusted and not dry_run:
+        # update() and bulk_create send no signals
+        dashboard.invalidate()
+    return result
@@ -0,0 +1,183 @@
+"""Approving and rejecting supplier requests, one or many at a time.
+
+``approve_requests`` locks the pending requests, resolves and locks their
+products with one query (by SKU; a request without one also matches the
+oldest product with the same name), creates the missing products with one bulk insert and adds every
+quantity with one ``UPDATE ... SET stock = stock + CASE ...``, all in one
+transaction. A request that is no longer pending is skipped, so two admins
+approving the same backlog can't add its stock twice.
+"""
+import hashlib
+from dataclasses import dataclass, field
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, TextField, Value, When
+from django.db.models.functions import Now
+
+from . import catalog, dashboard, shards
+from .models import Product, SupplierRequest, Transaction, normalize_sku
+
+NEW_PRODUCT_CATEGORY = "Supplier"
+# Tries at resolving a batch's products when a concurrent approval creates one of them first
+RESOLVE_ATTEMPTS = 3
+
+
+@dataclass
+class ApprovalResult:
+    approved: list = field(default_factory=list)   # SupplierRequests, in id order
+    created: int = 0                                # products added for requests nothing matched
+    skipped: list = field(default_factory=list)    # (request id, reason)
+
+
+def _pending(request_ids):
+    """Lock the requests in id order and split off the ones that are no longer pending."""
+    requests = list(
+        SupplierRequest.objects.select_for_update(of=("self",)).select_related("supplier")
+        .filter(id__in=request_ids).order_by("id")
+    )
+    found = {req.id for req in requests}
+    skipped = [(pk, "no such request") for pk in sorted(set(request_ids) - found)]
+    skipped += [(req.id, f"already {req.status}") for req in requests if req.status != "pending"]
+    return [req for req in requests if req.status == "pending"], skipped
+
+
+def _lookup_sku(req):
+    """The SKU a request's product has, or gets: its own, else one derived from its name.
+
+    Deriving it makes the product created for a name-only request
+    deterministic, so two approvals creating it at once collide on the
+    unique SKU instead of adding the product twice.
+    """
+    sku = normalize_sku(req.sku)
+    if sku:
+        return sku
+    digest = hashlib.sha1(" ".join(req.product_name.split()).lower().encode()).hexdigest()
+    return f"SKU-{digest[:10].upper()}"
+
+
+def _match_or_create(requests):
+    skus = {_lookup_sku(req) for req in requests}
+    names = {req.product_name for req in requests if not normalize_sku(req.sku)}
+    by_sku, by_name = {}, {}
+    # Locked so the stock added below lands on rows nobody else is changing
+    for pk, sku, name in (
+        Product.objects.select_for_update().filter(Q(sku__in=skus) | Q(name__in=names))
+        .order_by("id").values_list("id", "sku", "name")
+    ):
+        by_sku[sku] = pk
+        by_name.setdefault(name, pk)
+
+    def match(req):
+        pid = by_sku.get(_lookup_sku(req))
+        if pid is None and not normalize_sku(req.sku):
+            pid = by_name.get(req.product_name)
+        return pid
+
+    missing = {}
+    for req in requests:
+        if match(req) is None:
+            missing.setdefault(_lookup_sku(req), req)
+    new = Product.objects.bulk_create([
+        Product(
+            name=req.product_name,
+            sku=_lookup_sku(req),
+            category=NEW_PRODUCT_CATEGORY,
+            stock=0,
+            price=req.price_per_unit,
+            description=req.description or "",
+        )
+        for req in missing.values()
+    ])
+    for product in new:
+        by_sku[product.sku] = product.id
+        by_name[product.name] = product.id
+    return {req.id: match(req) for req in requests}, len(new)
+
+
+def _resolve_products(requests):
+    """{request id: product id}, creating one product per SKU nothing matched.
+
+    A request with a SKU matches only on it, so an unknown SKU gets a new
+    product even when the name is taken; one without a SKU matches its
+    derived SKU, then the product name. A create that loses the race
+    to a concurrent approval fails on the unique SKU; the resolve is then
+    retried and finds the product the other approval added.
+    """
+    for attempt in range(RESOLVE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _match_or_create(requests)
+        except IntegrityError:
+            if attempt == RESOLVE_ATTEMPTS - 1:
+                raise
+
+
+def approve_requests(request_ids, user=None):
+    """Approve the pending requests among ``request_ids``; returns an ``ApprovalResult``.
+
+    Each product's stock goes up by its requests' total; its price (and
+    description, when given) follow the newest approved request.
+    """
+    result = ApprovalResult()
+    with transaction.atomic():
+        requests, result.skipped = _pending(request_ids)
+        if not requests:
+            return result
+        products, result.created = _resolve_products(requests)
+
+        added, latest = {}, {}
+        for req in requests:  # id order, so the newest request for a product is seen last
+            pid = products[req.id]
+            added[pid] = added.get(pid, 0) + req.quantity
+            latest[pid] = req
+
+        # Sharded products: fold unsold shard stock back so the increment lands on the exact total
+        shards.settle(list(added))
+        Product.objects.filter(id__in=list(added)).update(
+            stock=F("stock") + Case(
+                *[When(id=pid, then=Value(units)) for pid, units in added.items()],
+                output_field=IntegerField(),
+            ),
+            price=Case(
+                *[When(id=pid, then=Value(req.price_per_unit)) for pid, req in latest.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            description=Case(
+                *[When(id=pid, then=Value(req.description)) for pid, req in latest.items() if req.description],
+                default=F("description"),
+                output_field=TextField(),
+            ),
+            version=F("version") + 1,
+            updated_at=Now(),
+        )
+        SupplierRequest.objects.filter(id__in=[req.id for req in requests]).update(status="approved")
+        Transaction.objects.bulk_create([
+            Transaction(
+                product_id=products[req.id],
+                type="in",
+                quantity=req.quantity,
+                user=user,
+                supplier_request=req,
+                remarks=f"Supplier '{req.supplier.name}' supplied {req.quantity} unit(s).",
+            )
+            for req in requests
+        ])
+        for req in requests:
+            req.status = "approved"
+        result.approved = requests
+
+    # update() and bulk_create send no signals
+    dashboard.invalidate()
+    if result.created:
+        catalog.invalidate()
+    return result
+
+
+def reject_requests(request_ids):
+    """Reject the pending requests among ``request_ids``; returns (rejected, skipped)."""
+    with transaction.atomic():
+        requests, skipped = _pending(request_ids)
+        SupplierRequest.objects.filter(id__in=[req.id for req in requests]).update(status="rejected")
+        for req in requests:
+            req.status = "rejected"
+    return requests, skipped
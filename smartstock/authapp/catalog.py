@@ -0,0 +1,254 @@
+"""Per-process typeahead index over the product catalogue.
+
+Names and words live in sorted lists (a prefix lookup is a bisect) next to
+a trigram map for substring matches. Product saves and deletes in this
+process patch the index in place once their transaction commits and bump
+a shared version counter in the cache; every other worker sees the new
+version and rebuilds from the database. A worker only patches when the
+counter shows no other worker changed the catalogue since its own last
+sync, otherwise it rebuilds too. Lookups compare versions at most once
+every ``FRESHNESS_SECONDS``, so the typeahead rarely touches the cache.
+"""
+import bisect
+import heapq
+import itertools
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product
+
+VERSION_KEY = "product-catalog:version"
+SOURCE_FIELDS = ("id", "name", "category", "sku")
+
+# How long a lookup trusts the index before checking the shared version
+FRESHNESS_SECONDS = 2
+# Each bumped version is claimed under its own key for this long, so two
+# bumps that raced on a cache without atomic incr can't share a number
+CLAIM_SECONDS = 60
+
+# Candidate count above which a lookup walks the catalogue in result order
+BROAD_MATCH = 500
+
+# Sorts after any character a product name can hold
+_HIGH = "\U0010ffff"
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Doc:
+    __slots__ = ("name", "text", "words", "rank")
+
+    def __init__(self, *values):
+        # Leading space: " " + term in text is a word-prefix test
+        self.text = " " + " ".join(" ".join(str(v or "") for v in values).lower().split())
+        self.name = " ".join(str(values[0] or "").lower().split())
+        self.words = frozenset(self.text.split())
+        self.rank = (len(self.name), self.name)
+
+
+class ProductIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}          # id -> _Doc
+        self._names = []         # sorted (name, id)
+        self._words = []         # sorted (word, id)
+        self._ranked = []        # sorted (len(name), name, id): result order
+        self._trigrams = {}      # trigram -> set(id)
+        self._version = None
+        self._checked = 0.0      # time.monotonic() of the last version check
+
+    # -- building -------------------------------------------------------
+
+    def _add(self, pk, *values, sorted_insert=True):
+        doc = self._docs[pk] = _Doc(*values)
+        entries = (
+            (self._names, [(doc.name, pk)]),
+            (self._words, [(word, pk) for word in doc.words]),
+            (self._ranked, [(len(doc.name), doc.name, pk)]),
+        )
+        for target, items in entries:
+            for item in items:
+                if sorted_insert:
+                    bisect.insort(target, item)
+                else:
+                    target.append(item)
+        for gram in _trigrams(doc.text):
+            self._trigrams.setdefault(gram, set()).add(pk)
+
+    def _remove(self, pk):
+        doc = self._docs.pop(pk, None)
+        if doc is None:
+            return
+        entries = (
+            (self._names, [(doc.name, pk)]),
+            (self._words, [(word, pk) for word in doc.words]),
+            (self._ranked, [(len(doc.name), doc.name, pk)]),
+        )
+        for target, items in entries:
+            for item in items:
+                i = bisect.bisect_left(target, item)
+                if i < len(target) and target[i] == item:
+                    del target[i]
+        for gram in _trigrams(doc.text):
+            ids = self._trigrams.get(gram)
+            if ids is not None:
+                ids.discard(pk)
+                if not ids:
+                    del self._trigrams[gram]
+
+    def rebuild(self):
+        """Reload every product; the sorted lists are sorted once at the end."""
+        with self._lock:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                # Start from the clock so a cleared cache never repeats an old version
+                cache.add(VERSION_KEY, time.time_ns(), None)
+                version = cache.get(VERSION_KEY)
+            self._docs, self._trigrams = {}, {}
+            self._names, self._words, self._ranked = [], [], []
+            rows = Product.objects.values_list(*SOURCE_FIELDS).iterator(chunk_size=5000)
+            for row in rows:
+                self._add(*row, sorted_insert=False)
+            for target in (self._names, self._words, self._ranked):
+                target.sort()
+            self._version = version
+            self._checked = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._version is not None and time.monotonic() - self._checked < FRESHNESS_SECONDS:
+            return
+        if self._version is None or cache.get(VERSION_KEY) != self._version:
+            self.rebuild()
+        else:
+            self._checked = time.monotonic()
+
+    @staticmethod
+    def _bump():
+        """Advance the shared version; returns (new version, whether it followed straight on).
+
+        ``cache.incr`` is atomic on Redis, Memcached and the local-memory
+        cache but a read-then-write on the database cache, where two
+        workers can both get the same number. Claiming the number with
+        ``add`` (an insert, so only one claim wins) catches that: the loser
+        bumps again and counts as out of step.
+        """
+        clean = True
+        while True:
+            try:
+                version = cache.incr(VERSION_KEY)
+            except ValueError:
+                cache.add(VERSION_KEY, time.time_ns(), None)
+                continue
+            if cache.add(f"{VERSION_KEY}:{version}", True, CLAIM_SECONDS):
+                return version, clean
+            clean = False
+
+    def _sync(self, change=None):
+        """Publish a committed change: bump the version and patch with ``change`` if still in step."""
+        with self._lock:
+            seen = cache.get(VERSION_KEY)
+            version, clean = self._bump()
+            in_step = clean and self._version is not None and seen == self._version and version == seen + 1
+            if change is None or not in_step:
+                # Rebuild on the next lookup: another worker changed the catalogue
+                # too, nothing is built yet, or the write was a bulk one
+                self._version = None
+                return
+            change()
+            self._version = version
+
+    # -- change hooks (signal receivers) --------------------------------
+
+    def invalidate(self):
+        """Make every worker rebuild on its next lookup, once the transaction commits."""
+        transaction.on_commit(self._sync)
+
+    def product_saved(self, instance, **kwargs):
+        self.product_changed(instance.pk, [getattr(instance, field) for field in SOURCE_FIELDS])
+
+    def product_deleted(self, instance, **kwargs):
+        pk = instance.pk
+        self._publish(lambda: self._remove(pk))
+
+    def product_changed(self, pk, values):
+        """Re-index one product from its ``SOURCE_FIELDS`` values (for writes that send no signal)."""
+        self._publish(lambda: (self._remove(pk), self._add(*values)))
+
+    def _publish(self, change):
+        # A rolled-back write must never show up in lookups
+        transaction.on_commit(lambda: self._sync(change))
+
+    # -- lookups --------------------------------------------------------
+
+    def _range(self, target, prefix):
+        return (
+            bisect.bisect_left(target, (prefix,)),
+            bisect.bisect_left(target, (prefix + _HIGH,)),
+        )
+
+    def _term_candidates(self, term, substring):
+        """(estimated size, loader) for the ids one query term can match."""
+        if substring and len(term) >= 3:
+            sets = [self._trigrams.get(g, ()) for g in _trigrams(term)]
+            smallest = min(sets, key=len)
+            return len(smallest), lambda: smallest
+        start, stop = self._range(self._words, term)
+        return stop - start, lambda: (pk for _, pk in self._words[start:stop])
+
+    def _needle(self, term, substring):
+        return term if substring and len(term) >= 3 else " " + term
+
+    def _tier(self, terms, substring, skip, count):
+        """Up to ``count`` ids matching every term, shortest names first.
+
+        When even the rarest term matches a large share of the catalogue,
+        walking the catalogue in result order usually finds ``count`` hits
+        sooner than ranking every candidate. The walk gives up after a few
+        times the steps an even spread of matches would need; then only the
+        rarest term's candidates are loaded and ranked.
+        """
+        size, load = min((self._term_candidates(t, substring) for t in terms), key=lambda c: c[0])
+        needles = [self._needle(t, substring) for t in terms]
+        docs = self._docs
+
+        def hit(pk):
+            text = docs[pk].text
+            return pk not in skip and all(n in text for n in needles)
+
+        if size > BROAD_MATCH:
+            budget = 4 * count * len(docs) // size
+            walk = itertools.islice(self._ranked, budget)
+            found = list(itertools.islice((pk for _, _, pk in walk if hit(pk)), count))
+            if len(found) == count:
+                return found
+        hits = (pk for pk in set(load()) if hit(pk))
+        return heapq.nsmallest(count, hits, key=lambda pk: docs[pk].rank)
+
+    def search(self, query, limit=10):
+        """Ids of the best matches: name prefix, then word prefixes, then substrings."""
+        query = " ".join(query.lower().split())
+        if not query:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            start, stop = self._range(self._names, query)
+            found = [pk for _, pk in self._names[start:min(stop, start + limit)]]
+            terms = query.split()
+            for substring in (False, True):
+                if len(found) >= limit:
+                    break
+                found += self._tier(terms, substring, set(found), limit - len(found))
+            return found
+
+
+index = ProductIndex()
+
+
+def invalidate():
+    """For bulk writes, which send no signals."""
+    index.invalidate()
@@ -0,0 +1,238 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.db.models.functions import Now
+
+from . import dashboard, idempotency, invoices, shards
+from .invoices import allocate_invoice_number
+from .models import Bill, BillItem, Product, Transaction
+
+
+class CheckoutError(ValueError):
+    """Raised when a basket cannot be billed (unknown product or not enough stock)."""
+
+
+def merge_lines(lines):
+    """Collapse (product_id, quantity) pairs into {product_id: total_quantity}."""
+    basket = {}
+    for pid, qty in lines:
+        if qty <= 0:
+            continue
+        basket[pid] = basket.get(pid, 0) + qty
+    return basket
+
+
+def lock_products(product_ids):
+    """Lock every product in the basket with one query, always in id order.
+
+    Taking the row locks in a fixed order means two tills selling the same
+    products can never wait on each other in opposite directions.
+    """
+    products = Product.objects.select_for_update().filter(id__in=product_ids).order_by("id")
+    return {p.id: p for p in products}
+
+
+def check_stock(basket, products):
+    """Validate the whole basket against the locked rows before writing anything."""
+    for pid, qty in basket.items():
+        product = products.get(pid)
+        if product is None:
+            raise CheckoutError(f"Product #{pid} does not exist.")
+        if product.stock < qty:
+            raise CheckoutError(
+                f"Not enough stock for {product.name}. Available: {product.stock}, Requested: {qty}"
+            )
+
+
+def decrement_stock(basket):
+    """Take the basket off ``Product.stock`` in a single conditional UPDATE.
+
+    Each row only matches while it still holds enough stock, so if the
+    number of rows touched differs from the basket size something moved
+    underneath us and the whole bill is rolled back.
+    """
+    guard = Q()
+    for pid, qty in basket.items():
+        guard |= Q(id=pid, stock__gte=qty)
+    updated = Product.objects.filter(guard).update(
+        stock=Case(*[When(id=pid, then=F("stock") - qty) for pid, qty in basket.items()]),
+        version=F("version") + 1,
+        updated_at=Now(),
+    )
+    if updated != len(basket):
+        raise CheckoutError("Stock changed while the bill was being saved. Please try again.")
+
+
+def checkout(customer_name, user, lines, idempotency_key=None):
+    """Create a bill for ``lines`` (an iterable of (product_id, quantity)).
+
+    Runs in a fixed number of queries regardless of basket size: one locking
+    SELECT, the invoice number, the Bill insert, one bulk insert each for
+    BillItems and Transactions, and one UPDATE for the stock. Products with
+    sharded stock (``authapp.shards``) are read without a lock and cost one
+    shard UPDATE per line instead.
+
+    With an ``idempotency_key`` a retried request gets the originally
+    created bill back (flagged with ``replayed = True``) and stock is not
+    touched again.
+    """
+    previous = _replayed_bill(idempotency_key, user)
+    if previous is not None:
+        return previous
+
+    basket = merge_lines(lines)
+    if not basket:
+        raise CheckoutError("Please select at least one product with a quantity above zero.")
+
+    try:
+        with transaction.atomic():
+            hot = shards.sharded(basket.keys())
+            cold = {pid: qty for pid, qty in basket.items() if pid not in hot}
+            products = lock_products(cold.keys())
+            if hot:
+                products.update(Product.objects.in_bulk(list(hot)))
+            check_stock(cold, products)
+
+            store, year, number = allocate_invoice_number()
+            bill = Bill.objects.create(
+                customer_name=customer_name,
+                created_by=user,
+                store=store,
+                invoice_year=year,
+                invoice_seq=number,
+                total=sum(products[pid].price * qty for pid, qty in basket.items()),
+                item_count=len(basket),
+            )
+
+            BillItem.objects.bulk_create([
+                BillItem(bill=bill, product=products[pid], quantity=qty, price=products[pid].price)
+                for pid, qty in basket.items()
+            ])
+
+            if cold:
+                decrement_stock(cold)
+            if hot:
+                try:
+                    shards.take(
+                        {pid: basket[pid] for pid in hot}, hot, products, till=getattr(user, "pk", None) or 0
+                    )
+                except shards.ShardError as e:
+                    raise CheckoutError(str(e))
+
+            Transaction.objects.bulk_create([
+                Transaction(
+                    product=products[pid],
+                    type="out",
+                    quantity=qty,
+                    user=user,
+                    remarks=f"Sale to {customer_name} on Bill #{bill.id}",
+                    bill=bill,
+                )
+                for pid, qty in basket.items()
+            ])
+
+            if idempotency_key:
+                idempotency.record("bill", idempotency_key, user, {"bill_id": bill.id})
+
+            # bulk_create and update() send no signals
+            dashboard.invalidate()
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        previous = _replayed_bill(idempotency_key, user)
+        if previous is None:
+            raise
+        return previous
+
+    bill.replayed = False
+    return bill
+
+
+def _replayed_bill(idempotency_key, user):
+    result = idempotency.replayed("bill", idempotency_key, user)
+    if result is None:
+        return None
+    bill = Bill.objects.get(id=result["bill_id"])
+    bill.replayed = True
+    return bill
+
+
+def parse_bill_payload(entry):
+    """Turn one JSON bill ({"customer_name", "lines": [{"product_id", "quantity"}], "idempotency_key"})
+    into checkout args."""
+    if not isinstance(entry, dict):
+        raise CheckoutError("Each bill must be an object.")
+    customer_name = str(entry.get("customer_name") or "").strip()
+    if not customer_name:
+        raise CheckoutError("customer_name is required.")
+    raw_lines = entry.get("lines")
+    if not isinstance(raw_lines, list) or not raw_lines:
+        raise CheckoutError("lines must be a non-empty list.")
+    lines = []
+    for line in raw_lines:
+        try:
+            lines.append((int(line["product_id"]), int(line["quantity"])))
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError("Each line needs an integer product_id and quantity.")
+    key = entry.get("idempotency_key")
+    return customer_name, lines, str(key)[:100] if key else None
+
+
+def checkout_batch(entries, user, chunk_size=200):
+    """Bill many queued sales, one database transaction per chunk.
+
+    Every product used in a chunk is locked up front in id order (except
+    sharded ones, which sell without the row lock), then each bill runs
+    through ``checkout`` inside its own savepoint so one short bill only
+    rolls back itself. Returns one result dict per entry, in order.
+    """
+    results = []
+    for start in range(0, len(entries), chunk_size):
+        parsed = []
+        for offset, entry in enumerate(entries[start:start + chunk_size]):
+            try:
+                parsed.append((start + offset, *parse_bill_payload(entry)))
+            except CheckoutError as e:
+                results.append({"index": start + offset, "ok": False, "error": str(e)})
+
+        if not parsed:
+            continue
+
+        with transaction.atomic(), invoices.batch(len(parsed)):
+            used = {pid for _, _, lines, _ in parsed for pid, _ in lines}
+            lock_products(sorted(used.difference(shards.sharded(used))))
+            for index, customer_name, lines, key in parsed:
+                try:
+                    bill = checkout(customer_name, user, lines, idempotency_key=key)
+                except CheckoutError as e:
+                    results.append({"index": index, "ok": False, "error": str(e)})
+                else:
+                    results.append({
+                        "index": index,
+                        "ok": True,
+                        "bill_id": bill.id,
+                        "invoice_number": bill.invoice_number,
+                        "replayed": bill.replayed,
+                    })
+
+    results.sort(key=lambda r: r["index"])
+    return results
+
+
+def reconcile(bill):
+    """[(product_id, billed, moved)] for every product whose ledger rows disagree with the bill.
+
+    ``moved`` is the net quantity the bill's linked Transactions took out of
+    stock. Both sides are one grouped query on the bill's foreign keys.
+    """
+    billed = dict(
+        bill.items.order_by().values("product").annotate(total=Sum("quantity")).values_list("product", "total")
+    )
+    moved = dict(
+        bill.transactions.order_by().values("product")
+        .annotate(net=Sum(Case(When(type="out", then=F("quantity")), default=-F("quantity"))))
+        .values_list("product", "net")
+    )
+    return [
+        (pid, billed.get(pid, 0), moved.get(pid, 0))
+        for pid in sorted(billed.keys() | moved.keys())
+        if billed.get(pid, 0) != moved.get(pid, 0)
+    ]
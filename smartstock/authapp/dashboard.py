@@ -0,0 +1,118 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import shards
+from .models import CustomUser, Product, Supplier, Transaction
+
+VERSION_KEY = "admin-dashboard:version"
+SUMMARY_TIMEOUT = 300
+LOW_STOCK_LIMIT = 50
+IGNORED_UPDATE_FIELDS = {"last_login"}
+
+
+def _scalar(queryset, aggregate):
+    """An uncorrelated scalar subquery returning ``aggregate`` over ``queryset``."""
+    return Subquery(
+        queryset.order_by().annotate(_group=Value(1)).values("_group")
+        .annotate(_value=aggregate).values("_value"),
+        output_field=IntegerField(),
+    )
+
+
+def counters():
+    """Every dashboard counter in one SELECT.
+
+    The query runs over CustomUser (never empty while an admin is looking)
+    and folds the other tables in as uncorrelated scalar subqueries, which
+    the database evaluates once.
+    """
+    return CustomUser.objects.aggregate(
+        active_users=Count("id", filter=Q(is_active=True, role__in=["staff", "supplier"])),
+        total_products=Coalesce(Max(_scalar(Product.objects.all(), Count("id"))), 0),
+        total_stock=Coalesce(Max(_scalar(Product.objects.all(), Sum("stock"))), 0),
+        low_stock_count=Coalesce(Max(_scalar(shards.low_stock(), Count("id"))), 0),
+        transactions_count=Coalesce(Max(_scalar(Transaction.objects.all(), Count("id"))), 0),
+        pending_suppliers=Coalesce(
+            Max(_scalar(Supplier.objects.filter(status="pending"), Count("id"))), 0
+        ),
+    )
+
+
+def build_summary():
+    summary = counters()
+    summary["low_stock_products"] = list(
+        shards.low_stock().order_by("id")[:LOW_STOCK_LIMIT]
+    )
+    summary["recent_transactions"] = list(
+        Transaction.objects.select_related("product", "user").order_by("-date", "-id")[:5]
+    )
+    return summary
+
+
+CHART_TOP_DEFAULT = 20
+CHART_TOP_MAX = 200
+
+
+def chart_fingerprint():
+    """(latest updated_at, product count): changes whenever chart data can change."""
+    state = Product.objects.aggregate(latest=Max("updated_at"), count=Count("id"))
+    return state["latest"], state["count"]
+
+
+def chart_series(top=CHART_TOP_DEFAULT, group="product"):
+    """Top-N stock levels by product or category, with the remainder summed as "Others"."""
+    if group == "category":
+        rows = list(
+            Product.objects.values("category").annotate(total=Sum("stock"))
+            .order_by("-total", "category").values_list("category", "total")
+        )
+        head, tail = rows[:top], rows[top:]
+        others = sum(total for _, total in tail)
+        others_count = len(tail)
+    else:
+        head = list(Product.objects.order_by("-stock", "id").values_list("name", "stock")[:top])
+        totals = Product.objects.aggregate(stock=Sum("stock"), count=Count("id"))
+        others = (totals["stock"] or 0) - sum(stock for _, stock in head)
+        others_count = totals["count"] - len(head)
+
+    labels = [label for label, _ in head]
+    data = [value for _, value in head]
+    if others_count:
+        labels.append(f"Others ({others_count})")
+        data.append(others)
+    return {"group": group, "labels": labels, "data": data}
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.add(VERSION_KEY, version, None)
+        version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def get_summary():
+    """The cached summary block; rebuilt after any relevant write (or every few minutes)."""
+    key = f"admin-dashboard:summary:{_version()}"
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary()
+        cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate(update_fields=None, **kwargs):
+    """Retire the cached summary once the current transaction commits.
+
+    Signature fits a signal receiver; bulk paths that send no signals
+    (``bulk_create``, ``update()``) call it directly. A save that only
+    stamps ``last_login`` (every login does one) moves no counter.
+    """
+    if update_fields and set(update_fields) <= IGNORED_UPDATE_FIELDS:
+        return
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), None))
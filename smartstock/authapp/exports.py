@@ -0,0 +1,124 @@
+import csv
+import io
+import json
+import zlib
+
+from . import search
+from .imports import PRODUCT_COLUMNS
+from .models import Product, Transaction
+
+LEDGER_COLUMNS = [
+    ("id", "id"),
+    ("date", "date"),
+    ("type", "type"),
+    ("quantity", "quantity"),
+    ("product_id", "product_id"),
+    ("product_name", "product__name"),
+    ("product_category", "product__category"),
+    ("user", "user__username"),
+    ("remarks", "remarks"),
+    ("bill_id", "bill_id"),
+    ("supplier_request_id", "supplier_request_id"),
+    ("purchase_order_id", "purchase_order_id"),
+]
+
+# Rows are serialised in batches so each yielded chunk is a few hundred KB
+ROWS_PER_CHUNK = 1000
+
+
+def ledger_rows(transaction_type=None, search_query=None, chunk_size=2000):
+    """Yield ledger rows as tuples in id order, with the same filters as transactions_view.
+
+    ``iterator()`` reads through a server-side cursor on PostgreSQL (and
+    fetchmany() elsewhere), so memory stays flat however long the ledger is.
+    """
+    queryset = Transaction.objects.all()
+    if transaction_type in ("in", "out"):
+        queryset = queryset.filter(type=transaction_type)
+    if search_query:
+        queryset = search.filter_queryset(queryset, search_query)
+    fields = [lookup for _, lookup in LEDGER_COLUMNS]
+    return queryset.order_by("id").values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def _batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ROWS_PER_CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_chunks(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for batch in _batched(rows):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def csv_chunks(rows):
+    return _csv_chunks(
+        [name for name, _ in LEDGER_COLUMNS],
+        ((pk, date.isoformat(), *rest) for pk, date, *rest in rows),
+    )
+
+
+def ndjson_chunks(rows):
+    names = [name for name, _ in LEDGER_COLUMNS]
+    for batch in _batched(rows):
+        lines = []
+        for row in batch:
+            record = dict(zip(names, row))
+            record["date"] = record["date"].isoformat()
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def gzip_chunks(chunks):
+    """Compress a byte stream on the fly into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    "csv": (csv_chunks, "text/csv"),
+    "ndjson": (ndjson_chunks, "application/x-ndjson"),
+}
+
+
+def export_ledger(fmt="csv", transaction_type=None, search_query=None, compress=False):
+    """Return (byte chunk iterator, content type, file extension) for a ledger export."""
+    serialise, content_type = FORMATS[fmt]
+    chunks = serialise(ledger_rows(transaction_type, search_query))
+    extension = fmt
+    if compress:
+        chunks = gzip_chunks(chunks)
+        content_type = "application/gzip"
+        extension += ".gz"
+    return chunks, content_type, extension
+
+
+def export_products(compress=False):
+    """(byte chunk iterator, content type, file extension) for the product catalogue.
+
+    Columns match what ``import_products`` reads, so an export can be
+    edited and imported back.
+    """
+    rows = Product.objects.order_by("id").values_list(*PRODUCT_COLUMNS).iterator(chunk_size=2000)
+    chunks = _csv_chunks(PRODUCT_COLUMNS, rows)
+    if compress:
+        return gzip_chunks(chunks), "application/gzip", "csv.gz"
+    return chunks, "text/csv", "csv"
@@ -0,0 +1,193 @@
+"""Demand forecasts and reorder points from the sales ledger.
+
+Weekly units sold per product (ledger rows linked to a bill) come out of
+one grouped query into a products x weeks NumPy matrix. Demand, its
+spread and the reorder point are then computed for every product at once;
+the only Python loop is over weeks, never over products. The reorder point
+is written to ``Product.min_stock``, which drives the low-stock alerts.
+
+NumPy is optional: everything else in the app works without it.
+"""
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, time as dt_time, timedelta
+from statistics import NormalDist
+
+from django.db import transaction
+from django.db.models import F, Func, IntegerField, Sum, Value
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from . import dashboard
+from .models import Product, Transaction
+
+HISTORY_WEEKS = 104
+MIN_HISTORY_WEEKS = 4
+LEAD_TIME_DAYS = 7
+SERVICE_LEVEL = 0.95
+ALPHA = 0.3          # exponential smoothing weight of the newest week
+MA_WEEKS = 8
+METHODS = ("ses", "ma")
+CHUNK_SIZE = 1000
+
+
+class ForecastError(ValueError):
+    """The forecast can't run (NumPy missing, bad parameters)."""
+
+
+@dataclass
+class ForecastResult:
+    products: int = 0     # products with enough history to forecast
+    changed: int = 0
+    suggestions: list = field(default_factory=list)  # dicts: id, name, min_stock, suggested, weekly_demand
+    seconds: float = 0.0
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ForecastError("Demand forecasting needs the numpy package.")
+    return numpy
+
+
+class WeeksSince(Func):
+    """Whole weeks from ``start`` to a timestamp column, as an integer computed by the database.
+
+    Bucketing in SQL keeps the grouped query from converting every row to a
+    Python datetime (TruncWeek is a Python function on SQLite).
+    """
+    template = "CAST(FLOOR(EXTRACT(EPOCH FROM (%(expressions)s)) / 604800) AS INTEGER)"
+    arg_joiner = " - "
+    output_field = IntegerField()
+
+    def __init__(self, expression, start):
+        super().__init__(expression, Value(start))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # CAST truncates toward zero; callers only rely on it for times after ``start``
+        return self.as_sql(
+            compiler, connection,
+            template="CAST((julianday(%(expressions)s)) / 7 AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+
+def _weekly_sales(np, begin, weeks):
+    """(product ids, current min_stock, units matrix [product, week], first week each product existed)."""
+    products = (
+        Product.objects.order_by("id")
+        .annotate(first=WeeksSince("created_at", begin)).values_list("id", "min_stock", "first")
+    )
+    ids, current, first = np.array(list(products), dtype=np.int64).reshape(-1, 3).T
+    first = np.clip(first, 0, weeks)
+
+    end = begin + timedelta(weeks=weeks)
+    weekly = (
+        Transaction.objects.filter(type="out", bill__isnull=False, date__gte=begin, date__lt=end)
+        .annotate(week=WeeksSince("date", begin)).order_by()
+        .values_list("product_id", "week").annotate(units=Sum("quantity"))
+    )
+    sales = np.zeros((len(ids), weeks))
+    rows = np.array(list(weekly), dtype=np.int64).reshape(-1, 3)
+    known = np.isin(rows[:, 0], ids)
+    rows = rows[known & (rows[:, 1] >= 0) & (rows[:, 1] < weeks)]
+    sales[np.searchsorted(ids, rows[:, 0]), rows[:, 1]] = rows[:, 2]
+    return ids, current, sales, first
+
+
+def _demand(np, sales, valid, method, alpha, ma_weeks):
+    """Expected units per week for each row of ``sales`` (only ``valid`` weeks count)."""
+    if method == "ma":
+        recent = valid[:, -ma_weeks:]
+        return (sales[:, -ma_weeks:] * recent).sum(axis=1) / np.maximum(recent.sum(axis=1), 1)
+
+    level = np.zeros(len(sales))
+    started = np.zeros(len(sales), dtype=bool)
+    for week in range(sales.shape[1]):
+        seen, units = valid[:, week], sales[:, week]
+        # A product's first week seeds its level; later weeks smooth into it
+        level = np.where(seen & started, alpha * units + (1 - alpha) * level, np.where(seen, units, level))
+        started |= seen
+    return level
+
+
+def reorder_points(
+    weeks=HISTORY_WEEKS, lead_time_days=LEAD_TIME_DAYS, service_level=SERVICE_LEVEL,
+    method="ses", alpha=ALPHA, ma_weeks=MA_WEEKS, min_history_weeks=MIN_HISTORY_WEEKS,
+):
+    """(product ids, current min_stock, weekly demand, reorder points) for products with enough history.
+
+    reorder point = demand over the lead time + safety stock, where safety
+    stock is z(service level) x the weekly demand's standard deviation
+    scaled to the lead time. Only full weeks before the current one are used.
+    Below a 50% service level z is negative; points never go below zero.
+    """
+    np = _numpy()
+    if method not in METHODS:
+        raise ForecastError(f"Unknown method {method!r}; use one of {', '.join(METHODS)}.")
+    if not 0 < service_level < 1:
+        raise ForecastError("Service level must be between 0 and 1, e.g. 0.95.")
+    if not 0 < alpha <= 1 or weeks < 2 or lead_time_days < 0 or ma_weeks < 1:
+        raise ForecastError("Alpha must be in (0, 1], weeks at least 2, lead time 0 or more.")
+
+    today = timezone.localdate()
+    monday = today - timedelta(days=today.weekday())
+    begin = timezone.make_aware(datetime.combine(monday - timedelta(weeks=weeks), dt_time.min))
+    ids, current, sales, first = _weekly_sales(np, begin, weeks)
+
+    valid = np.arange(weeks)[None, :] >= first[:, None]
+    # Enough weeks on sale, and at least one sale to base a forecast on
+    keep = (valid.sum(axis=1) >= max(min_history_weeks, 2)) & (sales.sum(axis=1) > 0)
+    ids, current, sales, valid = ids[keep], current[keep], sales[keep], valid[keep]
+
+    demand = _demand(np, sales, valid, method, alpha, ma_weeks)
+    spread = np.nanstd(np.where(valid, sales, np.nan), axis=1, ddof=1)
+    lead_weeks = lead_time_days / 7
+    z = NormalDist().inv_cdf(service_level)
+    points = np.ceil(demand * lead_weeks + z * spread * math.sqrt(lead_weeks)).astype(np.int64)
+    return ids, current, demand, np.maximum(points, 0)
+
+
+def update_min_stock(dry_run=False, chunk_size=CHUNK_SIZE, **options):
+    """Set ``min_stock`` to the forecast reorder point; returns a ``ForecastResult``.
+
+    Products without ``min_history_weeks`` of history keep their value.
+    With ``dry_run`` nothing is written and ``suggestions`` lists the changes.
+    """
+    started = time.perf_counter()
+    ids, current, demand, points = reorder_points(**options)
+    result = ForecastResult(products=len(ids))
+
+    moved = points != current
+    changes = list(zip(ids[moved].tolist(), points[moved].tolist(), demand[moved].tolist(), current[moved].tolist()))
+    result.changed = len(changes)
+
+    if dry_run:
+        for begin in range(0, len(changes), chunk_size):
+            chunk = changes[begin:begin + chunk_size]
+            names = dict(Product.objects.filter(id__in=[pk for pk, *_ in chunk]).values_list("id", "name"))
+            result.suggestions += [
+                {"id": pk, "name": names.get(pk, ""), "min_stock": was,
+                 "suggested": point, "weekly_demand": round(weekly, 2)}
+                for pk, point, weekly, was in chunk
+            ]
+    elif changes:
+        # Reorder points take few distinct values: one UPDATE per value (and
+        # id chunk) instead of a CASE with a branch per product
+        by_point = {}
+        for pk, point, *_ in changes:
+            by_point.setdefault(point, []).append(pk)
+        with transaction.atomic():
+            for point, pks in by_point.items():
+                for begin in range(0, len(pks), chunk_size):
+                    Product.objects.filter(id__in=pks[begin:begin + chunk_size]).update(
+                        min_stock=point, version=F("version") + 1, updated_at=Now()
+                    )
+        # update() sends no signals; low-stock flags may have changed
+        dashboard.invalidate()
+
+    result.seconds = time.perf_counter() - started
+    return result
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+def key_from_request(request):
+    """Read the client's key from the Idempotency-Key header or the form field."""
+    key = request.headers.get("Idempotency-Key") or request.POST.get("idempotency_key")
+    return key.strip()[:100] if key else None
+
+
+def replayed(scope, key, user):
+    """Return the stored result for a key ``user`` already applied, or None.
+
+    Keys belong to the user who sent them: another user's request with
+    the same key is a different request, not a retry.
+    """
+    if not key:
+        return None
+    return (
+        IdempotencyKey.objects.filter(scope=scope, key=key, user=user)
+        .values_list("result", flat=True)
+        .first()
+    )
+
+
+def record(scope, key, user, result):
+    """Remember ``result`` for ``key``.
+
+    Call this inside the same atomic block as the write it guards: a
+    concurrent retry then fails on the unique index and the whole write
+    is rolled back instead of being applied twice.
+    """
+    IdempotencyKey.objects.create(scope=scope, key=key, user=user, result=result)
+
+
+def purge_expired(hours=None):
+    """Delete keys older than the TTL and return how many were removed."""
+    if hours is None:
+        hours = getattr(settings, "IDEMPOTENCY_KEY_TTL_HOURS", 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,244 @@
+"""Bulk product catalogue import (CSV or XLSX) keyed on SKU.
+
+Rows are parsed as a stream, validated a batch at a time and upserted with
+one ``INSERT ... ON CONFLICT (sku) DO UPDATE`` per batch. Stock is only
+taken for new products (opening stock, posted to the ledger as an "in"
+row so the stock history adds up); existing products keep their
+ledger-backed stock.
+"""
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+
+from . import catalog, dashboard
+from .models import Product, Transaction, normalize_sku
+
+PRODUCT_COLUMNS = ["sku", "name", "category", "price", "stock", "min_stock", "description"]
+REQUIRED_COLUMNS = {"sku", "name", "category", "price"}
+# Columns an import may overwrite on an existing product
+UPDATABLE_COLUMNS = ["name", "category", "price", "min_stock", "description"]
+# Optional columns: a blank cell leaves an existing product's value alone
+KEEP_WHEN_BLANK = ["min_stock", "description"]
+
+BATCH_SIZE = 1000
+OPENING_REMARKS = "Opening stock (catalogue import)"
+MAX_PRICE = Decimal("99999999.99")
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (bad header, unknown format)."""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: list = field(default_factory=list)  # (line, sku, error)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else self.rows
+
+
+# -- reading ------------------------------------------------------------
+
+def _csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    yield from reader
+
+
+def _xlsx_rows(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("XLSX import needs the openpyxl package; upload CSV instead.")
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+READERS = {"csv": _csv_rows, "xlsx": _xlsx_rows}
+
+
+def read_rows(fileobj, fmt, required=REQUIRED_COLUMNS):
+    """(header columns, iterator of (line number, {column: value})) for a binary file."""
+    if fmt not in READERS:
+        raise ImportFileError(f"Unsupported format {fmt!r}; use CSV or XLSX.")
+    rows = READERS[fmt](fileobj)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    columns = [str(name).strip().lower() for name in header]
+    missing = set(required).difference(columns)
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(sorted(missing))}.")
+
+    def records():
+        for line, row in enumerate(rows, start=2):
+            if any(str(value).strip() for value in row):
+                yield line, dict(zip(columns, row))
+
+    return columns, records()
+
+
+# -- validation ---------------------------------------------------------
+
+def _text(row, name, max_length, required=False):
+    value = str(row.get(name, "") or "").strip()
+    if required and not value:
+        raise ValueError(f"{name} is required")
+    if len(value) > max_length:
+        raise ValueError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _count(row, name, default):
+    value = str(row.get(name, "") or "").strip()
+    if not value:
+        return default
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        number = None
+    if number is None or not number.is_finite() or number < 0 or number != int(number):
+        raise ValueError(f"{name} must be a whole number of 0 or more")
+    return int(number)
+
+
+def validate(row):
+    """A ``Product`` built from one row, or ValueError with every problem found."""
+    errors = []
+    values = {}
+    checks = [
+        ("sku", lambda: normalize_sku(_text(row, "sku", 64, required=True))),
+        ("name", lambda: _text(row, "name", 100, required=True)),
+        ("category", lambda: _text(row, "category", 50, required=True)),
+        ("description", lambda: _text(row, "description", 10_000)),
+        ("stock", lambda: _count(row, "stock", 0)),
+        ("min_stock", lambda: _count(row, "min_stock", 5)),
+    ]
+    for name, check in checks:
+        try:
+            values[name] = check()
+        except ValueError as e:
+            errors.append(str(e))
+
+    try:
+        price = Decimal(str(row.get("price", "")).strip())
+        if not price.is_finite() or price < 0 or price > MAX_PRICE:
+            raise InvalidOperation
+        values["price"] = price.quantize(Decimal("0.01"))
+    except InvalidOperation:
+        errors.append("price must be a number between 0 and 99999999.99")
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return Product(**values)
+
+
+# -- writing ------------------------------------------------------------
+
+def blank_columns(row):
+    """The ``KEEP_WHEN_BLANK`` columns that are empty in ``row``."""
+    return frozenset(name for name in KEEP_WHEN_BLANK if not str(row.get(name, "") or "").strip())
+
+
+def _upsert(rows, update_fields, user=None):
+    """Upsert [(Product, blank columns)]; returns (created, updated).
+
+    Rows are grouped by their blank columns, and each group's ON CONFLICT
+    clause leaves those columns out, so a new product still gets the
+    default while an existing one keeps its value. New products with stock
+    get their opening balance in the ledger.
+    """
+    groups = {}
+    for product, blank in rows:
+        groups.setdefault(blank, []).append(product)
+    skus = [product.sku for product, _ in rows]
+    with transaction.atomic():
+        existing = set(Product.objects.filter(sku__in=skus).values_list("sku", flat=True))
+        for blank, products in groups.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=["sku"],
+                update_fields=[name for name in update_fields if name not in blank] + ["updated_at"],
+            )
+        if existing:
+            # ON CONFLICT can only copy the new row's values; bump versions separately
+            Product.objects.filter(sku__in=existing).update(version=F("version") + 1)
+        opened = Product.objects.filter(sku__in=set(skus) - existing, stock__gt=0).values_list("id", "stock")
+        Transaction.objects.bulk_create([
+            Transaction(product_id=pid, type="in", quantity=stock, user=user, remarks=OPENING_REMARKS)
+            for pid, stock in opened
+        ])
+    return len(rows) - len(existing), len(existing)
+
+
+def import_products(fileobj, fmt="csv", batch_size=BATCH_SIZE, progress=None, user=None):
+    """Upsert every valid row of ``fileobj``; returns an ``ImportResult``.
+
+    Invalid rows are skipped and listed in ``result.rejected``. A SKU that
+    appears twice in one batch keeps its last row. A blank ``min_stock``
+    or ``description`` cell only applies its default to new products.
+    ``progress`` is called with the running result after each batch.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    columns, records = read_rows(fileobj, fmt)
+    update_fields = [name for name in UPDATABLE_COLUMNS if name in columns]
+    batch = {}   # sku -> (Product, blank columns)
+    lines = {}   # sku -> line it came from
+
+    def flush():
+        created, updated = _upsert(list(batch.values()), update_fields, user)
+        result.created += created
+        result.updated += updated
+        batch.clear()
+        lines.clear()
+        result.seconds = time.perf_counter() - started
+        if progress:
+            progress(result)
+
+    for line, row in records:
+        result.rows += 1
+        try:
+            product = validate(row)
+        except ValueError as e:
+            result.rejected.append((line, str(row.get("sku", "") or ""), str(e)))
+            continue
+        if product.sku in batch:
+            result.rejected.append((lines[product.sku], product.sku, f"superseded by line {line}"))
+        batch[product.sku] = (product, blank_columns(row))
+        lines[product.sku] = line
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    result.seconds = time.perf_counter() - started
+    if result.created or result.updated:
+        # bulk_create sends no signals
+        dashboard.invalidate()
+        catalog.invalidate()
+    return result
+
+
+def rejection_report(result):
+    """The rejected rows as CSV text (line, sku, error)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["line", "sku", "error"])
+    writer.writerows(result.rejected)
+    return buffer.getvalue()
@@ -0,0 +1,108 @@
+"""Product edits and manual stock movements without read-modify-write.
+
+Edits are optimistic: the form carries the ``Product.version`` it was
+rendered from and the UPDATE only matches that version, so a bill (or
+another admin) that touched the row in between turns the save into a
+conflict instead of being overwritten. Stock movements never need the
+version: they are applied as ``F("stock") +/- n`` in the UPDATE itself.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+
+from . import catalog, dashboard, shards
+from .models import Product, Transaction, normalize_sku
+
+EDITABLE_FIELDS = ["name", "sku", "category", "price", "description", "min_stock"]
+
+
+class StaleProductError(ValueError):
+    """The product changed after the form was loaded; ``current`` holds the fresh row."""
+
+    def __init__(self, current):
+        super().__init__(
+            f"{current.name} was changed by someone else (for example a sale) after you opened it. "
+            "The form now shows the current values; please re-apply your changes."
+        )
+        self.current = current
+
+
+class StockMovementError(ValueError):
+    """A manual movement can't be applied (bad quantity, not enough stock)."""
+
+
+def update_product(product_id, version, values, stock=None, user=None):
+    """Apply an edit made against ``version``; returns the updated product.
+
+    A changed ``stock`` is written in the same conditional UPDATE and
+    recorded in the ledger as a correction. Raises ``StaleProductError``
+    when the row has moved on since ``version``.
+    """
+    values = {name: values[name] for name in EDITABLE_FIELDS if name in values}
+    if "sku" in values:
+        values["sku"] = normalize_sku(values["sku"])
+        if not values["sku"]:
+            del values["sku"]
+
+    with transaction.atomic():
+        if stock is not None:
+            shards.settle([product_id])
+        current = Product.objects.filter(id=product_id, version=version)
+        # Unchanged version means unchanged stock, so this is the stock the editor saw
+        seen = current.values_list("stock", flat=True).first()
+        if stock is not None:
+            values["stock"] = stock
+        if seen is None or not current.update(**values, version=F("version") + 1, updated_at=Now()):
+            raise StaleProductError(Product.objects.get(id=product_id))
+
+        if stock is not None and stock != seen:
+            Transaction.objects.create(
+                product_id=product_id,
+                type="in" if stock > seen else "out",
+                quantity=abs(stock - seen),
+                user=user,
+                remarks=f"Manual correction on product edit: {seen} -> {stock}",
+            )
+        product = Product.objects.get(id=product_id)
+
+    # update() sends no signals; both of these wait for the commit themselves
+    dashboard.invalidate()
+    if values.keys() & set(catalog.SOURCE_FIELDS):
+        catalog.index.product_changed(product.pk, [getattr(product, name) for name in catalog.SOURCE_FIELDS])
+    return product
+
+
+def move_stock(product_id, movement, quantity, user=None, remarks=""):
+    """Record a manual stock in/out; returns the ledger ``Transaction``.
+
+    The stock change is one ``UPDATE ... SET stock = stock +/- n``, guarded
+    by ``stock >= n`` for removals, so it can't lose a concurrent bill.
+    """
+    if movement not in ("in", "out"):
+        raise StockMovementError("Choose Stock In or Stock Out.")
+    if quantity <= 0:
+        raise StockMovementError("Quantity must be at least 1.")
+
+    with transaction.atomic():
+        shards.settle([product_id])
+        if movement == "in":
+            rows = Product.objects.filter(id=product_id)
+            change = F("stock") + quantity
+        else:
+            rows = Product.objects.filter(id=product_id, stock__gte=quantity)
+            change = F("stock") - quantity
+        if not rows.update(stock=change, version=F("version") + 1, updated_at=Now()):
+            if not Product.objects.filter(id=product_id).exists():
+                raise StockMovementError("That product no longer exists.")
+            raise StockMovementError("Not enough stock to remove.")
+
+        history = Transaction.objects.create(
+            product_id=product_id,
+            type=movement,
+            quantity=quantity,
+            remarks=remarks,
+            user=user,
+        )
+    # update() sends no signals; a movement changes nothing the typeahead indexes
+    dashboard.invalidate()
+    return history
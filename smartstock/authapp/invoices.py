@@ -0,0 +1,171 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import InvoiceSequence
+
+# (store, year) -> [[next_number, last_number], ...] committed blocks this process can hand out
+_blocks = {}
+_blocks_lock = threading.Lock()
+# The block a ``batch`` reserved for the bills of the current transaction
+_local = threading.local()
+
+
+class _PendingBlock:
+    """The rest of a block reserved by a transaction that hasn't committed yet.
+
+    Registered with ``on_commit``: once the reservation is durable the
+    unused numbers join this process's committed blocks. Django drops the
+    callback when the transaction rolls back, which is exactly when the
+    reservation itself is undone.
+    """
+
+    def __init__(self, key, first, last):
+        self.key = key
+        self.next = first
+        self.last = last
+
+    def take(self):
+        number = self.next
+        self.next += 1
+        return number
+
+    def __call__(self):
+        if self.next <= self.last:
+            with _blocks_lock:
+                _blocks.setdefault(self.key, []).append([self.next, self.last])
+            # The numbers are the process's now; never hand them out from here again
+            self.next = self.last + 1
+
+
+def _pending(key):
+    """The current ``batch``'s block for ``key`` if it has numbers left."""
+    pending = getattr(_local, "pending", None)
+    if pending is not None and pending.key == key and pending.next <= pending.last:
+        return pending
+    return None
+
+
+def _take_committed(key):
+    with _blocks_lock:
+        ranges = _blocks.get(key)
+        while ranges:
+            block = ranges[0]
+            if block[0] <= block[1]:
+                number = block[0]
+                block[0] += 1
+                return number
+            ranges.pop(0)
+    return None
+
+
+def _bump(store, year, count):
+    """Add ``count`` to the stored sequence; the new last number, or None when the row is missing.
+
+    PostgreSQL and SQLite return the new value from the UPDATE itself, so
+    the common case is a single round trip. Either way the UPDATE comes
+    first, so the row is write-locked before its value is read.
+    """
+    if connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert:
+        table = connection.ops.quote_name(InvoiceSequence._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET last_number = last_number + %s WHERE store = %s AND year = %s "
+                "RETURNING last_number",
+                [count, store, year],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    rows = InvoiceSequence.objects.filter(store=store, year=year)
+    if not rows.update(last_number=F("last_number") + count):
+        return None
+    return rows.values_list("last_number", flat=True).get()
+
+
+def _reserve(store, year, count):
+    """Bump the stored sequence by ``count`` and return the last number reserved."""
+    last = _bump(store, year, count)
+    if last is not None:
+        return last
+    try:
+        with transaction.atomic():
+            InvoiceSequence.objects.create(store=store, year=year, last_number=count)
+        return count
+    except IntegrityError:
+        # Another worker opened the year at the same moment
+        return _bump(store, year, count)
+
+
+def _block_size():
+    return max(1, getattr(settings, "INVOICE_NUMBER_BLOCK_SIZE", 1))
+
+
+@contextmanager
+def batch(count, store=None, year=None):
+    """Reserve numbers for ``count`` bills up front, in the enclosing transaction.
+
+    ``checkout_batch`` bills each entry in its own savepoint. A block
+    reserved inside one of those would be undone by that bill's rollback
+    while later bills kept handing out its numbers, so the chunk reserves
+    its block here, before any per-bill savepoint opens, and
+    ``allocate_invoice_number`` draws from it for the rest of the block.
+    Nothing is reserved with the gap-free block size of 1.
+    """
+    block_size = _block_size()
+    if block_size == 1 or count < 1:
+        yield
+        return
+
+    store = store or getattr(settings, "STORE_CODE", "MAIN")
+    year = year or timezone.localdate().year
+    size = -(-count // block_size) * block_size
+    last = _reserve(store, year, size)
+    pending = _PendingBlock((store, year), last - size + 1, last)
+    transaction.on_commit(pending)
+
+    outer = getattr(_local, "pending", None)
+    _local.pending = pending
+    try:
+        yield
+    finally:
+        _local.pending = outer
+
+
+def allocate_invoice_number(store=None, year=None):
+    """Return (store, year, number) for the next bill.
+
+    Call this inside the bill's transaction. With the default block size of
+    1 the number is taken straight from ``InvoiceSequence`` (one UPDATE)
+    and rolls back with the bill, so the sequence stays gap-free. A larger
+    ``INVOICE_NUMBER_BLOCK_SIZE`` reserves that many numbers at once and
+    serves the rest from memory: first to later bills of the same
+    ``batch`` (a ``checkout_batch`` chunk), then, once it commits, to any
+    bill in this process. Numbers stay unique but a worker that exits
+    leaves the unused part of its blocks as a gap.
+    """
+    store = store or getattr(settings, "STORE_CODE", "MAIN")
+    year = year or timezone.localdate().year
+    block_size = _block_size()
+
+    if block_size == 1:
+        return store, year, _reserve(store, year, 1)
+
+    key = (store, year)
+    number = _take_committed(key)
+    if number is not None:
+        return store, year, number
+
+    pending = _pending(key)
+    if pending is not None:
+        return store, year, pending.take()
+
+    last = _reserve(store, year, block_size)
+    pending = _PendingBlock(key, last - block_size + 1, last)
+    number = pending.take()
+    transaction.on_commit(pending)
+    return store, year, number
@@ -0,0 +1,57 @@
+import csv
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authapp import adjustments, imports
+from authapp.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Post a stock-take: set each SKU's stock to its counted quantity and log the differences."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file with sku and counted columns.")
+        parser.add_argument("--format", choices=sorted(imports.READERS), help="Default: from the file extension.")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the differences; write nothing.")
+        parser.add_argument("--reason", default="", help="Appended to every adjustment's remarks.")
+        parser.add_argument("--user", help="Username recorded on the adjustment transactions.")
+        parser.add_argument("--chunk-size", type=int, default=adjustments.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        user = None
+        if options["user"]:
+            user = CustomUser.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+
+        try:
+            with open(path, "rb") as fileobj:
+                result = adjustments.adjust_stock(
+                    adjustments.read_counts(fileobj, fmt),
+                    user=user,
+                    reason=options["reason"],
+                    dry_run=options["dry_run"],
+                    chunk_size=options["chunk_size"],
+                )
+        except (OSError, imports.ImportFileError) as e:
+            raise CommandError(str(e))
+
+        if options["dry_run"]:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(["sku", "name", "stock", "counted", "delta"])
+            for diff in result.diffs:
+                writer.writerow([diff["sku"], diff["name"], diff["stock"], diff["counted"], diff["delta"]])
+
+        verb = "would be adjusted" if options["dry_run"] else "adjusted"
+        self.stderr.write(self.style.SUCCESS(
+            f"{result.rows} counts in {result.seconds:.1f}s: {result.adjusted} {verb}, "
+            f"{result.unchanged} unchanged, {len(result.rejected)} rejected."
+        ))
+        for line, sku, error in result.rejected[:20]:
+            self.stderr.write(self.style.WARNING(f"  line {line} ({sku or 'no sku'}): {error}"))
+        if len(result.rejected) > 20:
+            self.stderr.write(self.style.WARNING(f"  ... and {len(result.rejected) - 20} more"))
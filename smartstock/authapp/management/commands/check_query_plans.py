@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authapp.query_plans import check_plans
+
+
+class Command(BaseCommand):
+    help = "Call each view, EXPLAIN the queries it sends and fail if any of them needs a full table scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--show-plans", action="store_true", help="Print every query and plan, not just failures.")
+
+    def handle(self, *args, **options):
+        failures = checked = 0
+        for view, description, sql, plan, scanned in check_plans():
+            if sql is None:
+                self.stdout.write(self.style.WARNING(f"- {view}: {description}"))
+                continue
+            checked += 1
+            if scanned:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"✖ {view}: {description} scans {', '.join(scanned)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✔ {view}: {description}"))
+            if scanned or options["show_plans"]:
+                self.stdout.write(f"    {sql}")
+                self.stdout.write(f"    {plan}".replace("\n", "\n    "))
+
+        if failures:
+            raise CommandError(f"{failures} of {checked} queries fall back to a full table scan.")
+        self.stdout.write(self.style.SUCCESS(f"All {checked} queries the views ran use an index."))
@@ -0,0 +1,24 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from authapp import exports
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalogue as CSV, in the format import_products reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--gzip", action="store_true", help="Compress the output on the fly.")
+        parser.add_argument("--output", "-o", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        chunks, _, _ = exports.export_products(compress=options["gzip"])
+        if options["output"]:
+            with open(options["output"], "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from authapp import exports
+
+
+class Command(BaseCommand):
+    help = "Stream the stock ledger (Transactions with product and user fields) as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(exports.FORMATS), default="csv")
+        parser.add_argument("--type", choices=["in", "out"], help="Only stock in or stock out rows.")
+        parser.add_argument("--q", help="Same search as the transactions page.")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output on the fly.")
+        parser.add_argument("--output", "-o", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        chunks, _, _ = exports.export_ledger(
+            options["format"],
+            transaction_type=options["type"],
+            search_query=options["q"],
+            compress=options["gzip"],
+        )
+        if options["output"]:
+            with open(options["output"], "wb") as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authapp import forecast
+
+
+class Command(BaseCommand):
+    help = "Set every product's min_stock to a reorder point forecast from its sales history (needs numpy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weeks", type=int, default=forecast.HISTORY_WEEKS, help="Weeks of history to use.")
+        parser.add_argument("--lead-time-days", type=float, default=forecast.LEAD_TIME_DAYS)
+        parser.add_argument("--service-level", type=float, default=forecast.SERVICE_LEVEL)
+        parser.add_argument("--method", choices=forecast.METHODS, default="ses",
+                            help="ses: exponential smoothing; ma: moving average.")
+        parser.add_argument("--alpha", type=float, default=forecast.ALPHA)
+        parser.add_argument("--ma-weeks", type=int, default=forecast.MA_WEEKS)
+        parser.add_argument("--min-history-weeks", type=int, default=forecast.MIN_HISTORY_WEEKS)
+        parser.add_argument("--dry-run", action="store_true", help="Show the changes without writing them.")
+
+    def handle(self, *args, **options):
+        try:
+            result = forecast.update_min_stock(
+                dry_run=options["dry_run"],
+                weeks=options["weeks"],
+                lead_time_days=options["lead_time_days"],
+                service_level=options["service_level"],
+                method=options["method"],
+                alpha=options["alpha"],
+                ma_weeks=options["ma_weeks"],
+                min_history_weeks=options["min_history_weeks"],
+            )
+        except forecast.ForecastError as e:
+            raise CommandError(str(e))
+
+        verb = "would change" if options["dry_run"] else "changed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.products} product(s) forecast in {result.seconds:.1f}s; min_stock {verb} for {result.changed}."
+        ))
+        for row in result.suggestions[:20]:
+            self.stdout.write(
+                f"  {row['name']}: {row['min_stock']} -> {row['suggested']} "
+                f"(~{row['weekly_demand']} sold per week)"
+            )
+        if len(result.suggestions) > 20:
+            self.stdout.write(f"  ... and {len(result.suggestions) - 20} more")
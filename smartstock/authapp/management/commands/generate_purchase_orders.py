@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from authapp import purchasing
+
+
+class Command(BaseCommand):
+    help = "Raise purchase orders for products at or below their reorder point (run periodically, e.g. nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--history-days", type=int, default=purchasing.HISTORY_DAYS,
+                            help="Only consider supplier requests approved within this many days.")
+        parser.add_argument("--dry-run", action="store_true", help="Show the orders without creating them.")
+
+    def handle(self, *args, **options):
+        result = purchasing.generate_purchase_orders(options["dry_run"], options["history_days"])
+
+        for supplier, lines in sorted(result.by_supplier.items()):
+            self.stdout.write(f"{supplier}: {len(lines)} product(s)")
+            for name, quantity in lines[:10]:
+                self.stdout.write(f"  {name} x {quantity}")
+            if len(lines) > 10:
+                self.stdout.write(f"  ... and {len(lines) - 10} more")
+        if result.no_supplier:
+            self.stdout.write(self.style.WARNING(
+                f"No supplier history for {len(result.no_supplier)} product(s): "
+                + ", ".join(result.no_supplier[:10]) + (" ..." if len(result.no_supplier) > 10 else "")
+            ))
+
+        verb = "would be created" if options["dry_run"] else "created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.created} purchase order(s) {verb} for {len(result.by_supplier)} supplier(s)."
+        ))
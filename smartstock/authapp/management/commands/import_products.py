@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authapp import imports
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or XLSX catalogue, matched on SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or XLSX file with a header row.")
+        parser.add_argument("--format", choices=sorted(imports.READERS), help="Default: from the file extension.")
+        parser.add_argument("--batch-size", type=int, default=imports.BATCH_SIZE)
+        parser.add_argument("--rejects", help="Write rejected rows (line, sku, error) to this CSV file.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+
+        def progress(result):
+            self.stdout.write(f"  {result.rows} rows read, {result.rows_per_second} rows/s")
+
+        try:
+            with open(path, "rb") as fileobj:
+                result = imports.import_products(fileobj, fmt, options["batch_size"], progress)
+        except (OSError, imports.ImportFileError) as e:
+            raise CommandError(str(e))
+
+        if options["rejects"] and result.rejected:
+            with open(options["rejects"], "w", newline="", encoding="utf-8") as out:
+                out.write(imports.rejection_report(result))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.rows} rows in {result.seconds:.1f}s ({result.rows_per_second} rows/s): "
+            f"{result.created} created, {result.updated} updated, {len(result.rejected)} rejected."
+        ))
+        for line, sku, error in result.rejected[:20]:
+            self.stdout.write(self.style.WARNING(f"  line {line} ({sku or 'no sku'}): {error}"))
+        if len(result.rejected) > 20:
+            self.stdout.write(self.style.WARNING(f"  ... and {len(result.rejected) - 20} more"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from authapp.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, help="Override the configured TTL.")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(options["hours"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} expired idempotency key(s)."))
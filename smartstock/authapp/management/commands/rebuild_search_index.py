@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from authapp import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index used by the ledger search in transactions_view."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError(f"No full-text index is available for the {connection.vendor} backend.")
+
+        def progress(done, total):
+            self.stdout.write(f"  indexed up to id {done} of {total}")
+
+        max_id = search.rebuild(options["batch_size"], progress)
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt ({max_id} ids scanned)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from authapp import rollups
+
+
+class Command(BaseCommand):
+    help = "Fold bills newer than the watermark into the daily sales rollups (run periodically, e.g. every 15 minutes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=rollups.BATCH_SIZE)
+        parser.add_argument(
+            "--settle-seconds", type=int, default=rollups.SETTLE_SECONDS,
+            help="Leave bills younger than this for the next run.",
+        )
+        parser.add_argument("--rebuild", action="store_true", help="Drop the rollups and fold every bill again.")
+
+    def handle(self, *args, **options):
+        def progress(result):
+            self.stdout.write(f"  {result.bills} bill(s) folded, up to bill #{result.last_bill_id}")
+
+        run = rollups.rebuild if options["rebuild"] else rollups.refresh
+        result = run(options["batch_size"], options["settle_seconds"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.bills} bill(s) folded into the rollups; watermark at bill #{result.last_bill_id}."
+        ))
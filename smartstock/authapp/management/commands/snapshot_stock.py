@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from authapp.snapshots import take_snapshot
+
+
+class Command(BaseCommand):
+    help = "Record the closing stock of every product (run periodically, e.g. nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        created = take_snapshot(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Snapshot written for {created} product(s)."))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Sum
+
+from authapp import shards
+from authapp.models import Product, normalize_sku
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage sharded stock for hot products: 'fold' (run periodically, e.g. every minute), "
+        "'enable SKU [--shards N]', 'disable SKU' or 'status'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["fold", "enable", "disable", "status"])
+        parser.add_argument("sku", nargs="?", help="Product SKU for enable/disable.")
+        parser.add_argument("--shards", type=int, default=shards.DEFAULT_SHARDS)
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "fold":
+            folded = shards.fold()
+            self.stdout.write(self.style.SUCCESS(f"Folded {folded} sharded product(s)."))
+            return
+        if action == "status":
+            rows = (
+                Product.objects.filter(shards__isnull=False)
+                .annotate(
+                    shard_count=Count("shards"),
+                    sellable=Sum("shards__stock"),
+                    sold=Sum(F("shards__allocated") - F("shards__stock")),
+                )
+                .order_by("id")
+            )
+            for p in rows:
+                self.stdout.write(
+                    f"{p.sku}  {p.name}: {p.shard_count} shards, stock {p.stock - p.sold} "
+                    f"({p.sold} sold since last fold, {p.sellable} sellable)"
+                )
+            return
+
+        if not options["sku"]:
+            raise CommandError(f"'{action}' needs a product SKU.")
+        product = Product.objects.filter(sku=normalize_sku(options["sku"])).first()
+        if product is None:
+            raise CommandError(f"No product with SKU {options['sku']}.")
+
+        if action == "enable":
+            try:
+                shards.enable(product, options["shards"])
+            except shards.ShardError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"{product.name} now sells from {options['shards']} shards."))
+        else:
+            shards.disable(product)
+            self.stdout.write(self.style.SUCCESS(f"{product.name} is back on a single stock counter."))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    """Fill total/item_count for existing bills with one correlated UPDATE."""
+    Bill = apps.get_model('authapp', 'Bill')
+    BillItem = apps.get_model('authapp', 'BillItem')
+
+    items = BillItem.objects.filter(bill=OuterRef('pk')).order_by().values('bill')
+    total = items.annotate(s=Sum(F('quantity') * F('price'))).values('s')
+    count = items.annotate(c=Count('id')).values('c')
+
+    Bill.objects.update(
+        total=Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        item_count=Coalesce(Subquery(count), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0012_supplierrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['-date', '-id'], name='bill_date_id_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def number_existing_bills(apps, schema_editor):
+    """Give existing bills sequential per-year numbers in id order."""
+    Bill = apps.get_model('authapp', 'Bill')
+    InvoiceSequence = apps.get_model('authapp', 'InvoiceSequence')
+    store = getattr(settings, 'STORE_CODE', 'MAIN')
+
+    last = {}
+    batch = []
+    for bill in Bill.objects.order_by('id').only('id', 'date').iterator(chunk_size=2000):
+        year = timezone.localtime(bill.date).year
+        last[year] = last.get(year, 0) + 1
+        bill.store, bill.invoice_year, bill.invoice_seq = store, year, last[year]
+        batch.append(bill)
+        if len(batch) >= 2000:
+            Bill.objects.bulk_update(batch, ['store', 'invoice_year', 'invoice_seq'])
+            batch = []
+    if batch:
+        Bill.objects.bulk_update(batch, ['store', 'invoice_year', 'invoice_seq'])
+
+    InvoiceSequence.objects.bulk_create([
+        InvoiceSequence(store=store, year=year, last_number=number) for year, number in last.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store', models.CharField(max_length=20)),
+                ('year', models.PositiveSmallIntegerField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='invoice_seq',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='invoice_year',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='store',
+            field=models.CharField(default='MAIN', max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='bill',
+            constraint=models.UniqueConstraint(fields=('store', 'invoice_year', 'invoice_seq'), name='bill_invoice_number_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoicesequence',
+            constraint=models.UniqueConstraint(fields=('store', 'year'), name='invoice_sequence_store_year_uniq'),
+        ),
+        migrations.RunPython(number_existing_bills, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0015_invoice_numbers'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['supplier', 'status', '-created_at'], name='po_supplier_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['supplier', '-created_at'], name='po_supplier_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['status', '-created_at'], name='supplier_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplierrequest',
+            index=models.Index(fields=['-created_at'], name='supreq_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplierrequest',
+            index=models.Index(fields=['supplier', '-created_at'], name='supreq_supplier_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-date', '-id'], name='txn_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['product', '-date'], name='txn_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-date'], name='txn_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['type', '-date'], name='txn_type_date_idx'),
+        ),
+    ]
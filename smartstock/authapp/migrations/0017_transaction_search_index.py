@@ -0,0 +1,219 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.db import migrations
+
+# The index DDL is kept here rather than imported from authapp.search so this
+# migration stays as it was when applied. Later migrations that rebuild
+# authapp_product or authapp_transaction on SQLite reuse install() and
+# suspend_triggers() from this module.
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS authapp_transaction_fts USING fts5(
+        product_name, username, remarks,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authapp_transaction_fts_ai AFTER INSERT ON authapp_transaction BEGIN
+        INSERT INTO authapp_transaction_fts (rowid, product_name, username, remarks)
+        VALUES (
+            new.id,
+            (SELECT name FROM authapp_product WHERE id = new.product_id),
+            COALESCE((SELECT username FROM authapp_customuser WHERE id = new.user_id), ''),
+            COALESCE(new.remarks, '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authapp_transaction_fts_au AFTER UPDATE ON authapp_transaction BEGIN
+        DELETE FROM authapp_transaction_fts WHERE rowid = old.id;
+        INSERT INTO authapp_transaction_fts (rowid, product_name, username, remarks)
+        VALUES (
+            new.id,
+            (SELECT name FROM authapp_product WHERE id = new.product_id),
+            COALESCE((SELECT username FROM authapp_customuser WHERE id = new.user_id), ''),
+            COALESCE(new.remarks, '')
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authapp_transaction_fts_ad AFTER DELETE ON authapp_transaction BEGIN
+        DELETE FROM authapp_transaction_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authapp_product_fts_au AFTER UPDATE OF name ON authapp_product BEGIN
+        UPDATE authapp_transaction_fts SET product_name = new.name
+        WHERE rowid IN (SELECT id FROM authapp_transaction WHERE product_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS authapp_customuser_fts_au AFTER UPDATE OF username ON authapp_customuser BEGIN
+        UPDATE authapp_transaction_fts SET username = new.username
+        WHERE rowid IN (SELECT id FROM authapp_transaction WHERE user_id = new.id);
+    END
+    """,
+]
+
+SQLITE_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS authapp_customuser_fts_au",
+    "DROP TRIGGER IF EXISTS authapp_product_fts_au",
+    "DROP TRIGGER IF EXISTS authapp_transaction_fts_ad",
+    "DROP TRIGGER IF EXISTS authapp_transaction_fts_au",
+    "DROP TRIGGER IF EXISTS authapp_transaction_fts_ai",
+]
+
+SQLITE_UNINSTALL = SQLITE_DROP_TRIGGERS + [
+    "DROP TABLE IF EXISTS authapp_transaction_fts",
+]
+
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce((SELECT name FROM authapp_product WHERE id = NEW.product_id), '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce((SELECT username FROM authapp_customuser WHERE id = NEW.user_id), '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.remarks, '')), 'C')
+"""
+
+POSTGRES_INSTALL = [
+    """
+    CREATE TABLE IF NOT EXISTS authapp_transaction_search (
+        transaction_id bigint PRIMARY KEY REFERENCES authapp_transaction (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS authapp_transaction_search_gin ON authapp_transaction_search USING gin (document)",
+    f"""
+    CREATE OR REPLACE FUNCTION authapp_transaction_search_sync() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO authapp_transaction_search (transaction_id, document)
+        VALUES (NEW.id, {POSTGRES_DOCUMENT})
+        ON CONFLICT (transaction_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS authapp_transaction_search_sync ON authapp_transaction",
+    """
+    CREATE TRIGGER authapp_transaction_search_sync
+    AFTER INSERT OR UPDATE ON authapp_transaction
+    FOR EACH ROW EXECUTE FUNCTION authapp_transaction_search_sync()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION authapp_product_search_sync() RETURNS trigger AS $$
+    BEGIN
+        UPDATE authapp_transaction_search s
+        SET document = setweight(to_tsvector('simple', NEW.name), 'A') ||
+            setweight(to_tsvector('simple', coalesce(u.username, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(t.remarks, '')), 'C')
+        FROM authapp_transaction t
+        LEFT JOIN authapp_customuser u ON u.id = t.user_id
+        WHERE t.product_id = NEW.id AND s.transaction_id = t.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS authapp_product_search_sync ON authapp_product",
+    """
+    CREATE TRIGGER authapp_product_search_sync
+    AFTER UPDATE OF name ON authapp_product
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION authapp_product_search_sync()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION authapp_customuser_search_sync() RETURNS trigger AS $$
+    BEGIN
+        UPDATE authapp_transaction_search s
+        SET document = setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') ||
+            setweight(to_tsvector('simple', NEW.username), 'B') ||
+            setweight(to_tsvector('simple', coalesce(t.remarks, '')), 'C')
+        FROM authapp_transaction t
+        JOIN authapp_product p ON p.id = t.product_id
+        WHERE t.user_id = NEW.id AND s.transaction_id = t.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS authapp_customuser_search_sync ON authapp_customuser",
+    """
+    CREATE TRIGGER authapp_customuser_search_sync
+    AFTER UPDATE OF username ON authapp_customuser
+    FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username)
+    EXECUTE FUNCTION authapp_customuser_search_sync()
+    """,
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS authapp_customuser_search_sync ON authapp_customuser",
+    "DROP FUNCTION IF EXISTS authapp_customuser_search_sync()",
+    "DROP TRIGGER IF EXISTS authapp_product_search_sync ON authapp_product",
+    "DROP FUNCTION IF EXISTS authapp_product_search_sync()",
+    "DROP TRIGGER IF EXISTS authapp_transaction_search_sync ON authapp_transaction",
+    "DROP FUNCTION IF EXISTS authapp_transaction_search_sync()",
+    "DROP TABLE IF EXISTS authapp_transaction_search",
+]
+
+SQLITE_FILL = """
+    INSERT INTO authapp_transaction_fts (rowid, product_name, username, remarks)
+    SELECT t.id, p.name, COALESCE(u.username, ''), COALESCE(t.remarks, '')
+    FROM authapp_transaction t
+    JOIN authapp_product p ON p.id = t.product_id
+    LEFT JOIN authapp_customuser u ON u.id = t.user_id
+"""
+
+POSTGRES_FILL = """
+    INSERT INTO authapp_transaction_search (transaction_id, document)
+    SELECT t.id,
+        setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(u.username, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(t.remarks, '')), 'C')
+    FROM authapp_transaction t
+    JOIN authapp_product p ON p.id = t.product_id
+    LEFT JOIN authapp_customuser u ON u.id = t.user_id
+"""
+
+
+def install(schema_editor):
+    """Create the index table and its triggers on the database being migrated."""
+    vendor = schema_editor.connection.vendor
+    for sql in {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def suspend_triggers(schema_editor):
+    """Drop the SQLite triggers (keeping the index) before a migration rebuilds
+    authapp_product or authapp_transaction; SQLite refuses to rename a table
+    while another table's trigger points at a name that is missing. Call
+    ``install`` afterwards to put them back.
+    """
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in SQLITE_DROP_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def create_index(apps, schema_editor):
+    install(schema_editor)
+    fill = {"sqlite": SQLITE_FILL, "postgresql": POSTGRES_FILL}.get(schema_editor.connection.vendor)
+    if fill:
+        schema_editor.execute(fill)
+
+
+def drop_index(apps, schema_editor):
+    uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0016_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0017_transaction_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stock', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='authapp.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-taken_at'], name='snapshot_product_taken_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'taken_at'), name='snapshot_product_taken_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Trigger DDL as of the migration that created the index, not the live app code
+search = import_module('authapp.migrations.0017_transaction_search_index')
+
+
+def suspend_search_triggers(apps, schema_editor):
+    # SQLite rebuilds authapp_product to add the generated column
+    search.suspend_triggers(schema_editor)
+
+
+def restore_search_triggers(apps, schema_editor):
+    search.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0019_cache_table'),
+    ]
+
+    operations = [
+        migrations.RunPython(suspend_search_triggers, restore_search_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='is_low',
+            field=models.GeneratedField(db_persist=True, expression=models.Q(('stock__lte', models.F('min_stock'))), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_low', True)), fields=['id'], name='product_low_stock_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, suspend_search_triggers),
+    ]
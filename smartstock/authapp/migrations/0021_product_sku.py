@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from importlib import import_module
+
+import authapp.models
+from django.db import migrations, models
+
+# Trigger DDL as of the migration that created the index, not the live app code
+search = import_module('authapp.migrations.0017_transaction_search_index')
+
+
+def assign_existing_skus(apps, schema_editor):
+    """Give every existing product a stable placeholder code, SKU-<id>."""
+    Product = apps.get_model('authapp', 'Product')
+    batch = []
+    for product in Product.objects.filter(sku__isnull=True).only('id').iterator(chunk_size=2000):
+        product.sku = f'SKU-{product.pk:06d}'
+        batch.append(product)
+        if len(batch) >= 2000:
+            Product.objects.bulk_update(batch, ['sku'])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['sku'])
+
+
+def suspend_search_triggers(apps, schema_editor):
+    # SQLite rebuilds authapp_product to add the unique constraint
+    search.suspend_triggers(schema_editor)
+
+
+def restore_search_triggers(apps, schema_editor):
+    search.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0020_product_is_low'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(assign_existing_skus, migrations.RunPython.noop),
+        migrations.RunPython(suspend_search_triggers, restore_search_triggers),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(default=authapp.models.generate_sku, max_length=64, unique=True),
+        ),
+        migrations.RunPython(restore_search_triggers, suspend_search_triggers),
+        migrations.AddField(
+            model_name='supplierrequest',
+            name='sku',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
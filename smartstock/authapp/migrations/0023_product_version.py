@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:30
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Trigger DDL as of the migration that created the index, not the live app code
+search = import_module('authapp.migrations.0017_transaction_search_index')
+
+
+def suspend_search_triggers(apps, schema_editor):
+    # SQLite rebuilds authapp_product to add the NOT NULL column
+    search.suspend_triggers(schema_editor)
+
+
+def restore_search_triggers(apps, schema_editor):
+    search.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0022_stockshard'),
+    ]
+
+    operations = [
+        migrations.RunPython(suspend_search_triggers, restore_search_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(restore_search_triggers, suspend_search_triggers),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import re
+from importlib import import_module
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Trigger DDL as of the migration that created the index, not the live app code
+search = import_module('authapp.migrations.0017_transaction_search_index')
+
+SALE_REMARK = re.compile(r"on Bill #(\d+)$")
+SUPPLY_REMARK = re.compile(r"^Supplier '(.*)' supplied (\d+) unit\(s\)\.$")
+BATCH_SIZE = 2000
+
+
+def _supply_match(candidates, row):
+    """Oldest approved request created before the delivery, preferring the same product name."""
+    earlier = [req for req in candidates if req['created_at'] <= row['date']]
+    for req in earlier:
+        if req['product_name'].strip().lower() == (row['product__name'] or '').strip().lower():
+            return req
+    return earlier[0] if earlier else None
+
+
+def link_existing_transactions(apps, schema_editor):
+    """Fill the new links from the remarks checkout and supplier approval have always written.
+
+    Purchase orders never wrote ledger rows, so there is nothing to link for them.
+    Supplier remarks carry no request id; rows that can't be matched stay unlinked.
+    """
+    Transaction = apps.get_model('authapp', 'Transaction')
+    Bill = apps.get_model('authapp', 'Bill')
+    SupplierRequest = apps.get_model('authapp', 'SupplierRequest')
+
+    deliveries = {}
+    for req in (
+        SupplierRequest.objects.filter(status='approved').order_by('created_at', 'id')
+        .values('id', 'supplier__name', 'quantity', 'product_name', 'created_at')
+    ):
+        deliveries.setdefault((req['supplier__name'], req['quantity']), []).append(req)
+
+    last_id = 0
+    while True:
+        rows = list(
+            Transaction.objects.filter(id__gt=last_id).order_by('id')
+            .values('id', 'type', 'remarks', 'date', 'product__name')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        sales = {}
+        supplied = []
+        for row in rows:
+            remarks = row['remarks'] or ''
+            sale = SALE_REMARK.search(remarks) if row['type'] == 'out' else None
+            if sale:
+                sales[row['id']] = int(sale.group(1))
+                continue
+            supply = SUPPLY_REMARK.match(remarks) if row['type'] == 'in' else None
+            if supply:
+                candidates = deliveries.get((supply.group(1), int(supply.group(2))), [])
+                req = _supply_match(candidates, row)
+                if req:
+                    candidates.remove(req)
+                    supplied.append(Transaction(id=row['id'], supplier_request_id=req['id']))
+
+        bills = set(Bill.objects.filter(id__in=set(sales.values())).values_list('id', flat=True))
+        linked = [Transaction(id=tid, bill_id=bid) for tid, bid in sales.items() if bid in bills]
+        Transaction.objects.bulk_update(linked, ['bill'])
+        Transaction.objects.bulk_update(supplied, ['supplier_request'])
+
+
+def suspend_search_triggers(apps, schema_editor):
+    # Unapplying rebuilds authapp_transaction on SQLite to drop the columns
+    search.suspend_triggers(schema_editor)
+
+
+def restore_search_triggers(apps, schema_editor):
+    search.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapp', '0023_product_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(suspend_search_triggers, restore_search_triggers),
+        migrations.AddField(
+            model_name='transaction',
+            name='bill',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='authapp.bill'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='purchase_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='authapp.purchaseorder'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='supplier_request',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='authapp.supplierrequest'),
+        ),
+        migrations.RunPython(restore_search_triggers, suspend_search_triggers),
+        migrations.RunPython(link_existing_transactions, migrations.RunPython.noop),
+    ]
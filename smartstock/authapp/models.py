@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
@@ -16,8 +18,20 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.role})"
     
+def normalize_sku(code):
+    """Scanner input as stored: no whitespace, upper case."""
+    return "".join(str(code or "").split()).upper()
+
+
+def generate_sku():
+    """Placeholder code for products added without a barcode."""
+    return f"SKU-{uuid.uuid4().hex[:10].upper()}"
+
+
 class Product(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
+    # Barcode or stock-keeping code; a scan is one lookup on its unique index
+    sku = models.CharField(max_length=64, unique=True, default=generate_sku)
     category = models.CharField(max_length=50)
     stock = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -25,11 +39,31 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     min_stock = models.PositiveIntegerField(default=5)
+    # Bumped on every write to the row; edits only apply to the version they were made against
+    version = models.PositiveIntegerField(default=1)
+    # Maintained by the database on every write, so bulk updates keep it right too
+    is_low = models.GeneratedField(
+        expression=models.Q(stock__lte=models.F("min_stock")),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["id"], condition=models.Q(is_low=True), name="product_low_stock_idx"),
+        ]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.sku = normalize_sku(self.sku) or generate_sku()
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
+
     def is_low_stock(self):
-        return self.stock < self.min_stock
+        return self.stock <= self.min_stock
     
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
@@ -43,6 +77,22 @@ class Transaction(models.Model):
     date = models.DateTimeField(auto_now_add=True)  # automatically saves timestamp
     remarks = models.TextField(blank=True, null=True)
     user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    # What the movement belongs to, so a bill's or delivery's ledger rows are an indexed join
+    bill = models.ForeignKey("Bill", on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions")
+    supplier_request = models.ForeignKey(
+        "SupplierRequest", on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions"
+    )
+    purchase_order = models.ForeignKey(
+        "PurchaseOrder", on_delete=models.SET_NULL, null=True, blank=True, related_name="transactions"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="txn_date_id_idx"),
+            models.Index(fields=["product", "-date"], name="txn_product_date_idx"),
+            models.Index(fields=["user", "-date"], name="txn_user_date_idx"),
+            models.Index(fields=["type", "-date"], name="txn_type_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.type} - {self.quantity} on {self.date.strftime('%Y-%m-%d')}"
@@ -51,12 +101,48 @@ class Bill(models.Model):
     customer_name = models.CharField(max_length=100)
     date = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Stored at checkout so listings never have to sum BillItems per row
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    # Per-store, per-year invoice sequence handed out by authapp.invoices
+    store = models.CharField(max_length=20, default="MAIN")
+    invoice_year = models.PositiveSmallIntegerField(null=True, blank=True)
+    invoice_seq = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-date", "-id"], name="bill_date_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["store", "invoice_year", "invoice_seq"], name="bill_invoice_number_uniq"),
+        ]
+
+    @property
+    def invoice_number(self):
+        if self.invoice_seq is None:
+            return f"INV-{self.id}"
+        return f"INV-{self.store}-{self.invoice_year}-{self.invoice_seq:06d}"
 
     def total_amount(self):
         return sum(item.total_price() for item in self.items.all())
 
     def __str__(self):
-        return f"Bill #{self.id} - {self.customer_name}"
+        return f"Bill {self.invoice_number} - {self.customer_name}"
+
+
+class InvoiceSequence(models.Model):
+    """Last invoice number handed out for a store in a given year."""
+    store = models.CharField(max_length=20)
+    year = models.PositiveSmallIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "year"], name="invoice_sequence_store_year_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.store}/{self.year}: {self.last_number}"
 
 
 class BillItem(models.Model):
@@ -88,6 +174,11 @@ class Supplier(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-created_at"], name="supplier_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.status})"
     
@@ -103,12 +194,20 @@ class PurchaseOrder(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["supplier", "status", "-created_at"], name="po_supplier_status_idx"),
+            models.Index(fields=["supplier", "-created_at"], name="po_supplier_created_idx"),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.product.name} ({self.quantity})"
 
 class SupplierRequest(models.Model):
     supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name="requests")
     product_name = models.CharField(max_length=150)
+    # Optional barcode; when given, receiving matches the product on it
+    sku = models.CharField(max_length=64, blank=True, default="")
     description = models.TextField(blank=True, null=True)
     price_per_unit = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
@@ -119,7 +218,116 @@ class SupplierRequest(models.Model):
     ], default="pending")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at"], name="supreq_created_idx"),
+            models.Index(fields=["supplier", "-created_at"], name="supreq_supplier_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.product_name} - {self.supplier.name}"
 
 
+
+
+class IdempotencyKey(models.Model):
+    """Result of a write that a client may retry with the same key.
+
+    Rows older than ``IDEMPOTENCY_KEY_TTL_HOURS`` are removed by the
+    ``purge_idempotency_keys`` management command.
+    """
+    scope = models.CharField(max_length=30)
+    key = models.CharField(max_length=100)
+    user = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    result = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "user", "key"], name="idempotency_scope_user_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+class StockSnapshot(models.Model):
+    """Closing stock of a product at a point in time, written by ``snapshot_stock``."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="snapshots")
+    taken_at = models.DateTimeField()
+    stock = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "-taken_at"], name="snapshot_product_taken_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["product", "taken_at"], name="snapshot_product_taken_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.taken_at:%Y-%m-%d %H:%M}: {self.stock}"
+
+
+class StockShard(models.Model):
+    """One slice of a hot product's sellable stock (see ``authapp.shards``).
+
+    ``allocated`` is what the shard was given at the last fold and ``stock``
+    what is left of it, so ``allocated - stock`` units were sold since.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    shard = models.PositiveSmallIntegerField()
+    allocated = models.PositiveIntegerField(default=0)
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "shard"], name="stockshard_product_shard_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.stock}/{self.allocated}"
+
+
+class DailyProductSales(models.Model):
+    """Units, revenue and bills per product per day, maintained by ``refresh_rollups``."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bills = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="daily_product_sales_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.units}"
+
+
+class DailyCategorySales(models.Model):
+    """Units, revenue and bills per product category per day, maintained by ``refresh_rollups``."""
+    day = models.DateField()
+    category = models.CharField(max_length=50)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    bills = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category"], name="daily_category_sales_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.category}: {self.units}"
+
+
+class RollupWatermark(models.Model):
+    """Last bill id folded into a rollup; the next refresh starts after it."""
+    name = models.CharField(max_length=30, unique=True)
+    last_bill_id = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_bill_id}"
@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+
+APPROX_COUNT_TIMEOUT = 300
+
+
+class KeysetPage:
+    """One page of a (date, id) keyset walk, newest first.
+
+    Unlike ``Paginator`` there is no COUNT(*) and no OFFSET: every page is
+    a single range query on the ordering columns, so page N costs the same
+    as page 1. Navigation happens through opaque ``next_cursor`` and
+    ``previous_cursor`` tokens.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_token(payload):
+    """Pack a small dict into an opaque, URL-safe token."""
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Inverse of ``encode_token``; returns None for anything malformed."""
+    if not token:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def encode_cursor(obj, direction, field="date"):
+    return encode_token({"v": getattr(obj, field).isoformat(), "id": obj.pk, "dir": direction})
+
+
+def decode_cursor(token):
+    """Return (value, id, direction) or None for a missing or malformed token."""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    try:
+        direction = payload["dir"]
+        if direction not in ("next", "prev"):
+            return None
+        return datetime.fromisoformat(payload["v"]), int(payload["id"]), direction
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def keyset_paginate(queryset, cursor=None, per_page=10, field="date"):
+    """Slice ``queryset`` into a ``KeysetPage`` ordered by (-field, -id).
+
+    ``cursor`` is a token previously handed out by this function; anything
+    it cannot decode falls back to the first page.
+    """
+    position = decode_cursor(cursor)
+
+    if position is None:
+        rows = list(queryset.order_by(f"-{field}", "-id")[:per_page + 1])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1], "next", field) if more else None,
+        )
+
+    value, pk, direction = position
+    if direction == "next":
+        rows = list(
+            queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "id__lt": pk}))
+            .order_by(f"-{field}", "-id")[:per_page + 1]
+        )
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1], "next", field) if more and rows else None,
+            previous_cursor=encode_cursor(rows[0], "prev", field) if rows else None,
+        )
+
+    # Walking backwards: read ascending from the cursor, then flip the rows.
+    rows = list(
+        queryset.filter(Q(**{f"{field}__gt": value}) | Q(**{field: value, "id__gt": pk}))
+        .order_by(field, "id")[:per_page + 1]
+    )
+    more = len(rows) > per_page
+    rows = rows[:per_page][::-1]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], "next", field) if rows else None,
+        previous_cursor=encode_cursor(rows[0], "prev", field) if more and rows else None,
+    )
+
+
+def approximate_count(queryset, timeout=APPROX_COUNT_TIMEOUT):
+    """Total rows for ``queryset``, cached for ``timeout`` seconds.
+
+    Meant for a "≈ N results" hint next to keyset navigation. On PostgreSQL
+    an unfiltered table is answered from the planner's row estimate instead
+    of a COUNT(*).
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = "approx-count:" + hashlib.md5(f"{sql}|{params}".encode()).hexdigest()
+    total = cache.get(key)
+    if total is not None:
+        return total
+
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analysed
+        total = row[0] if row and row[0] >= 0 else queryset.count()
+    else:
+        total = queryset.count()
+
+    cache.set(key, total, timeout)
+    return total
@@ -0,0 +1,104 @@
+"""Purchase orders raised automatically for products at or below their reorder point.
+
+``generate_purchase_orders`` finds the low products in one query, skips any
+with an order still open, picks each product's supplier from approved
+request history (lowest recent unit price) and writes every order with one
+``bulk_create``, grouped by supplier.
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import shards
+from .models import PurchaseOrder, SupplierRequest, Transaction
+
+OPEN_STATUSES = ("pending", "dispatched")
+HISTORY_DAYS = 365
+# Orders top stock up to this multiple of the reorder point
+ORDER_UP_TO = 2
+
+
+@dataclass
+class OrderResult:
+    created: int = 0
+    by_supplier: dict = field(default_factory=dict)   # supplier name -> [(product name, quantity)]
+    no_supplier: list = field(default_factory=list)   # product names with no usable supplier history
+
+
+def low_products():
+    """Products at or below ``min_stock`` (exact for sharded ones) with no open order."""
+    open_order = PurchaseOrder.objects.filter(product=OuterRef("pk"), status__in=OPEN_STATUSES)
+    return shards.low_stock().exclude(Exists(open_order)).order_by("id")
+
+
+def supplier_offers(since):
+    """Approved requests from approved suppliers since ``since``, cheapest (then newest) first."""
+    return SupplierRequest.objects.filter(
+        status="approved", supplier__status="approved", created_at__gte=since
+    ).order_by("price_per_unit", "-created_at")
+
+
+def _cheapest_supplier(products, offers):
+    """{product id: (supplier id, supplier name)} from the cheapest offer matching each product.
+
+    An offer matches a product through the ledger rows its delivery
+    created, on SKU, or on product name; the cheapest match wins.
+    """
+    delivered = dict(
+        Transaction.objects.filter(supplier_request__in=offers).values_list("supplier_request_id", "product_id")
+    )
+    offers = offers.values("id", "supplier_id", "supplier__name", "sku", "product_name")
+    by_product, by_sku, by_name = {}, {}, {}
+    for rank, offer in enumerate(offers):  # cheapest (then newest) first, so setdefault keeps the best
+        best = (rank, offer["supplier_id"], offer["supplier__name"])
+        if offer["id"] in delivered:
+            by_product.setdefault(delivered[offer["id"]], best)
+        if offer["sku"]:
+            by_sku.setdefault(offer["sku"], best)
+        by_name.setdefault(offer["product_name"].strip().lower(), best)
+
+    chosen = {}
+    for product in products:
+        matches = [
+            match for match in (
+                by_product.get(product.id), by_sku.get(product.sku), by_name.get(product.name.strip().lower())
+            ) if match
+        ]
+        if matches:
+            _, supplier_id, supplier_name = min(matches)
+            chosen[product.id] = (supplier_id, supplier_name)
+    return chosen
+
+
+def generate_purchase_orders(dry_run=False, history_days=HISTORY_DAYS):
+    """Raise one pending order per low product; returns an ``OrderResult``."""
+    result = OrderResult()
+    with transaction.atomic():
+        products = low_products()
+        if not dry_run:
+            # Two overlapping runs must not both order the same product
+            products = products.select_for_update(of=("self",))
+        products = list(products)
+        if not products:
+            return result
+
+        suppliers = _cheapest_supplier(products, supplier_offers(timezone.now() - timedelta(days=history_days)))
+        orders = []
+        for product in products:
+            if product.id not in suppliers:
+                result.no_supplier.append(product.name)
+                continue
+            supplier_id, supplier_name = suppliers[product.id]
+            quantity = max(ORDER_UP_TO * product.min_stock - product.exact, 1)
+            orders.append(PurchaseOrder(supplier_id=supplier_id, product=product, quantity=quantity))
+            result.by_supplier.setdefault(supplier_name, []).append((product.name, quantity))
+
+        # Consolidated per supplier: each supplier's orders are consecutive rows
+        orders.sort(key=lambda order: (order.supplier_id, order.product_id))
+        if not dry_run:
+            PurchaseOrder.objects.bulk_create(orders)
+        result.created = len(orders)
+    return result
@@ -0,0 +1,247 @@
+"""EXPLAIN the SQL the views really send.
+
+Each entry in ``VIEW_CALLS`` is a GET to one view, made with
+``RequestFactory`` as a real user of the view's role, with sample ids,
+filters and cursors taken from the database. The SELECTs it issues are
+captured with ``CaptureQueriesContext`` (everything runs in a transaction
+that is rolled back, against an empty private cache so cached blocks are
+rebuilt) and each distinct statement is EXPLAINed.
+"""
+import re
+from dataclasses import dataclass
+
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+
+from . import catalog
+from .models import Bill, CustomUser, Product, Transaction
+from .pagination import encode_cursor
+
+# SQLite reports "SCAN <table>" for a full scan, "SCAN <table> USING INDEX"
+# when it walks an index in order and "SCAN <fts table> VIRTUAL TABLE" for a
+# full-text match; PostgreSQL reports "Seq Scan on <table>".
+SQLITE_FULL_SCAN = re.compile(r"\bSCAN (\w+)(?!\s+(?:USING|VIRTUAL TABLE))(?:\s|$)")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+# SQLite plans an in-order walk of the integer primary key as a bare
+# "SCAN <table>"; with a LIMIT and no temp B-tree it stops after the page.
+SQLITE_ROWID_PAGE = re.compile(r'ORDER BY "(\w+)"\."id"(?: ASC| DESC)? LIMIT \d+(?: OFFSET \d+)?$')
+# Subqueries name their tables U0, U1, ...: "authapp_product" U0
+TABLE_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+FROM_TABLE = re.compile(r'\bFROM "?(\w+)')
+
+# The check reads and writes only this cache, never the site's own
+PLAN_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "query-plans"},
+}
+
+
+@dataclass
+class ViewCall:
+    view: str                  # URL name
+    description: str
+    role: str                  # the view runs as the first active user with this role
+    args: tuple = ()           # names of sample values for the URL arguments
+    params: tuple = ()         # (GET parameter, sample name or literal) pairs
+    # (table, SQL fragment) pairs: a statement containing the fragment may read
+    # the table in full; an empty fragment covers every statement of the view
+    full_scans: tuple = ()
+    prepare: object = None     # called before the request is captured
+
+
+VIEW_CALLS = [
+    ViewCall("transactions", "latest ledger rows", "admin"),
+    ViewCall("transactions", "ledger, next page", "admin", params=(("cursor", "ledger_cursor"),)),
+    ViewCall("transactions", "ledger filtered by type", "admin", params=(("type", "=out"),)),
+    ViewCall("transactions", "ledger filtered by type, next page", "admin",
+             params=(("type", "=out"), ("cursor", "ledger_out_cursor"))),
+    ViewCall("transactions", "ledger search", "admin", params=(("q", "search_term"),)),
+    ViewCall("transactions", "ledger search filtered by type", "admin",
+             params=(("q", "search_term"), ("type", "=out"))),
+    ViewCall("transactions", "approximate ledger total", "admin", params=(("count", "=1"),)),
+    ViewCall("stock_history", "product ledger", "admin", args=("product",)),
+    ViewCall("stock_history", "product ledger, next page", "admin", args=("product",),
+             params=(("cursor", "product_cursor"),)),
+    # The counters are whole-table totals (stock summed over every product,
+    # active users counted); they're built once per write into the cached
+    # summary, never per request. The product table itself is paged.
+    ViewCall("admin_dashboard", "dashboard summary", "admin",
+             full_scans=(("authapp_product", '"total_stock"'), ("authapp_customuser", '"active_users"'))),
+    # Top-N stock levels and the "Others" remainder are aggregates over the
+    # whole catalogue; the ETag on the dashboard version means they are only
+    # recomputed after stock changes.
+    ViewCall("api_stock_chart", "stock chart series", "admin", full_scans=(("authapp_product", ""),)),
+    # The staff dashboard's total stock is a sum over every product.
+    ViewCall("staff_dashboard", "staff dashboard", "staff",
+             full_scans=(("authapp_product", '"total"'),)),
+    ViewCall("new_bill", "billing screen", "staff"),
+    ViewCall("bill_list", "newest bills", "staff"),
+    ViewCall("bill_list", "bills, next page", "staff", params=(("cursor", "bill_cursor"),)),
+    ViewCall("bill_detail", "bill with items and ledger rows", "staff", args=("bill",)),
+    ViewCall("api_low_stock", "low stock products", "staff"),
+    ViewCall("api_low_stock", "low stock products, next page", "staff", params=(("after", "low_after"),)),
+    ViewCall("api_product_lookup", "typeahead", "staff", params=(("q", "product_prefix"),),
+             prepare=catalog.index.rebuild),
+    ViewCall("api_product_scan", "barcode scan", "staff", args=("sku",)),
+    ViewCall("admin_supplier_requests", "supplier requests, newest first", "admin"),
+    ViewCall("supplier_dashboard", "supplier dashboard", "supplier"),
+    ViewCall("supplier_orders", "supplier's orders", "supplier"),
+    ViewCall("supplier_requests", "supplier's requests", "supplier"),
+    ViewCall("sales_report", "sales by category", "admin"),
+    ViewCall("sales_report", "sales by product", "admin", params=(("group", "=product"),)),
+]
+
+
+def _samples():
+    """Ids, cursors and search terms for the calls, from the newest rows in the database."""
+    samples = {}
+    product = Product.objects.order_by("id").first()
+    if product:
+        samples["product"] = product.id
+        samples["sku"] = product.sku
+        samples["product_prefix"] = product.name[:3]
+        newest = product.transactions.order_by("-date", "-id").first()
+        if newest:
+            samples["product_cursor"] = encode_cursor(newest, "next")
+    newest = Transaction.objects.select_related("product").order_by("-date", "-id").first()
+    if newest:
+        samples["ledger_cursor"] = encode_cursor(newest, "next")
+        samples["search_term"] = newest.product.name.split()[0] if newest.product.name.split() else "stock"
+    newest = Transaction.objects.filter(type="out").order_by("-date", "-id").first()
+    if newest:
+        samples["ledger_out_cursor"] = encode_cursor(newest, "next")
+    bill = Bill.objects.order_by("-date", "-id").first()
+    if bill:
+        samples["bill"] = bill.id
+        samples["bill_cursor"] = encode_cursor(bill, "next")
+    low = Product.objects.filter(is_low=True).order_by("id").values_list("id", flat=True).first()
+    if low is not None:
+        samples["low_after"] = low
+    return samples
+
+
+def _users():
+    users = {}
+    for role in ("admin", "staff"):
+        users[role] = CustomUser.objects.filter(role=role, is_active=True).order_by("id").first()
+    users["supplier"] = (
+        CustomUser.objects.filter(role="supplier", is_active=True, supplier_profile__isnull=False)
+        .order_by("id").first()
+    )
+    return users
+
+
+def _request(call, user, samples):
+    """The GET for ``call``, or a reason it can't be made."""
+    if user is None:
+        return None, f"no active {call.role} user to run it as"
+    missing = [name for name in call.args if name not in samples]
+    params = {}
+    for name, value in call.params:
+        if value.startswith("="):
+            params[name] = value[1:]
+        elif value in samples:
+            params[name] = samples[value]
+        else:
+            missing.append(value)
+    if missing:
+        return None, f"no sample rows for {', '.join(missing)}"
+
+    request = RequestFactory().get(reverse(call.view, args=[samples[name] for name in call.args]), params)
+    request.user = user
+    request.session = SessionBase()
+    request._messages = FallbackStorage(request)
+    return request, None
+
+
+def capture_queries(request):
+    """The distinct SELECT statements the view behind ``request`` runs, in order."""
+    match = resolve(request.path_info)
+    with CaptureQueriesContext(connection) as captured:
+        try:
+            response = match.func(request, *match.args, **match.kwargs)
+            if getattr(response, "streaming", False):
+                for _ in response.streaming_content:
+                    pass
+        except Http404:
+            pass
+    statements = []
+    for query in captured.captured_queries:
+        sql = query["sql"]
+        if sql.lstrip().upper().startswith("SELECT") and sql not in statements:
+            statements.append(sql)
+    return statements
+
+
+def explain(sql):
+    """Return the database's plan for the statement ``sql`` as text.
+
+    On PostgreSQL sequential scans are disabled for the duration, so a tiny
+    development table does not make the planner pick a scan that it would
+    never choose at production size; a Seq Scan then means no index fits.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        return "\n".join(row[-1] for row in cursor.fetchall())
+
+
+def full_scans(plan, sql=""):
+    """Return the tables a plan reads in full, one tuple of candidates per scan.
+
+    A subquery alias such as U0 is resolved through ``sql``; SQLite reuses
+    the alias across sibling subqueries, so it can stand for several tables.
+    """
+    pattern = POSTGRES_FULL_SCAN if connection.vendor == "postgresql" else SQLITE_FULL_SCAN
+    aliases = {}
+    for table, alias in TABLE_ALIAS.findall(sql):
+        aliases.setdefault(alias, set()).add(table)
+    paged = set()
+    if connection.vendor == "sqlite" and "USE TEMP B-TREE FOR ORDER BY" not in plan:
+        paged = set(SQLITE_ROWID_PAGE.findall(sql.strip()))
+    return sorted({
+        tuple(sorted(aliases.get(name, {name}))) for name in pattern.findall(plan) if name not in paged
+    })
+
+
+def _table(sql):
+    found = FROM_TABLE.search(sql)
+    return found.group(1) if found else "?"
+
+
+def check_plans(calls=None):
+    """Yield (view, description, sql, plan, unexpected full scans) for every query the calls run.
+
+    A call that can't be made (no user of its role, no sample rows) yields
+    once with ``sql`` and ``plan`` set to None and the reason appended to
+    the description.
+    """
+    results = []
+    with override_settings(CACHES=PLAN_CACHES), transaction.atomic():
+        from django.core.cache import cache
+        cache.clear()
+        samples, users = _samples(), _users()
+        for call in calls or VIEW_CALLS:
+            request, reason = _request(call, users[call.role], samples)
+            if request is None:
+                results.append((call.view, f"{call.description}: skipped, {reason}", None, None, []))
+                continue
+            if call.prepare:
+                call.prepare()
+            for sql in capture_queries(request):
+                plan = explain(sql)
+                allowed = {table for table, fragment in call.full_scans if fragment in sql}
+                scanned = [
+                    " or ".join(tables) for tables in full_scans(plan, sql) if not set(tables) & allowed
+                ]
+                results.append((call.view, f"{call.description} ({_table(sql)})", sql, plan, scanned))
+        # Nothing a view did while being checked is kept
+        transaction.set_rollback(True)
+    yield from results
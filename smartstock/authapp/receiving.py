@@ -0,0 +1,172 @@
+"""Receiving supplier deliveries against purchase orders.
+
+A delivery note lists the orders (and quantities) that arrived. ``receive``
+validates every line and every order's status transition first; then, in
+one transaction, it marks the orders delivered, adds the quantities to
+stock with one ``UPDATE ... SET stock = stock + CASE ...`` and writes the
+in-Transactions with one bulk insert. Nothing is posted unless every line
+is valid, so a rejected note can be fixed and sent again as a whole.
+"""
+from dataclasses import dataclass
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from . import dashboard, idempotency, shards
+from .models import Product, PurchaseOrder, Transaction
+
+# Allowed PurchaseOrder status changes; "delivered" is final
+TRANSITIONS = {
+    "pending": ("dispatched", "delivered"),
+    "dispatched": ("delivered",),
+    "delivered": (),
+}
+
+
+class ReceivingError(ValueError):
+    """The delivery note can't be posted; ``errors`` is [(index, order_id, message)]."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} line(s) of the delivery note can't be posted.")
+        self.errors = errors
+
+
+@dataclass
+class ReceivingResult:
+    orders: int = 0
+    units: int = 0
+    products: int = 0
+    replayed: bool = False
+
+
+def can_transition(current, new):
+    return new in TRANSITIONS.get(current, ())
+
+
+def _positive_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError
+    number = int(value)
+    if number <= 0:
+        raise ValueError
+    return number
+
+
+def parse_lines(lines):
+    """[(index, order_id, quantity or None)] from [{"order_id": ..., "quantity": ...}]; raises ReceivingError."""
+    parsed, errors, seen = [], [], set()
+    for index, line in enumerate(lines):
+        if not isinstance(line, dict):
+            errors.append((index, None, "each line must be an object"))
+            continue
+        try:
+            order_id = _positive_int(line.get("order_id"))
+        except (TypeError, ValueError):
+            errors.append((index, line.get("order_id"), "order_id must be a positive integer"))
+            continue
+        quantity = line.get("quantity")
+        if quantity is not None:
+            try:
+                quantity = _positive_int(quantity)
+            except (TypeError, ValueError):
+                errors.append((index, order_id, "quantity must be a positive integer"))
+                continue
+        if order_id in seen:
+            errors.append((index, order_id, "order is listed twice on this note"))
+            continue
+        seen.add(order_id)
+        parsed.append((index, order_id, quantity))
+    if errors:
+        raise ReceivingError(errors)
+    return parsed
+
+
+def _post(parsed, user, note):
+    orders = {
+        order.id: order
+        for order in PurchaseOrder.objects.select_for_update(of=("self",)).select_related("supplier")
+        .filter(id__in=[order_id for _, order_id, _ in parsed]).order_by("id")
+    }
+
+    errors, received = [], []
+    for index, order_id, quantity in parsed:
+        order = orders.get(order_id)
+        if order is None:
+            errors.append((index, order_id, "no such purchase order"))
+        elif not can_transition(order.status, "delivered"):
+            errors.append((index, order_id, f"order is already {order.status}"))
+        elif quantity is not None and quantity > order.quantity:
+            errors.append((index, order_id, f"received {quantity} but only {order.quantity} were ordered"))
+        else:
+            received.append((order, quantity or order.quantity))
+    if errors:
+        raise ReceivingError(errors)
+
+    per_product = {}
+    for order, quantity in received:
+        per_product[order.product_id] = per_product.get(order.product_id, 0) + quantity
+
+    # Sharded products: fold unsold shard stock back so the increment lands on the exact total
+    shards.settle(list(per_product))
+    Product.objects.filter(id__in=list(per_product)).update(
+        stock=F("stock") + Case(
+            *[When(id=pid, then=Value(units)) for pid, units in per_product.items()],
+            output_field=IntegerField(),
+        ),
+        version=F("version") + 1,
+        updated_at=Now(),
+    )
+    PurchaseOrder.objects.filter(id__in=[order.id for order, _ in received]).update(status="delivered")
+
+    prefix = f"Delivery {note}: " if note else "Delivery: "
+    Transaction.objects.bulk_create([
+        Transaction(
+            product_id=order.product_id,
+            type="in",
+            quantity=quantity,
+            user=user,
+            purchase_order=order,
+            remarks=(
+                f"{prefix}order #{order.id} from {order.supplier.name}"
+                + (f" ({quantity} of {order.quantity})" if quantity != order.quantity else "")
+            ),
+        )
+        for order, quantity in received
+    ])
+    return ReceivingResult(
+        orders=len(received), units=sum(per_product.values()), products=len(per_product)
+    )
+
+
+def receive(lines, user=None, note="", idempotency_key=None):
+    """Post a delivery note; returns a ``ReceivingResult`` or raises ``ReceivingError``.
+
+    A line without a quantity receives the full order; a smaller quantity
+    records a short delivery and still closes the order.
+    """
+    previous = idempotency.replayed("receiving", idempotency_key, user)
+    if previous is not None:
+        return ReceivingResult(**previous, replayed=True)
+
+    parsed = parse_lines(lines)
+    if not parsed:
+        raise ReceivingError([(None, None, "the delivery note has no lines")])
+
+    try:
+        with transaction.atomic():
+            result = _post(parsed, user, note)
+            if idempotency_key:
+                idempotency.record("receiving", idempotency_key, user, {
+                    "orders": result.orders, "units": result.units, "products": result.products,
+                })
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        previous = idempotency.replayed("receiving", idempotency_key, user)
+        if previous is None:
+            raise
+        return ReceivingResult(**previous, replayed=True)
+
+    # update() and bulk_create send no signals
+    dashboard.invalidate()
+    return result
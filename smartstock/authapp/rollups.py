@@ -0,0 +1,155 @@
+"""Daily sales rollups per product and per category.
+
+``refresh`` folds bills newer than the stored watermark into
+``DailyProductSales`` and ``DailyCategorySales`` a batch at a time. Each
+batch commits together with its watermark advance, so an interrupted run
+resumes where it stopped and no bill is ever counted twice. Reports read
+only the rollup tables, so their cost grows with days x products, not with
+the number of bill items.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Bill, BillItem, DailyCategorySales, DailyProductSales, RollupWatermark
+
+WATERMARK = "daily_sales"
+BATCH_SIZE = 5000
+# Bill ids are handed out before the checkout transaction commits, so a new
+# id can still be followed by a lower one becoming visible; leave the
+# newest bills for the next run.
+SETTLE_SECONDS = 300
+REPORT_TOP = 20
+
+TOTALS = {
+    "units": Sum("quantity"),
+    "revenue": Sum(F("quantity") * F("price"), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    "bills": Count("bill", distinct=True),
+}
+COUNTERS = ["units", "revenue", "bills"]
+
+
+@dataclass
+class RefreshResult:
+    bills: int = 0
+    last_bill_id: int = 0
+
+
+def _increments(items, key):
+    """{(day, key value): {units, revenue, bills}} for a range of bill items."""
+    rows = (
+        items.annotate(day=TruncDate("bill__date")).order_by()
+        .values("day", key).annotate(**TOTALS)
+    )
+    return {(row["day"], row[key]): row for row in rows}
+
+
+def _merge(model, key, increments):
+    """Add ``increments`` to the rollup rows, creating the ones that don't exist yet."""
+    if not increments:
+        return
+    days = {day for day, _ in increments}
+    values = {value for _, value in increments}
+    existing = {
+        (row.day, getattr(row, key)): row
+        for row in model.objects.filter(day__in=days, **{f"{key}__in": values})
+    }
+    changed, new = [], []
+    for (day, value), totals in increments.items():
+        row = existing.get((day, value))
+        if row is None:
+            new.append(model(day=day, **{key: value}, **{name: totals[name] for name in COUNTERS}))
+            continue
+        for name in COUNTERS:
+            setattr(row, name, getattr(row, name) + totals[name])
+        changed.append(row)
+    model.objects.bulk_update(changed, COUNTERS)
+    model.objects.bulk_create(new)
+
+
+def _settled_upto(last_bill_id, cutoff, batch_size):
+    """Highest bill id of the next batch, stopping before the first bill newer than ``cutoff``."""
+    upto = None
+    for pk, date in (
+        Bill.objects.filter(id__gt=last_bill_id).order_by("id").values_list("id", "date")[:batch_size]
+    ):
+        if date >= cutoff:
+            break
+        upto = pk
+    return upto
+
+
+def refresh(batch_size=BATCH_SIZE, settle_seconds=SETTLE_SECONDS, progress=None):
+    """Fold every settled bill after the watermark into the rollups; returns a ``RefreshResult``."""
+    result = RefreshResult()
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    while True:
+        with transaction.atomic():
+            mark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+            result.last_bill_id = mark.last_bill_id
+            upto = _settled_upto(mark.last_bill_id, cutoff, batch_size)
+            if upto is None:
+                return result
+
+            bills = Bill.objects.filter(id__gt=mark.last_bill_id, id__lte=upto)
+            items = BillItem.objects.filter(bill_id__gt=mark.last_bill_id, bill_id__lte=upto)
+            _merge(DailyProductSales, "product_id", _increments(items, "product_id"))
+            _merge(DailyCategorySales, "category", _increments(items, "product__category"))
+
+            result.bills += bills.count()
+            mark.last_bill_id = result.last_bill_id = upto
+            mark.save()
+        if progress:
+            progress(result)
+
+
+def rebuild(batch_size=BATCH_SIZE, settle_seconds=SETTLE_SECONDS, progress=None):
+    """Drop the rollups and fold every bill again from the start."""
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+    return refresh(batch_size, settle_seconds, progress)
+
+
+def last_refreshed():
+    return RollupWatermark.objects.filter(name=WATERMARK).aggregate(at=Max("updated_at"))["at"]
+
+
+def sales_report(start, end, group="category", top=REPORT_TOP):
+    """Sales for the days ``start``..``end`` (inclusive), read from the rollups only.
+
+    Returns {"days": [{day, units, revenue}], "groups": [{label, units,
+    revenue, bills}], "units", "revenue"}. ``groups`` is the top N
+    categories or products by revenue. ``bills`` counts the bills the group
+    appeared on, so it is not summed across groups.
+    """
+    per_day = (
+        DailyCategorySales.objects.filter(day__range=(start, end)).order_by("day")
+        .values("day").annotate(units=Sum("units"), revenue=Sum("revenue"))
+    )
+    if group == "product":
+        groups = (
+            DailyProductSales.objects.filter(day__range=(start, end)).order_by()
+            .values("product").annotate(
+                label=F("product__name"), units=Sum("units"), revenue=Sum("revenue"), bills=Sum("bills")
+            )
+        )
+    else:
+        groups = (
+            DailyCategorySales.objects.filter(day__range=(start, end)).order_by()
+            .values("category").annotate(
+                label=F("category"), units=Sum("units"), revenue=Sum("revenue"), bills=Sum("bills")
+            )
+        )
+    days = list(per_day)
+    return {
+        "days": days,
+        "groups": list(groups.order_by("-revenue", "label")[:top]),
+        "units": sum(row["units"] for row in days),
+        "revenue": sum(row["revenue"] for row in days),
+    }
@@ -0,0 +1,200 @@
+"""Full-text index over the stock ledger.
+
+Each Transaction is indexed by product name, username and remarks in a side
+table kept current by database triggers, so every write path (including
+``bulk_create``, which sends no signals) stays in sync:
+
+* SQLite: an FTS5 virtual table ``authapp_transaction_fts`` keyed by rowid.
+* PostgreSQL: ``authapp_transaction_search`` holding a ``tsvector`` with a
+  GIN index.
+
+The table and triggers are created by migration 0017; ``rebuild`` refills
+the index from the ledger. Other backends have no index: ``ranked_page``
+returns None and ``filter_queryset`` falls back to plain ``icontains``
+filtering.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .pagination import KeysetPage, decode_token, encode_token
+
+SQLITE_REBUILD = [
+    "DELETE FROM authapp_transaction_fts",
+    """
+    INSERT INTO authapp_transaction_fts (rowid, product_name, username, remarks)
+    SELECT t.id, p.name, COALESCE(u.username, ''), COALESCE(t.remarks, '')
+    FROM authapp_transaction t
+    JOIN authapp_product p ON p.id = t.product_id
+    LEFT JOIN authapp_customuser u ON u.id = t.user_id
+    WHERE t.id > %s AND t.id <= %s
+    """,
+]
+
+POSTGRES_REBUILD = [
+    "TRUNCATE authapp_transaction_search",
+    """
+    INSERT INTO authapp_transaction_search (transaction_id, document)
+    SELECT t.id,
+        setweight(to_tsvector('simple', coalesce(p.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(u.username, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(t.remarks, '')), 'C')
+    FROM authapp_transaction t
+    JOIN authapp_product p ON p.id = t.product_id
+    LEFT JOIN authapp_customuser u ON u.id = t.user_id
+    WHERE t.id > %s AND t.id <= %s
+    """,
+]
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor in ("sqlite", "postgresql")
+
+
+def rebuild(batch_size=50000, progress=None):
+    """Re-index every Transaction in id-range batches; returns the highest id indexed."""
+    if not is_supported():
+        return 0
+    clear, fill = SQLITE_REBUILD if connection.vendor == "sqlite" else POSTGRES_REBUILD
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(clear)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM authapp_transaction")
+        max_id = cursor.fetchone()[0]
+        for start in range(0, max_id, batch_size):
+            cursor.execute(fill, [start, start + batch_size])
+            if progress:
+                progress(min(start + batch_size, max_id), max_id)
+    return max_id
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _ranked_rows(query, transaction_type, limit, after=None, backwards=False):
+    """[(id, score)] for the best matches, ordered by (score, -id).
+
+    ``score`` is lower for better matches on both backends (FTS5's bm25
+    rank, PostgreSQL's negated ``ts_rank``), so one keyset condition on
+    (score, id) walks either index. ``after`` is the (score, id) of the row
+    the page starts past; ``backwards`` reads the other way from it.
+    """
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == "sqlite":
+        # Each term as a quoted prefix query: "sug"* "ric"*
+        score = "f.rank"
+        source = "authapp_transaction_fts f JOIN authapp_transaction t ON t.id = f.rowid"
+        where = "authapp_transaction_fts MATCH %s"
+        params = [" ".join(f'"{term}"*' for term in terms)]
+    else:
+        score = "-ts_rank(s.document, q)"
+        source = (
+            "authapp_transaction_search s JOIN authapp_transaction t ON t.id = s.transaction_id, "
+            "to_tsquery('simple', %s) q"
+        )
+        where = "s.document @@ q"
+        params = [" & ".join(f"{term}:*" for term in terms)]
+
+    if transaction_type:
+        where += " AND t.type = %s"
+        params.append(transaction_type)
+    if after is not None:
+        past, id_past = (">", "<") if not backwards else ("<", ">")
+        where += f" AND ({score} {past} %s OR ({score} = %s AND t.id {id_past} %s))"
+        params += [after[0], after[0], after[1]]
+    order = f"{score}, t.id DESC" if not backwards else f"{score} DESC, t.id"
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT t.id, {score} FROM {source} WHERE {where} ORDER BY {order} LIMIT %s", [*params, limit])
+        return cursor.fetchall()
+
+
+def filter_queryset(queryset, query):
+    """Restrict a Transaction queryset to rows matching ``query`` (unranked).
+
+    Uses the full-text index where there is one and the original
+    ``icontains`` lookups otherwise.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        return queryset.filter(id__in=RawSQL(
+            "SELECT rowid FROM authapp_transaction_fts WHERE authapp_transaction_fts MATCH %s", [match]
+        ))
+    if connection.vendor == "postgresql":
+        match = " & ".join(f"{term}:*" for term in terms)
+        return queryset.filter(id__in=RawSQL(
+            "SELECT transaction_id FROM authapp_transaction_search WHERE document @@ to_tsquery('simple', %s)",
+            [match],
+        ))
+    return queryset.filter(
+        Q(product__name__icontains=query) |
+        Q(user__username__icontains=query) |
+        Q(remarks__icontains=query)
+    )
+
+
+def _cursor(row, direction):
+    return encode_token({"r": row[1], "id": row[0], "dir": direction})
+
+
+def _decode_cursor(token):
+    """Return ((score, id), direction) or None for a missing or malformed token."""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    try:
+        direction = payload["dir"]
+        if direction not in ("next", "prev"):
+            return None
+        return (float(payload["r"]), int(payload["id"])), direction
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def ranked_page(queryset, query, transaction_type=None, cursor=None, per_page=10):
+    """Best matches for ``query`` first, as a page shaped like ``keyset_paginate``'s.
+
+    The index answers the match and the ranking; ``queryset`` only loads
+    the rows for the ids on this page. Pages are a keyset walk on
+    (rank, id), so a deep page costs what the first one does. Returns None
+    when the database has no full-text index.
+    """
+    if not is_supported():
+        return None
+
+    position = _decode_cursor(cursor)
+    if position is None:
+        rows = _ranked_rows(query, transaction_type, per_page + 1)
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = _cursor(rows[-1], "next") if more else None
+        previous_cursor = None
+    elif position[1] == "next":
+        rows = _ranked_rows(query, transaction_type, per_page + 1, after=position[0])
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = _cursor(rows[-1], "next") if more and rows else None
+        previous_cursor = _cursor(rows[0], "prev") if rows else None
+    else:
+        # Walking backwards: read the other way from the cursor, then flip the rows.
+        rows = _ranked_rows(query, transaction_type, per_page + 1, after=position[0], backwards=True)
+        more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        next_cursor = _cursor(rows[-1], "next") if rows else None
+        previous_cursor = _cursor(rows[0], "prev") if more and rows else None
+
+    ids = [pk for pk, _ in rows]
+    found = queryset.in_bulk(ids)
+    return KeysetPage(
+        [found[pk] for pk in ids if pk in found],
+        next_cursor=next_cursor,
+        previous_cursor=previous_cursor,
+    )
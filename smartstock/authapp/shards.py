@@ -0,0 +1,237 @@
+"""Sharded stock for hot products.
+
+A product opted in with ``enable`` has its sellable stock split across N
+``StockShard`` rows. Checkout takes units from one shard with a guarded
+UPDATE and never locks the ``Product`` row, so tills selling the same
+product stop queueing behind each other.
+
+``Product.stock`` stays the total as of the last fold; sales since then are
+``allocated - stock`` summed over the shards. ``fold`` (run periodically by
+``manage.py stock_shards fold``, and on demand when a till finds its shards
+short) moves those sales into ``Product.stock`` and re-splits it. Reads
+that must be exact use ``exact_stock``, the ``sold_since_fold``
+expression, or ``low_stock`` in place of the ``is_low`` flag (which is
+generated from ``Product.stock`` and so lags the same way).
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from . import dashboard
+from .models import Product, StockShard
+
+DEFAULT_SHARDS = 8
+MAX_SHARDS = 64
+
+
+class ShardError(ValueError):
+    """Raised when stock cannot be taken from the shards."""
+
+
+def sold_since_fold():
+    """Per-product expression: units sold from shards since the last fold (0 when not sharded)."""
+    return Coalesce(
+        Subquery(
+            StockShard.objects.filter(product=OuterRef("pk")).order_by().values("product")
+            .annotate(sold=Sum(F("allocated") - F("stock"))).values("sold")
+        ),
+        0,
+    )
+
+
+def exact_stock(product):
+    """Current stock of ``product`` including shard sales not folded yet."""
+    sold = StockShard.objects.filter(product=product).aggregate(
+        sold=Sum(F("allocated") - F("stock"))
+    )["sold"]
+    return product.stock - (sold or 0)
+
+
+def low_stock(queryset=None):
+    """Products at or below ``min_stock``, exact for sharded ones, annotated with ``exact`` stock.
+
+    Unsharded products are found through the partial index on ``is_low``;
+    the few sharded ones are always checked against their shards as well,
+    since a sale from a shard doesn't touch ``Product.stock``. The two id
+    lists are UNIONed rather than ORed so each side keeps its index.
+    """
+    queryset = Product.objects.all() if queryset is None else queryset
+    candidates = Product.objects.filter(is_low=True).values("id").union(StockShard.objects.values("product_id"))
+    return (
+        queryset.filter(id__in=candidates)
+        .annotate(exact=F("stock") - sold_since_fold())
+        .filter(exact__lte=F("min_stock"))
+    )
+
+
+def sharded(product_ids):
+    """{product_id: shard count} for the sharded products among ``product_ids``."""
+    return dict(
+        StockShard.objects.filter(product_id__in=product_ids).order_by()
+        .values("product").annotate(count=Count("id")).values_list("product", "count")
+    )
+
+
+def _split(total, count):
+    share, extra = divmod(total, count)
+    return [share + (1 if i < extra else 0) for i in range(count)]
+
+
+def drain(product_ids):
+    """Move shard sales into ``Product.stock`` and empty the shards.
+
+    The caller holds the product row locks. Afterwards ``Product.stock`` is
+    exact and safe to change directly; the next sale of a drained product
+    refills its shards through ``fold``. Returns the ids that were sharded.
+    """
+    sold = {}
+    shards = StockShard.objects.select_for_update().filter(product_id__in=product_ids)
+    for pid, allocated, stock in shards.order_by("product_id", "shard").values_list(
+        "product_id", "allocated", "stock"
+    ):
+        sold[pid] = sold.get(pid, 0) + allocated - stock
+    if not sold:
+        return set()
+
+    moved = {pid: units for pid, units in sold.items() if units}
+    if moved:
+        Product.objects.filter(id__in=list(moved)).update(
+            # Never below zero, even if stock left outside a sale without draining first
+            stock=Greatest(
+                Case(*[When(id=pid, then=F("stock") - units) for pid, units in moved.items()]),
+                0,
+            ),
+            version=F("version") + 1,
+            updated_at=Now(),
+        )
+    StockShard.objects.filter(product_id__in=list(sold)).update(allocated=0, stock=0)
+    return set(sold)
+
+
+def refill(product_ids):
+    """Split each product's current stock evenly across its shards (caller holds the locks)."""
+    totals = dict(Product.objects.filter(id__in=product_ids).values_list("id", "stock"))
+    shards = list(StockShard.objects.filter(product_id__in=product_ids).order_by("product_id", "shard"))
+    by_product = {}
+    for shard in shards:
+        by_product.setdefault(shard.product_id, []).append(shard)
+    for pid, rows in by_product.items():
+        for shard, share in zip(rows, _split(totals.get(pid, 0), len(rows))):
+            shard.allocated = shard.stock = share
+    StockShard.objects.bulk_update(shards, ["allocated", "stock"])
+
+
+def _lock(product_ids):
+    return list(
+        Product.objects.select_for_update().filter(id__in=product_ids)
+        .order_by("id").values_list("id", flat=True)
+    )
+
+
+def settle(product_ids):
+    """Lock and drain the sharded products among ``product_ids``.
+
+    For writes that change ``Product.stock`` directly (corrections, manual
+    movements); a no-op costing one query when none of them are sharded.
+    """
+    ids = sorted(sharded(product_ids))
+    if ids:
+        _lock(ids)
+        drain(ids)
+    return ids
+
+
+def fold(product_ids=None):
+    """Fold shard sales into ``Product.stock`` and re-split; all sharded products by default."""
+    if product_ids is None:
+        product_ids = StockShard.objects.values_list("product_id", flat=True).distinct()
+    with transaction.atomic():
+        ids = sorted(sharded(product_ids))
+        if not ids:
+            return 0
+        _lock(ids)
+        drain(ids)
+        refill(ids)
+        dashboard.invalidate()
+    return len(ids)
+
+
+def _take_from_one(pid, shard, quantity):
+    return StockShard.objects.filter(product_id=pid, shard=shard, stock__gte=quantity).update(
+        stock=F("stock") - quantity
+    )
+
+
+def _take_from_fullest(pid, quantity):
+    fullest = (
+        StockShard.objects.filter(product_id=pid, stock__gte=quantity)
+        .order_by("-stock").values("id")[:1]
+    )
+    return StockShard.objects.filter(id__in=Subquery(fullest), stock__gte=quantity).update(
+        stock=F("stock") - quantity
+    )
+
+
+def _take_locked(short, products):
+    """Slow path: lock every short product at once, fold, and sell from the exact totals.
+
+    The locks are taken in one id-ordered query, like checkout's, so two
+    sales that both fall back here can't wait on each other in opposite
+    directions.
+    """
+    ids = sorted(short)
+    _lock(ids)
+    drain(ids)
+    for pid in ids:
+        quantity = short[pid]
+        updated = Product.objects.filter(id=pid, stock__gte=quantity).update(
+            stock=F("stock") - quantity, version=F("version") + 1, updated_at=Now()
+        )
+        if not updated:
+            available = Product.objects.values_list("stock", flat=True).get(id=pid)
+            raise ShardError(
+                f"Not enough stock for {products[pid].name}. Available: {available}, Requested: {quantity}"
+            )
+    refill(ids)
+
+
+def take(basket, shard_counts, products, till=0):
+    """Take {product_id: quantity} off the shards of sharded products.
+
+    Each till starts at its own shard (``till`` modulo the shard count), then
+    tries the fullest shard; the lines no single shard can cover are then
+    sold together through the locked slow path. Call inside the sale's
+    transaction.
+    """
+    short = {}
+    for pid, quantity in basket.items():
+        if _take_from_one(pid, till % shard_counts[pid], quantity):
+            continue
+        if _take_from_fullest(pid, quantity):
+            continue
+        short[pid] = quantity
+    if short:
+        _take_locked(short, products)
+
+
+def enable(product, count=DEFAULT_SHARDS):
+    """Start serving ``product``'s sales from ``count`` shards."""
+    if not 1 <= count <= MAX_SHARDS:
+        raise ShardError(f"Shard count must be between 1 and {MAX_SHARDS}.")
+    with transaction.atomic():
+        _lock([product.id])
+        drain([product.id])
+        StockShard.objects.filter(product=product).delete()
+        StockShard.objects.bulk_create(
+            [StockShard(product=product, shard=i) for i in range(count)]
+        )
+        refill([product.id])
+
+
+def disable(product):
+    """Fold ``product``'s shards back into ``Product.stock`` and drop them."""
+    with transaction.atomic():
+        _lock([product.id])
+        drain([product.id])
+        StockShard.objects.filter(product=product).delete()
+        dashboard.invalidate()
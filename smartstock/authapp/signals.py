@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import catalog, dashboard
+from .models import CustomUser, Product, Supplier, Transaction
+
+# Any of these changing can move a dashboard counter
+for model in (Product, Transaction, Supplier, CustomUser):
+    post_save.connect(dashboard.invalidate, sender=model, dispatch_uid=f"dashboard-save-{model.__name__}")
+    post_delete.connect(dashboard.invalidate, sender=model, dispatch_uid=f"dashboard-delete-{model.__name__}")
+
+# Keep this worker's typeahead index in step with product edits
+post_save.connect(catalog.index.product_saved, sender=Product, dispatch_uid="catalog-save")
+post_delete.connect(catalog.index.product_deleted, sender=Product, dispatch_uid="catalog-delete")
@@ -1,3 +1,1417 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import importlib.util
+import io
+import json
+import time as time_module
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    adjustments, approvals, catalog, checkout, dashboard, exports, forecast, idempotency, imports, inventory, invoices,
+    purchasing, query_plans, rollups, search, shards, snapshots, views,
+)
+from .models import (
+    Bill, BillItem, CustomUser, DailyCategorySales, DailyProductSales, IdempotencyKey, InvoiceSequence, Product,
+    PurchaseOrder, StockShard, StockSnapshot, Supplier, SupplierRequest, Transaction,
+)
+from .pagination import keyset_paginate
+
+
+def make_user(username, role="staff", **extra):
+    return CustomUser.objects.create_user(username=username, password="pw", role=role, **extra)
+
+
+def make_supplier(username="acme", status="approved"):
+    user = make_user(username, role="supplier")
+    return Supplier.objects.create(user=user, name=username.title(), status=status)
+
+
+def make_product(name, stock=10, price="2.50", **extra):
+    extra.setdefault("category", "Grocery")
+    return Product.objects.create(name=name, stock=stock, price=Decimal(price), **extra)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=10)
+        self.salt = make_product("Salt", stock=3, price="1.00")
+
+    def test_bill_takes_stock_and_writes_items_and_ledger(self):
+        bill = checkout.checkout("Asha", self.staff, [(self.rice.id, 4), (self.salt.id, 1), (self.rice.id, 1)])
+
+        self.rice.refresh_from_db()
+        self.salt.refresh_from_db()
+        self.assertEqual((self.rice.stock, self.salt.stock), (5, 2))
+        self.assertEqual(bill.total, Decimal("13.50"))
+        self.assertEqual(bill.item_count, 2)
+        self.assertEqual(
+            sorted(BillItem.objects.filter(bill=bill).values_list("product_id", "quantity")),
+            [(self.rice.id, 5), (self.salt.id, 1)],
+        )
+        self.assertEqual(Transaction.objects.filter(bill=bill, type="out").count(), 2)
+
+    def test_short_line_rolls_back_the_whole_bill(self):
+        with self.assertRaisesMessage(checkout.CheckoutError, "Not enough stock for Salt"):
+            checkout.checkout("Asha", self.staff, [(self.rice.id, 2), (self.salt.id, 4)])
+
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 10)
+        self.assertFalse(Bill.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_guarded_update_refuses_to_oversell(self):
+        # Another till sold the salt after this one read it
+        Product.objects.filter(id=self.salt.id).update(stock=1)
+
+        with self.assertRaises(checkout.CheckoutError), transaction.atomic():
+            checkout.decrement_stock({self.rice.id: 1, self.salt.id: 2})
+
+        self.assertEqual(
+            dict(Product.objects.values_list("id", "stock")), {self.rice.id: 10, self.salt.id: 1}
+        )
+
+    def test_query_count_does_not_grow_with_the_basket(self):
+        more = [make_product(f"Item {i}") for i in range(6)]
+        checkout.checkout("Opening", self.staff, [(self.rice.id, 1)])  # opens the invoice sequence
+        with CaptureQueriesContext(connection) as small:
+            checkout.checkout("A", self.staff, [(self.rice.id, 1)])
+        with CaptureQueriesContext(connection) as large:
+            checkout.checkout("B", self.staff, [(p.id, 1) for p in more])
+        self.assertEqual(len(small), len(large))
+
+    def test_new_bill_view(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse("new_bill"), {
+            "customer_name": "Asha",
+            "product_ids": [f"{self.rice.id}:0"],
+            "quantity_0": "3",
+        })
+        self.assertRedirects(response, reverse("staff_dashboard"), fetch_redirect_response=False)
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 7)
+
+
+class BillListTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=1000)
+        self.client.force_login(self.staff)
+
+    def sell(self, count):
+        for i in range(count):
+            checkout.checkout(f"Customer {i}", self.staff, [(self.rice.id, 1)])
+
+    def test_pages_with_a_cursor(self):
+        self.sell(30)
+        first = self.client.get(reverse("bill_list")).context["page"]
+        self.assertEqual(len(first), 25)
+        self.assertEqual(first.object_list[0].customer_name, "Customer 29")
+        self.assertEqual(first.object_list[0].total, self.rice.price)
+
+        second = self.client.get(reverse("bill_list"), {"cursor": first.next_cursor}).context["page"]
+        self.assertEqual([b.customer_name for b in second], [f"Customer {i}" for i in range(4, -1, -1)])
+        self.assertFalse(second.has_next)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        self.sell(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("bill_list"))
+        self.sell(20)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("bill_list"))
+        self.assertEqual(len(few), len(many))
+
+
+class BillBatchTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("pos")
+        self.rice = make_product("Rice", stock=5)
+        self.client.force_login(self.staff)
+
+    def post(self, payload):
+        return self.client.post(reverse("api_bill_batch"), json.dumps(payload), content_type="application/json")
+
+    def test_short_bill_only_fails_itself(self):
+        line = lambda qty: [{"product_id": self.rice.id, "quantity": qty}]
+        response = self.post({"bills": [
+            {"customer_name": "A", "lines": line(2)},
+            {"customer_name": "B", "lines": line(9)},
+            {"customer_name": "", "lines": line(1)},
+            {"customer_name": "C", "lines": line(3)},
+        ]})
+
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 2))
+        self.assertEqual([r["ok"] for r in body["results"]], [True, False, False, True])
+        self.assertIn("Not enough stock", body["results"][1]["error"])
+        self.assertEqual(body["results"][2]["error"], "customer_name is required.")
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 0)
+        self.assertEqual(Bill.objects.count(), 2)
+
+    def test_rejects_a_malformed_body(self):
+        self.assertEqual(self.post({"bill": []}).status_code, 400)
+        self.assertEqual(
+            self.client.post(reverse("api_bill_batch"), "nope", content_type="application/json").status_code, 400
+        )
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.admin = make_user("boss", role="admin")
+        self.rice = make_product("Rice", stock=10)
+
+    def test_retried_checkout_returns_the_first_bill(self):
+        first = checkout.checkout("Asha", self.staff, [(self.rice.id, 2)], idempotency_key="k-1")
+        again = checkout.checkout("Asha", self.staff, [(self.rice.id, 2)], idempotency_key="k-1")
+
+        self.assertFalse(first.replayed)
+        self.assertTrue(again.replayed)
+        self.assertEqual(again.id, first.id)
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 8)
+        self.assertEqual(Bill.objects.count(), 1)
+
+    def test_keys_are_scoped_to_the_user(self):
+        other = make_user("till2")
+        first = checkout.checkout("Asha", self.staff, [(self.rice.id, 2)], idempotency_key="k-1")
+        second = checkout.checkout("Ravi", other, [(self.rice.id, 3)], idempotency_key="k-1")
+
+        self.assertFalse(second.replayed)
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(second.customer_name, "Ravi")
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 5)
+
+    def test_double_submitted_stock_movement_is_applied_once(self):
+        self.client.force_login(self.admin)
+        form = {
+            "transaction_form": "1",
+            "product": self.rice.id,
+            "type": "in",
+            "quantity": "5",
+            "idempotency_key": "move-1",
+        }
+        self.client.post(reverse("admin_dashboard"), form)
+        self.client.post(reverse("admin_dashboard"), form)
+
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 15)
+        self.assertEqual(Transaction.objects.filter(product=self.rice).count(), 1)
+
+    def test_purge_removes_only_expired_keys(self):
+        idempotency.record("bill", "old", None, {})
+        idempotency.record("bill", "new", None, {})
+        IdempotencyKey.objects.filter(key="old").update(created_at=timezone.now() - timedelta(hours=30))
+
+        self.assertEqual(idempotency.purge_expired(hours=24), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["new"])
+
+
+@override_settings(STORE_CODE="MAIN")
+class InvoiceNumberTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=100)
+        invoices._blocks.clear()
+        self.addCleanup(invoices._blocks.clear)
+
+    def numbers(self):
+        return list(Bill.objects.order_by("id").values_list("invoice_seq", flat=True))
+
+    def last_number(self):
+        return InvoiceSequence.objects.get(store="MAIN").last_number
+
+    def test_numbers_are_consecutive_and_a_failed_bill_leaves_no_gap(self):
+        checkout.checkout("A", self.staff, [(self.rice.id, 1)])
+        with self.assertRaises(checkout.CheckoutError):
+            checkout.checkout("B", self.staff, [(self.rice.id, 1000)])
+        bill = checkout.checkout("C", self.staff, [(self.rice.id, 1)])
+
+        self.assertEqual(self.numbers(), [1, 2])
+        self.assertEqual(bill.invoice_number, f"INV-MAIN-{timezone.localdate().year}-000002")
+
+    def test_stores_and_years_have_their_own_sequences(self):
+        self.assertEqual(invoices.allocate_invoice_number("MAIN", 2025), ("MAIN", 2025, 1))
+        self.assertEqual(invoices.allocate_invoice_number("MAIN", 2026), ("MAIN", 2026, 1))
+        self.assertEqual(invoices.allocate_invoice_number("NORTH", 2026), ("NORTH", 2026, 1))
+        self.assertEqual(invoices.allocate_invoice_number("MAIN", 2025), ("MAIN", 2025, 2))
+
+    @override_settings(INVOICE_NUMBER_BLOCK_SIZE=50)
+    def test_a_batch_shares_one_block(self):
+        line = [{"product_id": self.rice.id, "quantity": 1}]
+        short = [{"product_id": self.rice.id, "quantity": 1000}]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = checkout.checkout_batch(
+                [{"customer_name": name, "lines": short if name == "X" else line} for name in "ABXCD"], self.staff
+            )
+
+        self.assertEqual([r["ok"] for r in results], [True, True, False, True, True])
+        self.assertEqual(self.numbers(), [1, 2, 3, 4])
+        self.assertEqual(self.last_number(), 50)
+
+        # Once the batch commits, the rest of its block serves later bills
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout.checkout("E", self.staff, [(self.rice.id, 1)])
+        self.assertEqual(self.numbers(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.last_number(), 50)
+
+    @override_settings(INVOICE_NUMBER_BLOCK_SIZE=3)
+    def test_a_rolled_back_bill_does_not_undo_the_batch_block(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic(), invoices.batch(2):
+                try:
+                    with transaction.atomic():
+                        invoices.allocate_invoice_number()
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+                second = invoices.allocate_invoice_number()[2]
+                self.assertEqual(self.last_number(), 3)
+
+        self.assertEqual(second, 2)
+        # The block stays reserved, so its last number is still this process's
+        self.assertEqual(invoices.allocate_invoice_number()[2], 3)
+        self.assertEqual(self.last_number(), 3)
+
+    @override_settings(INVOICE_NUMBER_BLOCK_SIZE=3)
+    def test_committed_blocks_are_used_up_in_turn(self):
+        # Two blocks reserved by transactions that committed with numbers left
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                invoices.allocate_invoice_number()
+        self.assertEqual(self.last_number(), 3)
+        # The second allocation took 2 from the first block, leaving only 3
+        with invoices.batch(3):
+            numbers = [invoices.allocate_invoice_number()[2] for _ in range(4)]
+        self.assertEqual(numbers, [3, 4, 5, 6])
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        staff = make_user("till")
+        make_user("boss", role="admin")
+        supplier = make_supplier()
+        products = [make_product(f"Basmati {i}", stock=50) for i in range(5)]
+        make_product("Lentils", stock=1)
+        for i, product in enumerate(products):
+            checkout.checkout(f"Customer {i}", staff, [(product.id, 2)])
+        SupplierRequest.objects.create(
+            supplier=supplier, product_name="Basmati 0", price_per_unit=Decimal("2"), quantity=5
+        )
+
+    def test_every_view_query_uses_an_index(self):
+        results = list(query_plans.check_plans())
+
+        self.assertEqual([r[1] for r in results if r[2] is None], [])
+        self.assertEqual([(view, description, scanned) for view, description, _, _, scanned in results if scanned], [])
+        self.assertLessEqual({"transactions", "stock_history", "bill_detail", "api_product_lookup"}, {r[0] for r in results})
+
+    def test_full_scans_resolve_subquery_aliases(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite plan format")
+        sql = 'SELECT (SELECT 1 FROM "authapp_product" U0), (SELECT 1 FROM "authapp_supplier" U0) FROM "authapp_bill"'
+        plan = "SCAN authapp_bill\nSCAN U0\nSEARCH authapp_product USING INDEX x (id=?)\nSCAN t USING INDEX y"
+        self.assertEqual(
+            query_plans.full_scans(plan, sql), [("authapp_bill",), ("authapp_product", "authapp_supplier")]
+        )
+
+    def test_a_primary_key_page_is_not_a_full_scan(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite plan format")
+        page = str(Product.objects.order_by("-id")[:50].query)
+        listing = str(Product.objects.order_by("-id").query)
+        self.assertEqual(query_plans.full_scans(query_plans.explain(page), page), [])
+        self.assertEqual(query_plans.full_scans(query_plans.explain(listing), listing), [("authapp_product",)])
+
+    def test_exemptions_cover_only_their_statements(self):
+        call = query_plans.ViewCall(
+            "admin_dashboard", "dashboard", "admin", full_scans=(("authapp_product", '"total_stock"'),)
+        )
+        with mock.patch.object(query_plans, "capture_queries", return_value=[
+            'SELECT SUM("authapp_product"."stock") AS "total_stock" FROM "authapp_product"',
+            'SELECT "authapp_product"."price" FROM "authapp_product"',
+        ]):
+            scanned = [r[4] for r in query_plans.check_plans([call])]
+        self.assertEqual(scanned, [[], ["authapp_product"]])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.rice = make_product("Rice")
+        Transaction.objects.bulk_create([
+            Transaction(product=self.rice, type="in", quantity=i + 1) for i in range(12)
+        ])
+        # Half the rows share one timestamp, so the id has to break the tie
+        moment = timezone.now()
+        Transaction.objects.filter(quantity__lte=6).update(date=moment)
+        Transaction.objects.filter(quantity__gt=6).update(date=moment - timedelta(minutes=1))
+        self.newest_first = list(Transaction.objects.order_by("-date", "-id").values_list("id", flat=True))
+
+    def ids(self, page):
+        return [t.id for t in page]
+
+    def test_walks_forward_and_back_without_gaps_or_repeats(self):
+        rows = Transaction.objects.all()
+        first = keyset_paginate(rows, per_page=5)
+        second = keyset_paginate(rows, first.next_cursor, per_page=5)
+        third = keyset_paginate(rows, second.next_cursor, per_page=5)
+
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(third), self.newest_first)
+        self.assertFalse(third.has_next)
+        self.assertEqual(self.ids(keyset_paginate(rows, second.previous_cursor, per_page=5)), self.ids(first))
+        self.assertFalse(keyset_paginate(rows, second.previous_cursor, per_page=5).has_previous)
+
+    def test_malformed_cursor_falls_back_to_the_first_page(self):
+        page = keyset_paginate(Transaction.objects.all(), "not-a-cursor", per_page=5)
+        self.assertEqual(self.ids(page), self.newest_first[:5])
+
+    def test_views_page_with_cursors(self):
+        self.client.force_login(self.admin)
+        first = self.client.get(reverse("transactions")).context["page_obj"]
+        second = self.client.get(reverse("transactions"), {"cursor": first.next_cursor}).context["page_obj"]
+        self.assertEqual(self.ids(first) + self.ids(second), self.newest_first)
+
+        history = self.client.get(reverse("stock_history", args=[self.rice.id])).context["page"]
+        self.assertEqual(self.ids(history), self.newest_first)
+
+
+class LedgerSearchTests(TestCase):
+    def setUp(self):
+        if not search.is_supported():
+            self.skipTest("no full-text index on this database")
+        self.admin = make_user("boss", role="admin")
+        self.sugar = make_product("Brown Sugar")
+        self.rice = make_product("Rice")
+        Transaction.objects.bulk_create([
+            Transaction(product=self.sugar, type="in", quantity=5, remarks="Delivery from Acme"),
+            Transaction(product=self.sugar, type="out", quantity=1, user=self.admin),
+            Transaction(product=self.rice, type="out", quantity=2, remarks="Spilled sack"),
+        ])
+
+    def found(self, query, transaction_type=None):
+        page = search.ranked_page(Transaction.objects.all(), query, transaction_type)
+        return sorted((t.product.name, t.type) for t in page)
+
+    def test_bulk_created_rows_are_indexed(self):
+        self.assertEqual(self.found("sug"), [("Brown Sugar", "in"), ("Brown Sugar", "out")])
+        self.assertEqual(self.found("acme"), [("Brown Sugar", "in")])
+        self.assertEqual(self.found("boss"), [("Brown Sugar", "out")])
+        self.assertEqual(self.found("sugar", "out"), [("Brown Sugar", "out")])
+        self.assertEqual(self.found("sack rice"), [("Rice", "out")])
+
+    def test_index_follows_edits_and_deletes(self):
+        Product.objects.filter(id=self.rice.id).update(name="Jasmine Rice")
+        Transaction.objects.filter(remarks="Delivery from Acme").update(remarks="Returned")
+        Transaction.objects.filter(product=self.sugar, type="out").delete()
+
+        self.assertEqual(self.found("jasmine"), [("Jasmine Rice", "out")])
+        self.assertEqual(self.found("acme"), [])
+        self.assertEqual(self.found("boss"), [])
+
+    def test_index_follows_username_changes(self):
+        CustomUser.objects.filter(id=self.admin.id).update(username="chief")
+
+        self.assertEqual(self.found("chief"), [("Brown Sugar", "out")])
+        self.assertEqual(self.found("boss"), [])
+
+    def test_ranked_pages_walk_forwards_and_back(self):
+        Transaction.objects.bulk_create([
+            Transaction(product=self.rice, type="in", quantity=1, remarks="rice " * (i % 3)) for i in range(7)
+        ])
+        everything = [t.id for t in search.ranked_page(Transaction.objects.all(), "rice", per_page=100)]
+        self.assertEqual(len(everything), 8)
+
+        pages, cursor = [], None
+        while True:
+            page = search.ranked_page(Transaction.objects.all(), "rice", cursor=cursor, per_page=3)
+            pages.append([t.id for t in page])
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sum(pages, []), everything)
+        self.assertEqual([len(p) for p in pages], [3, 3, 2])
+
+        back = search.ranked_page(Transaction.objects.all(), "rice", cursor=page.previous_cursor, per_page=3)
+        self.assertEqual([t.id for t in back], pages[1])
+
+    def test_rebuild_refills_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM authapp_transaction_fts" if connection.vendor == "sqlite"
+                else "TRUNCATE authapp_transaction_search"
+            )
+        self.assertEqual(self.found("sugar"), [])
+        search.rebuild()
+        self.assertEqual(len(self.found("sugar")), 2)
+
+    def test_transactions_view_searches_the_index(self):
+        self.client.force_login(self.admin)
+        page = self.client.get(reverse("transactions"), {"q": "acme"}).context["page_obj"]
+        self.assertEqual([t.remarks for t in page], ["Delivery from Acme"])
+
+
+class LedgerExportTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.client.force_login(self.admin)
+        self.rice = make_product("Rice")
+        Transaction.objects.bulk_create([
+            Transaction(product=self.rice, type="in" if i % 3 else "out", quantity=i + 1, user=self.admin)
+            for i in range(7)
+        ])
+
+    def download(self, **params):
+        response = self.client.get(reverse("export_transactions"), params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv_streams_every_row_in_id_order(self):
+        with mock.patch.object(exports, "ROWS_PER_CHUNK", 3):
+            response, body = self.download()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([int(r["quantity"]) for r in rows], list(range(1, 8)))
+        self.assertEqual({r["product_name"] for r in rows} | {r["user"] for r in rows}, {"Rice", "boss"})
+
+    def test_ndjson_honours_the_type_filter(self):
+        _, body = self.download(format="ndjson", type="out")
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([r["quantity"] for r in records], [1, 4, 7])
+        self.assertEqual({r["type"] for r in records}, {"out"})
+
+    def test_gzip(self):
+        response, body = self.download(gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('.csv.gz"', response["Content-Disposition"])
+        self.assertEqual(len(gzip.decompress(body).decode().splitlines()), 8)
+
+
+class StockHistoryTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.rice = make_product("Rice", stock=10)
+        self.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=5)
+        for offset, movement, quantity in [(1, "in", 5), (2, "out", 3), (3, "in", 2)]:
+            history = inventory.move_stock(self.rice.id, movement, quantity)
+            Transaction.objects.filter(id=history.id).update(date=self.day + timedelta(days=offset))
+        self.rice.refresh_from_db()
+
+    def test_stock_at_from_the_live_stock(self):
+        self.assertEqual(snapshots.stock_at(self.rice, self.day), 10)
+        self.assertEqual(snapshots.stock_at(self.rice, self.day + timedelta(days=1)), 15)
+        self.assertEqual(snapshots.stock_at(self.rice, self.day + timedelta(days=2, hours=1)), 12)
+        self.assertEqual(snapshots.stock_at(self.rice, timezone.now()), 14)
+
+    def test_stock_at_from_the_nearest_snapshot(self):
+        # Deliberately off by 100, to prove the snapshot is the anchor
+        StockSnapshot.objects.create(product=self.rice, taken_at=self.day + timedelta(days=2, hours=1), stock=112)
+        self.assertEqual(snapshots.stock_at(self.rice, self.day + timedelta(days=1)), 115)
+        self.assertEqual(snapshots.stock_at(self.rice, self.day + timedelta(days=4)), 114)
+
+    def test_take_snapshot_records_every_product(self):
+        make_product("Salt", stock=3)
+        self.assertEqual(snapshots.take_snapshot(batch_size=1), 2)
+        self.assertEqual(sorted(StockSnapshot.objects.values_list("stock", flat=True)), [3, 14])
+
+    def test_history_shows_running_balance_and_stock_as_of(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse("stock_history", args=[self.rice.id]),
+            {"as_of": (self.day + timedelta(days=1)).date().isoformat()},
+        )
+        self.assertEqual([t.balance for t in response.context["page"]], [14, 12, 15])
+        self.assertEqual(response.context["stock_as_of"], 15)
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user("boss", role="admin")
+        self.staff = make_user("till")
+        make_supplier(status="pending")
+        self.rice = make_product("Rice", stock=10)
+        make_product("Salt", stock=2, min_stock=5)
+
+    def test_counters_in_one_query(self):
+        with self.assertNumQueries(1):
+            counters = dashboard.counters()
+        self.assertEqual(counters, {
+            "active_users": 2,
+            "total_products": 2,
+            "total_stock": 12,
+            "low_stock_count": 1,
+            "transactions_count": 0,
+            "pending_suppliers": 1,
+        })
+
+    def test_summary_is_cached_until_a_write_commits(self):
+        dashboard.get_summary()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.get_summary()["total_stock"], 12)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout.checkout("Asha", self.staff, [(self.rice.id, 4)])
+        summary = dashboard.get_summary()
+        self.assertEqual((summary["total_stock"], summary["transactions_count"]), (8, 1))
+
+    def test_rolled_back_write_keeps_the_cache(self):
+        version = dashboard._version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                make_product("Oil")
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(dashboard._version(), version)
+
+    def test_login_does_not_invalidate(self):
+        version = dashboard._version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username="till", password="pw")
+        self.assertEqual(dashboard._version(), version)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_view_pages_the_product_table(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse("admin_dashboard"))  # warms the summary and the session
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("admin_dashboard"))
+        Product.objects.bulk_create([
+            Product(name=f"Item {i}", category="Grocery", stock=20, price=Decimal("1"))
+            for i in range(views.DASHBOARD_PRODUCTS_PER_PAGE + 5)
+        ])
+        cache.clear()
+        self.client.get(reverse("admin_dashboard"))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse("admin_dashboard"))
+        self.assertEqual(len(few), len(many))
+
+        first = response.context["products"]
+        self.assertEqual(len(first), views.DASHBOARD_PRODUCTS_PER_PAGE)
+        rest = self.client.get(reverse("admin_dashboard"), {"before": response.context["products_before"]})
+        self.assertEqual(
+            [p.name for p in first] + [p.name for p in rest.context["products"]],
+            list(Product.objects.order_by("-id").values_list("name", flat=True)),
+        )
+        self.assertIsNone(rest.context["products_before"])
+
+    def test_posting_a_movement_skips_the_summary(self):
+        self.client.force_login(self.admin)
+        with mock.patch.object(dashboard, "get_summary") as get_summary:
+            self.client.post(reverse("admin_dashboard"), {
+                "transaction_form": "1", "product": self.rice.id, "type": "in", "quantity": "1",
+            })
+        get_summary.assert_not_called()
+
+
+class StockChartTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.client.force_login(self.admin)
+        for name, stock, category in [("A", 40, "Grain"), ("B", 30, "Grain"), ("C", 20, "Oil"), ("D", 10, "Salt")]:
+            make_product(name, stock=stock, category=category)
+
+    def test_top_n_with_the_rest_as_others(self):
+        self.assertEqual(dashboard.chart_series(top=2), {
+            "group": "product", "labels": ["A", "B", "Others (2)"], "data": [40, 30, 30],
+        })
+        self.assertEqual(dashboard.chart_series(top=1, group="category"), {
+            "group": "category", "labels": ["Grain", "Others (2)"], "data": [70, 30],
+        })
+        self.assertEqual(dashboard.chart_series(top=10)["labels"], ["A", "B", "C", "D"])
+
+    def test_etag_answers_304_until_a_product_changes(self):
+        url = reverse("api_stock_chart")
+        first = self.client.get(url, {"top": 2})
+        self.assertEqual(first.json()["data"], [40, 30, 30])
+
+        again = self.client.get(url, {"top": 2}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        other = self.client.get(url, {"top": 3}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(other.status_code, 200)
+
+        inventory.move_stock(Product.objects.get(name="D").id, "in", 50)
+        changed = self.client.get(url, {"top": 2}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()["labels"][0], "D")
+
+
+class LowStockTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.client.force_login(self.staff)
+        self.products = [make_product(f"P{i}", stock=i, min_stock=5) for i in range(10)]
+
+    def test_flag_follows_bulk_writes(self):
+        rice = self.products[9]
+        self.assertFalse(Product.objects.get(id=rice.id).is_low)
+        checkout.checkout("Asha", self.staff, [(rice.id, 5)])
+        self.assertTrue(Product.objects.get(id=rice.id).is_low)
+        Product.objects.filter(id=rice.id).update(min_stock=1)
+        self.assertFalse(Product.objects.get(id=rice.id).is_low)
+
+    def test_api_pages_through_low_products_by_id(self):
+        url = reverse("api_low_stock")
+        first = self.client.get(url, {"limit": 4}).json()
+        self.assertEqual([r["name"] for r in first["results"]], ["P0", "P1", "P2", "P3"])
+        second = self.client.get(url, {"limit": 4, "after": first["next_after"]}).json()
+        self.assertEqual([r["name"] for r in second["results"]], ["P4", "P5"])
+        self.assertIsNone(second["next_after"])
+        self.assertEqual(self.client.get(url, {"after": "x"}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = make_user("till")
+        self.client.force_login(self.staff)
+        self.sugar = make_product("Sugar", stock=7)
+        make_product("Brown Sugar")
+        make_product("Icing Sugarcane Mix")
+        make_product("Salt")
+        catalog.index.rebuild()
+
+    def names(self, query, index=None):
+        ids = (index or catalog.index).search(query)
+        names = dict(Product.objects.values_list("id", "name"))
+        return [names[pk] for pk in ids]
+
+    def test_name_prefix_then_word_prefix_then_substring(self):
+        self.assertEqual(self.names("sug"), ["Sugar", "Brown Sugar", "Icing Sugarcane Mix"])
+        self.assertEqual(self.names("gar"), ["Sugar", "Brown Sugar", "Icing Sugarcane Mix"])
+        self.assertEqual(self.names("brown s"), ["Brown Sugar"])
+        self.assertEqual(self.names("pepper"), [])
+
+    def test_saves_are_applied_only_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product("Sugar Free Gum")
+        self.assertIn("Sugar Free Gum", self.names("sugar f"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.sugar.name = "Jaggery"
+                self.sugar.save()
+                transaction.set_rollback(True)
+        self.assertEqual(self.names("jagg"), [])
+        self.assertIn("Sugar", self.names("sugar"))
+
+    @mock.patch.object(catalog, "FRESHNESS_SECONDS", 0)
+    def test_other_workers_rebuild_after_a_change(self):
+        other = catalog.ProductIndex()
+        self.assertEqual(self.names("salt", other), ["Salt"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(name="Salt").update(name="Rock Salt")
+            catalog.invalidate()
+        self.assertEqual(self.names("rock", other), ["Rock Salt"])
+
+    def test_lookups_check_the_shared_version_only_now_and_then(self):
+        with mock.patch.object(catalog, "cache", wraps=catalog.cache) as shared:
+            for _ in range(5):
+                catalog.index.search("sug")
+        self.assertEqual(shared.get.call_count, 0)
+
+        with mock.patch.object(catalog.time, "monotonic", return_value=time_module.monotonic() + 60):
+            with mock.patch.object(catalog, "cache", wraps=catalog.cache) as shared:
+                catalog.index.search("sug")
+        self.assertEqual(shared.get.call_count, 1)
+
+    def test_a_patch_never_hides_another_workers_change(self):
+        mine, theirs = catalog.ProductIndex(), catalog.ProductIndex()
+        mine.rebuild()
+        theirs.rebuild()
+
+        # Another worker renames the salt and patches only its own index
+        with self.captureOnCommitCallbacks(execute=True):
+            salt = Product.objects.get(name="Salt")
+            Product.objects.filter(id=salt.id).update(name="Rock Salt")
+            theirs.product_changed(salt.id, [salt.id, "Rock Salt", salt.category, salt.sku])
+        # This worker's own change must not paper over it
+        with self.captureOnCommitCallbacks(execute=True):
+            pepper = make_product("Pepper")
+            mine.product_changed(pepper.id, [pepper.id, "Pepper", pepper.category, pepper.sku])
+
+        self.assertEqual(self.names("rock", mine), ["Rock Salt"])
+        self.assertEqual(self.names("pepp", mine), ["Pepper"])
+        self.assertEqual(self.names("rock", theirs), ["Rock Salt"])
+
+    def test_a_bump_that_lost_a_race_counts_as_out_of_step(self):
+        version = cache.get(catalog.VERSION_KEY)
+        # Another worker's non-atomic incr already took the next number
+        cache.add(f"{catalog.VERSION_KEY}:{version + 1}", True)
+
+        self.assertEqual(catalog.ProductIndex._bump(), (version + 2, False))
+        self.assertEqual(catalog.ProductIndex._bump(), (version + 3, True))
+
+    def test_lookup_api_returns_live_stock(self):
+        Product.objects.filter(id=self.sugar.id).update(stock=3)
+        results = self.client.get(reverse("api_product_lookup"), {"q": "sugar", "limit": 1}).json()["results"]
+        self.assertEqual([(r["name"], r["stock"]) for r in results], [("Sugar", 3)])
+
+
+class SkuTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.client.force_login(self.admin)
+
+    def test_sku_is_normalised_generated_and_unique(self):
+        scanned = make_product("Rice", sku=" 890 1234\t5678 ab ")
+        self.assertEqual(scanned.sku, "89012345678AB")
+        self.assertRegex(make_product("Salt").sku, r"^SKU-[0-9A-F]{10}$")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_product("Rice again", sku="89012345678ab")
+
+    def test_scan_finds_the_product_in_one_query(self):
+        rice = make_product("Rice", stock=4, sku="8901234")
+        with self.assertNumQueries(3):  # session, user, product
+            response = self.client.get(reverse("api_product_scan", args=[" 8901234 "]))
+        self.assertEqual((response.json()["id"], response.json()["stock"]), (rice.id, 4))
+        self.assertEqual(self.client.get(reverse("api_product_scan", args=["nope"])).status_code, 404)
+
+    def test_add_product_rejects_a_taken_sku(self):
+        make_product("Rice", sku="ABC")
+        response = self.client.post(reverse("add_product"), {
+            "name": "Other", "sku": "abc", "category": "Grocery", "stock": "1", "price": "1.00",
+        })
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)], ["❌ Another product already uses that SKU."]
+        )
+        self.assertEqual(Product.objects.count(), 1)
+
+
+def csv_file(*lines):
+    return io.BytesIO("\n".join(lines).encode())
+
+
+class ProductImportTests(TestCase):
+    HEADER = "sku,name,category,price,stock,min_stock,description"
+
+    def setUp(self):
+        self.rice = make_product("Rice", stock=40, sku="R-1", min_stock=12, description="Long grain")
+
+    def test_upserts_on_sku_and_reports_rejects(self):
+        result = imports.import_products(csv_file(
+            self.HEADER,
+            "r-1,Basmati Rice,Grain,3.10,999,8,Aged",
+            "S-1,Salt,Spice,1,20,,",
+            ",No SKU,Spice,1,1,1,",
+            "P-1,Pepper,Spice,-2,1,x,",
+            "S-1,Sea Salt,Spice,1.5,20,,",
+        ))
+
+        self.assertEqual((result.rows, result.created, result.updated), (5, 1, 1))
+        self.assertEqual([(line, sku) for line, sku, _ in result.rejected], [(4, ""), (5, "P-1"), (3, "S-1")])
+        self.assertIn("min_stock must be a whole number", result.rejected[1][2])
+        self.rice.refresh_from_db()
+        # Stock is never overwritten by a catalogue import
+        self.assertEqual((self.rice.name, self.rice.stock, self.rice.min_stock), ("Basmati Rice", 40, 8))
+        self.assertEqual(self.rice.version, 2)
+        salt = Product.objects.get(sku="S-1")
+        self.assertEqual((salt.name, salt.price, salt.min_stock), ("Sea Salt", Decimal("1.50"), 5))
+
+    def test_new_stock_is_posted_as_an_opening_balance(self):
+        before = timezone.now()
+        admin = make_user("boss", role="admin")
+        imports.import_products(csv_file(
+            self.HEADER, "R-1,Rice,Grain,2.75,70,,", "S-1,Salt,Spice,1,20,,", "O-1,Oil,Oil,9,0,,",
+        ), user=admin)
+
+        salt = Product.objects.get(sku="S-1")
+        self.assertEqual(
+            list(Transaction.objects.values_list("product__sku", "type", "quantity", "user__username")),
+            [("S-1", "in", 20, "boss")],
+        )
+        self.assertEqual(snapshots.stock_at(salt, before), 0)
+        self.assertEqual(snapshots.stock_at(salt, timezone.now()), 20)
+
+    def test_blank_cells_keep_existing_values(self):
+        imports.import_products(csv_file(self.HEADER, "R-1,Rice,Grain,2.75,0,,"))
+        self.rice.refresh_from_db()
+        self.assertEqual((self.rice.price, self.rice.min_stock, self.rice.description), (Decimal("2.75"), 12, "Long grain"))
+
+    def test_missing_columns_reject_the_file(self):
+        with self.assertRaisesMessage(imports.ImportFileError, "Missing column(s): price."):
+            imports.import_products(csv_file("sku,name,category", "A,B,C"))
+
+    def test_export_imports_back_unchanged(self):
+        chunks, _, _ = exports.export_products()
+        before = list(Product.objects.values_list("sku", "name", "price", "min_stock", "description"))
+        result = imports.import_products(io.BytesIO(b"".join(chunks)))
+        self.assertEqual((result.updated, result.rejected), (1, []))
+        self.assertEqual(list(Product.objects.values_list("sku", "name", "price", "min_stock", "description")), before)
+
+
+class StockTakeTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.client.force_login(self.admin)
+        self.rice = make_product("Rice", stock=10, sku="R-1")
+        self.salt = make_product("Salt", stock=4, sku="S-1")
+
+    def post(self, counts, **extra):
+        return self.client.post(
+            reverse("api_stock_adjustments"), json.dumps({"counts": counts, **extra}), content_type="application/json"
+        ).json()
+
+    def stock(self):
+        return dict(Product.objects.values_list("sku", "stock"))
+
+    def test_dry_run_lists_the_differences_only(self):
+        body = self.post([{"sku": "r-1", "counted": 7}, {"sku": "S-1", "counted": 4}], dry_run=True)
+        self.assertEqual(body["diffs"], [{"sku": "R-1", "name": "Rice", "stock": 10, "counted": 7, "delta": -3}])
+        self.assertEqual((body["adjusted"], body["unchanged"]), (1, 1))
+        self.assertEqual(self.stock(), {"R-1": 10, "S-1": 4})
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_counts_become_stock_with_ledger_corrections(self):
+        counts = [
+            {"sku": "R-1", "counted": 7},
+            {"sku": "S-1", "counted": 9},
+            {"sku": "X-9", "counted": 1},
+            {"sku": "S-1", "counted": "-1"},
+        ]
+        body = self.post(counts, reason="March count")
+        self.assertEqual(body["adjusted"], 2)
+        self.assertEqual([(r["index"], r["error"]) for r in body["rejected"]], [
+            (4, "counted must be a whole number of 0 or more"), (3, "unknown sku"),
+        ])
+        self.assertEqual(self.stock(), {"R-1": 7, "S-1": 9})
+        self.assertEqual(
+            sorted(Transaction.objects.values_list("product__sku", "type", "quantity")),
+            [("R-1", "out", 3), ("S-1", "in", 5)],
+        )
+        self.assertIn("(March count)", Transaction.objects.first().remarks)
+
+        # Absolute counts: posting the same file again changes nothing
+        again = self.post(counts)
+        self.assertEqual((again["adjusted"], again["unchanged"]), (0, 2))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_chunks_and_csv_input(self):
+        result = adjustments.adjust_stock(
+            adjustments.read_counts(csv_file("sku,counted", "R-1,1", "S-1,2")), chunk_size=1
+        )
+        self.assertEqual(result.adjusted, 2)
+        self.assertEqual(self.stock(), {"R-1": 1, "S-1": 2})
+
+
+class ShardedStockTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.hot = make_product("Milk", stock=10)
+        self.cold = make_product("Bread", stock=10)
+        shards.enable(self.hot, 4)
+
+    def shard_stock(self, product=None):
+        return list(StockShard.objects.filter(product=product or self.hot).order_by("shard").values_list("stock", flat=True))
+
+    def exact(self, product=None):
+        return shards.exact_stock(Product.objects.get(id=(product or self.hot).id))
+
+    def test_enable_splits_the_stock(self):
+        self.assertEqual(self.shard_stock(), [3, 3, 2, 2])
+        self.assertEqual(shards.sharded([self.hot.id, self.cold.id]), {self.hot.id: 4})
+
+    def test_sale_takes_from_a_shard_without_touching_the_product_row(self):
+        version = Product.objects.get(id=self.hot.id).version
+        checkout.checkout("A", self.staff, [(self.hot.id, 2), (self.cold.id, 1)])
+
+        hot = Product.objects.get(id=self.hot.id)
+        self.assertEqual((hot.stock, hot.version), (10, version))
+        self.assertEqual(sum(self.shard_stock()), 8)
+        self.assertEqual(self.exact(), 8)
+        self.assertEqual(Product.objects.get(id=self.cold.id).stock, 9)
+
+    def test_line_no_shard_covers_is_sold_from_the_total(self):
+        checkout.checkout("A", self.staff, [(self.hot.id, 7)])
+        self.assertEqual(Product.objects.get(id=self.hot.id).stock, 3)
+        self.assertEqual(self.shard_stock(), [1, 1, 1, 0])
+
+        with self.assertRaisesMessage(checkout.CheckoutError, "Available: 3, Requested: 4"):
+            checkout.checkout("B", self.staff, [(self.hot.id, 4)])
+        self.assertEqual(self.exact(), 3)
+
+    def test_short_products_are_locked_together_in_id_order(self):
+        other = make_product("Eggs", stock=10)
+        shards.enable(other, 2)
+        with mock.patch.object(shards, "_lock", wraps=shards._lock) as lock:
+            checkout.checkout("A", self.staff, [(other.id, 8), (self.hot.id, 8)])
+        lock.assert_called_once_with(sorted([self.hot.id, other.id]))
+        self.assertEqual((self.exact(), self.exact(other)), (2, 2))
+
+    def test_batch_does_not_lock_sharded_products_up_front(self):
+        line = [{"product_id": self.hot.id, "quantity": 1}, {"product_id": self.cold.id, "quantity": 1}]
+        with mock.patch.object(checkout, "lock_products", wraps=checkout.lock_products) as lock:
+            checkout.checkout_batch([{"customer_name": "A", "lines": line}], self.staff)
+        self.assertEqual(lock.call_args_list[0], mock.call([self.cold.id]))
+        self.assertEqual(self.exact(), 9)
+
+    def test_low_stock_counts_shard_sales_before_a_fold(self):
+        Product.objects.filter(id=self.hot.id).update(min_stock=5)
+        for _ in range(3):
+            checkout.checkout("A", self.staff, [(self.hot.id, 2)])
+        hot = Product.objects.get(id=self.hot.id)
+        self.assertEqual((hot.stock, hot.is_low, self.exact()), (10, False, 4))
+
+        self.client.force_login(self.staff)
+        rows = self.client.get(reverse("api_low_stock")).json()["results"]
+        self.assertEqual([(r["name"], r["stock"]) for r in rows], [("Milk", 4)])
+        self.assertEqual(dashboard.counters()["low_stock_count"], 1)
+        self.assertEqual([p.name for p in dashboard.build_summary()["low_stock_products"]], ["Milk"])
+
+    def test_direct_writes_settle_and_fold_rebalances(self):
+        checkout.checkout("A", self.staff, [(self.hot.id, 3)])
+        inventory.move_stock(self.hot.id, "in", 5)
+        self.assertEqual(Product.objects.get(id=self.hot.id).stock, 12)
+        self.assertEqual(self.exact(), 12)
+
+        self.assertEqual(shards.fold(), 1)
+        self.assertEqual(self.shard_stock(), [3, 3, 3, 3])
+
+        shards.disable(Product.objects.get(id=self.hot.id))
+        self.assertEqual(shards.sharded([self.hot.id]), {})
+        self.assertEqual(Product.objects.get(id=self.hot.id).stock, 12)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductEditTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user("boss", role="admin")
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=10)
+        self.client.force_login(self.admin)
+
+    def form(self, **changes):
+        values = {
+            "version": self.rice.version, "name": "Rice", "sku": self.rice.sku, "category": "Grocery",
+            "price": "2.50", "description": "", "min_stock": "5", "stock": "10",
+        }
+        values.update(changes)
+        return values
+
+    def test_edit_against_the_current_version_applies(self):
+        response = self.client.post(reverse("edit_product", args=[self.rice.id]), self.form(name="Red Rice", stock="12"))
+        self.assertRedirects(response, reverse("admin_dashboard"), fetch_redirect_response=False)
+        rice = Product.objects.get(id=self.rice.id)
+        self.assertEqual((rice.name, rice.stock, rice.version), ("Red Rice", 12, self.rice.version + 1))
+        self.assertEqual(
+            list(Transaction.objects.values_list("type", "quantity", "remarks")),
+            [("in", 2, "Manual correction on product edit: 10 -> 12")],
+        )
+
+    def test_edit_after_a_sale_is_a_conflict(self):
+        checkout.checkout("Asha", self.staff, [(self.rice.id, 3)])
+        response = self.client.post(reverse("edit_product", args=[self.rice.id]), self.form(stock="10", price="9.99"))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.context["product"].stock, 7)
+        rice = Product.objects.get(id=self.rice.id)
+        self.assertEqual((rice.stock, rice.price), (7, Decimal("2.50")))
+
+    def test_stale_version_raises_with_the_fresh_row(self):
+        inventory.update_product(self.rice.id, self.rice.version, {"price": "3.00"})
+        with self.assertRaises(inventory.StaleProductError) as caught:
+            inventory.update_product(self.rice.id, self.rice.version, {"price": "4.00"})
+        self.assertEqual(caught.exception.current.price, Decimal("3.00"))
+
+    def test_movements_are_relative_and_guarded(self):
+        inventory.move_stock(self.rice.id, "out", 4)
+        inventory.move_stock(self.rice.id, "in", 1)
+        with self.assertRaisesMessage(inventory.StockMovementError, "Not enough stock to remove."):
+            inventory.move_stock(self.rice.id, "out", 8)
+        self.assertEqual(Product.objects.get(id=self.rice.id).stock, 7)
+
+    def test_edits_reach_the_dashboard_and_typeahead_once_committed(self):
+        catalog.index.rebuild()
+        dashboard.get_summary()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            inventory.update_product(self.rice.id, self.rice.version, {"name": "Wild Rice"})
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(catalog.index.search("wild"), [self.rice.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.move_stock(self.rice.id, "in", 5)
+        self.assertEqual(dashboard.get_summary()["total_stock"], 15)
+
+
+class LedgerLinkTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=10)
+        self.salt = make_product("Salt", stock=10)
+        self.bill = checkout.checkout("Asha", self.staff, [(self.rice.id, 2), (self.salt.id, 1)])
+
+    def test_sale_rows_link_to_their_bill_and_reconcile(self):
+        self.assertEqual(self.bill.transactions.count(), 2)
+        self.assertEqual(checkout.reconcile(self.bill), [])
+
+        self.bill.transactions.filter(product=self.salt).delete()
+        Transaction.objects.create(product=self.rice, type="in", quantity=1, bill=self.bill)
+        self.assertEqual(checkout.reconcile(self.bill), [(self.rice.id, 2, 1), (self.salt.id, 1, 0)])
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("bill_detail", args=[self.bill.id]))
+        self.assertEqual(
+            [(m["product"], m["billed"], m["moved"]) for m in response.context["mismatches"]],
+            [("Rice", 2, 1), ("Salt", 1, 0)],
+        )
+
+    def test_migration_links_existing_rows_from_their_remarks(self):
+        migration = importlib.import_module("authapp.migrations.0024_transaction_links")
+        supplier = make_supplier()
+        request = SupplierRequest.objects.create(
+            supplier=supplier, product_name="rice ", price_per_unit=Decimal("2"), quantity=5, status="approved"
+        )
+        sale = Transaction.objects.create(
+            product=self.rice, type="out", quantity=2, remarks=f"Sale to Asha on Bill #{self.bill.id}"
+        )
+        supply = Transaction.objects.create(
+            product=self.rice, type="in", quantity=5, remarks="Supplier 'Acme' supplied 5 unit(s)."
+        )
+        orphan = Transaction.objects.create(product=self.rice, type="out", quantity=1, remarks="Sale to B on Bill #999")
+
+        migration.link_existing_transactions(apps, None)
+
+        links = dict(Transaction.objects.values_list("id", "bill_id"))
+        self.assertEqual((links[sale.id], links[orphan.id]), (self.bill.id, None))
+        supply.refresh_from_db()
+        self.assertEqual(supply.supplier_request_id, request.id)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("till")
+        self.rice = make_product("Rice", stock=100, price="2.00", category="Grain")
+        self.oil = make_product("Oil", stock=100, price="5.00", category="Oil")
+        checkout.checkout("A", self.staff, [(self.rice.id, 3), (self.oil.id, 1)])
+        checkout.checkout("B", self.staff, [(self.rice.id, 2)])
+        self.today = timezone.localdate()
+
+    def totals(self):
+        return sorted(DailyProductSales.objects.values_list("product__name", "units", "revenue", "bills"))
+
+    def test_refresh_is_incremental_and_never_double_counts(self):
+        self.assertEqual(rollups.refresh(settle_seconds=0).bills, 2)
+        self.assertEqual(self.totals(), [("Oil", 1, Decimal("5.00"), 1), ("Rice", 5, Decimal("10.00"), 2)])
+
+        self.assertEqual(rollups.refresh(settle_seconds=0).bills, 0)
+        checkout.checkout("C", self.staff, [(self.rice.id, 1)])
+        self.assertEqual(rollups.refresh(settle_seconds=0, batch_size=1).bills, 1)
+        self.assertEqual(self.totals(), [("Oil", 1, Decimal("5.00"), 1), ("Rice", 6, Decimal("12.00"), 3)])
+        self.assertEqual(
+            list(DailyCategorySales.objects.order_by("category").values_list("category", "units")),
+            [("Grain", 6), ("Oil", 1)],
+        )
+
+    def test_recent_bills_wait_for_the_settle_window(self):
+        self.assertEqual(rollups.refresh(settle_seconds=300).bills, 0)
+        Bill.objects.update(date=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(rollups.refresh(settle_seconds=300).bills, 2)
+
+    def test_rebuild_and_report(self):
+        rollups.refresh(settle_seconds=0)
+        rollups.rebuild(settle_seconds=0)
+        report = rollups.sales_report(self.today, self.today)
+        self.assertEqual((report["units"], report["revenue"]), (6, Decimal("15.00")))
+        self.assertEqual([(g["label"], g["revenue"]) for g in report["groups"]], [("Grain", 10), ("Oil", 5)])
+        by_product = rollups.sales_report(self.today, self.today, group="product", top=1)
+        self.assertEqual([(g["label"], g["bills"]) for g in by_product["groups"]], [("Rice", 2)])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("refresh_rollups", "--settle-seconds", "0", stdout=out)
+        self.assertIn("2 bill(s) folded into the rollups", out.getvalue())
+        self.assertEqual(len(self.totals()), 2)
+
+
+@skipUnless(importlib.util.find_spec("numpy"), "forecasting needs numpy")
+class ForecastTests(TestCase):
+    WEEKS = 8
+
+    def setUp(self):
+        staff = make_user("till")
+        self.bill = Bill.objects.create(customer_name="History", created_by=staff)
+        today = timezone.localdate()
+        monday = today - timedelta(days=today.weekday())
+        self.begin = timezone.make_aware(datetime.combine(monday - timedelta(weeks=self.WEEKS), dt_time(12)))
+
+        self.steady = self.product_selling("Steady", [10] * self.WEEKS)
+        self.uneven = self.product_selling("Uneven", [4, 6] * (self.WEEKS // 2))
+        self.new = make_product("New", min_stock=3)
+
+    def product_selling(self, name, weekly):
+        product = make_product(name, stock=100, min_stock=5)
+        Product.objects.filter(id=product.id).update(created_at=self.begin - timedelta(weeks=20))
+        rows = Transaction.objects.bulk_create([
+            Transaction(product=product, type="out", quantity=units, bill=self.bill) for units in weekly
+        ])
+        for week, row in enumerate(rows):
+            Transaction.objects.filter(id=row.id).update(date=self.begin + timedelta(weeks=week, days=1))
+        # Unbilled movements are not demand
+        Transaction.objects.create(product=product, type="out", quantity=500)
+        return product
+
+    def min_stock(self):
+        return dict(Product.objects.values_list("name", "min_stock"))
+
+    def test_reorder_points_from_weekly_sales(self):
+        result = forecast.update_min_stock(weeks=self.WEEKS, method="ma", ma_weeks=self.WEEKS)
+        self.assertEqual((result.products, result.changed), (2, 2))
+        # Steady: 10 a week, no spread. Uneven: 5 a week + 1.645 x 1.07 safety stock
+        self.assertEqual(self.min_stock(), {"Steady": 10, "Uneven": 7, "New": 3})
+
+    def test_smoothing_and_dry_run(self):
+        result = forecast.update_min_stock(dry_run=True, weeks=self.WEEKS, method="ses", lead_time_days=14)
+        suggested = {row["name"]: row["suggested"] for row in result.suggestions}
+        self.assertEqual(suggested["Steady"], 20)
+        self.assertEqual(self.min_stock(), {"Steady": 5, "Uneven": 5, "New": 3})
+
+    def test_low_service_level_never_gives_a_negative_point(self):
+        self.product_selling("Lumpy", [0, 6] * (self.WEEKS // 2))
+        forecast.update_min_stock(weeks=self.WEEKS, method="ma", ma_weeks=self.WEEKS, service_level=0.05)
+        # Lumpy: 3 a week - 1.645 x 3.2 is below zero
+        self.assertEqual(self.min_stock()["Lumpy"], 0)
+
+    def test_rejects_bad_parameters(self):
+        with self.assertRaises(forecast.ForecastError):
+            forecast.update_min_stock(service_level=1.5)
+        with self.assertRaises(forecast.ForecastError):
+            forecast.update_min_stock(method="arima")
+
+
+class PurchaseOrderGenerationTests(TestCase):
+    def setUp(self):
+        self.cheap = make_supplier("cheapco")
+        self.dear = make_supplier("dearco")
+        self.unvetted = make_supplier("newco", status="pending")
+        self.rice = make_product("Rice", stock=2, min_stock=5)
+        self.oil = make_product("Oil", stock=1, min_stock=4, sku="OIL-1")
+        self.salt = make_product("Salt", stock=50, min_stock=5)
+        self.offer(self.dear, "Rice", "3.00")
+        self.offer(self.cheap, "rice", "2.00")
+        self.offer(self.unvetted, "Oil", "0.10")
+        self.offer(self.dear, "Olive oil", "9.00", sku="OIL-1")
+
+    def offer(self, supplier, name, price, **extra):
+        return SupplierRequest.objects.create(
+            supplier=supplier, product_name=name, price_per_unit=Decimal(price), quantity=10, status="approved", **extra
+        )
+
+    def orders(self):
+        return sorted(PurchaseOrder.objects.values_list("product__name", "supplier__name", "quantity"))
+
+    def test_orders_low_products_from_the_cheapest_approved_supplier(self):
+        result = purchasing.generate_purchase_orders()
+        self.assertEqual(result.created, 2)
+        # Up to twice the reorder point: rice 2 * 5 - 2, oil 2 * 4 - 1
+        self.assertEqual(self.orders(), [("Oil", "Dearco", 7), ("Rice", "Cheapco", 8)])
+
+        # Both now have an open order
+        self.assertEqual(purchasing.generate_purchase_orders().created, 0)
+
+    def test_offers_come_cheapest_first(self):
+        since = timezone.now() - timedelta(days=1)
+        prices = [offer.price_per_unit for offer in purchasing.supplier_offers(since)]
+        self.assertEqual(prices, [Decimal("2.00"), Decimal("3.00"), Decimal("9.00")])
+
+    def test_dry_run_and_products_without_suppliers(self):
+        make_product("Pepper", stock=0, min_stock=1)
+        result = purchasing.generate_purchase_orders(dry_run=True)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.no_supplier, ["Pepper"])
+        self.assertEqual(result.by_supplier["Cheapco"], [("Rice", 8)])
+        self.assertFalse(PurchaseOrder.objects.exists())
+
+    def test_sharded_product_low_only_after_unfolded_sales(self):
+        staff = make_user("till")
+        shards.enable(self.salt, 1)
+        self.offer(self.cheap, "Salt", "1.00")
+        checkout.checkout("A", staff, [(self.salt.id, 46)])
+        self.assertFalse(Product.objects.get(id=self.salt.id).is_low)
+
+        purchasing.generate_purchase_orders()
+        self.assertIn(("Salt", "Cheapco", 6), self.orders())
+
+
+class ReceivingTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("store")
+        self.supplier = make_supplier()
+        self.rice = make_product("Rice", stock=5)
+        self.oil = make_product("Oil", stock=0)
+        self.orders = [
+            PurchaseOrder.objects.create(supplier=self.supplier, product=product, quantity=quantity)
+            for product, quantity in [(self.rice, 10), (self.rice, 4), (self.oil, 6)]
+        ]
+        self.client.force_login(self.staff)
+
+    def post(self, lines, **headers):
+        return self.client.post(
+            reverse("api_receive_delivery"), json.dumps({"note": "DN-7", "lines": lines}),
+            content_type="application/json", headers=headers,
+        )
+
+    def stock(self):
+        return dict(Product.objects.values_list("name", "stock"))
+
+    def test_posts_the_whole_note_in_one_go(self):
+        first, second, third = self.orders
+        body = self.post([
+            {"order_id": first.id}, {"order_id": second.id, "quantity": 3}, {"order_id": third.id},
+        ], **{"Idempotency-Key": "dn-7"}).json()
+
+        self.assertEqual((body["orders"], body["units"], body["products"], body["replayed"]), (3, 19, 2, False))
+        self.assertEqual(self.stock(), {"Rice": 18, "Oil": 6})
+        self.assertEqual(set(PurchaseOrder.objects.values_list("status", flat=True)), {"delivered"})
+        self.assertEqual(
+            Transaction.objects.get(purchase_order=second).remarks, f"Delivery DN-7: order #{second.id} from Acme (3 of 4)"
+        )
+
+        again = self.post([{"order_id": first.id}], **{"Idempotency-Key": "dn-7"}).json()
+        self.assertTrue(again["replayed"])
+        self.assertEqual(self.stock(), {"Rice": 18, "Oil": 6})
+
+    def test_one_bad_line_rejects_the_note(self):
+        first, second, _ = self.orders
+        PurchaseOrder.objects.filter(id=second.id).update(status="delivered")
+        response = self.post([
+            {"order_id": first.id, "quantity": 11}, {"order_id": second.id}, {"order_id": 999},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(r["index"], r["error"]) for r in response.json()["rejected"]], [
+            (0, "received 11 but only 10 were ordered"), (1, "order is already delivered"), (2, "no such purchase order"),
+        ])
+        self.assertEqual(self.stock(), {"Rice": 5, "Oil": 0})
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_suppliers_can_only_dispatch(self):
+        order = self.orders[0]
+        self.client.force_login(self.supplier.user)
+        self.client.get(reverse("update_order_status", args=[order.id, "delivered"]))
+        order.refresh_from_db()
+        self.assertEqual(order.status, "pending")
+        self.client.get(reverse("update_order_status", args=[order.id, "dispatched"]))
+        order.refresh_from_db()
+        self.assertEqual(order.status, "dispatched")
+
+
+class SupplierApprovalTests(TestCase):
+    def setUp(self):
+        self.admin = make_user("boss", role="admin")
+        self.supplier = make_supplier()
+        self.sugar = make_product("Sugar", stock=5, price="1.00")
+        self.client.force_login(self.admin)
+
+    def supply(self, name, quantity=10, price="1.20", **extra):
+        return SupplierRequest.objects.create(
+            supplier=self.supplier, product_name=name, quantity=quantity, price_per_unit=Decimal(price), **extra
+        )
+
+    def test_bulk_approval_adds_stock_once(self):
+        first = self.supply("Sugar", 10, "1.20")
+        second = self.supply("Sugar", 5, "1.30", description="Fine grain")
+        rejected = self.supply("Sugar", 99, status="rejected")
+
+        response = self.client.post(reverse("bulk_supplier_requests"), {
+            "action": "approve", "request_ids": [first.id, second.id, rejected.id],
+        })
+        self.assertRedirects(response, reverse("admin_supplier_requests"), fetch_redirect_response=False)
+
+        sugar = Product.objects.get(id=self.sugar.id)
+        self.assertEqual((sugar.stock, sugar.price, sugar.description), (20, Decimal("1.30"), "Fine grain"))
+        self.assertEqual(
+            sorted(Transaction.objects.values_list("supplier_request_id", "quantity")), [(first.id, 10), (second.id, 5)]
+        )
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)][-1],
+            f"⚠️ Request #{rejected.id} was not approved: already rejected.",
+        )
+
+        again = approvals.approve_requests([first.id, second.id])
+        self.assertEqual((again.approved, len(again.skipped)), ([], 2))
+        self.assertEqual(Product.objects.get(id=self.sugar.id).stock, 20)
+
+    def test_only_requests_without_a_sku_match_by_name(self):
+        result = approvals.approve_requests([self.supply("Sugar", 3).id])
+        self.assertEqual(result.created, 0)
+        self.assertEqual(list(Product.objects.filter(name="Sugar").values_list("stock", flat=True)), [8])
+
+        # An explicit SKU nothing has is a different product, even under a known name
+        batch = [self.supply("Sugar", 4, sku="S-1").id, self.supply("Sugar", 6, sku="S-2").id]
+        self.assertEqual(approvals.approve_requests(batch).created, 2)
+        self.assertEqual(
+            sorted(Product.objects.filter(name="Sugar").values_list("sku", "stock")),
+            [("S-1", 4), ("S-2", 6), (self.sugar.sku, 8)],
+        )
+
+    def test_new_names_create_one_product_each(self):
+        batch = [self.supply("Jaggery", 2).id, self.supply("Jaggery", 3).id, self.supply("Rock Salt", 1, sku="rs 1").id]
+        self.assertEqual(approvals.approve_requests(batch).created, 2)
+        # A later approval for the same name finds the product by name or its derived SKU
+        Product.objects.filter(name="Jaggery").update(name="Jaggery Block")
+        self.assertEqual(approvals.approve_requests([self.supply(" jaggery ", 4).id]).created, 0)
+
+        self.assertEqual(
+            sorted(Product.objects.exclude(id=self.sugar.id).values_list("name", "sku", "stock", "category")),
+            [("Jaggery Block", approvals._lookup_sku(SupplierRequest(product_name="Jaggery")), 9, "Supplier"),
+             ("Rock Salt", "RS1", 1, "Supplier")],
+        )
+
+    def test_losing_the_create_race_retries_and_reuses_the_winner(self):
+        request = self.supply("Molasses", 6)
+        # Created by a concurrent approval after this one looked the name up
+        winner = make_product("Molasses", stock=1, sku=approvals._lookup_sku(request))
+        lookups = []
+        real = Product.objects.select_for_update
+
+        def stale_first_lookup(*args, **kwargs):
+            lookups.append(1)
+            queryset = real(*args, **kwargs)
+            return queryset.none() if len(lookups) == 1 else queryset
+
+        with mock.patch.object(Product.objects, "select_for_update", stale_first_lookup):
+            result = approvals.approve_requests([request.id])
+
+        self.assertEqual((len(lookups), result.created), (2, 0))
+        self.assertEqual(list(Product.objects.filter(name="Molasses").values_list("id", "stock")), [(winner.id, 7)])
+
+    def test_suppliers_cannot_approve_their_own_requests(self):
+        pending = self.supply("Sugar", 50)
+        self.client.force_login(self.supplier.user)
+        self.client.post(reverse("approve_request", args=[pending.id]))
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, Product.objects.get(id=self.sugar.id).stock), ("pending", 5))
+
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("approve_request", args=[pending.id]))
+        self.assertRedirects(response, reverse("admin_supplier_requests"), fetch_redirect_response=False)
+        self.assertEqual(Product.objects.get(id=self.sugar.id).stock, 55)
+
+    def test_bulk_reject(self):
+        pending = self.supply("Sugar")
+        self.client.post(reverse("bulk_supplier_requests"), {"action": "reject", "request_ids": [pending.id]})
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, "rejected")
+        self.assertEqual(Product.objects.get(id=self.sugar.id).stock, 5)
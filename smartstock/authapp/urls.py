@@ -7,18 +7,29 @@ urlpatterns = [
     path('logout/',views.logout_view, name='logout'),
     path('register/', views.register_view, name='register'),
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path("api/dashboard/stock-chart/", views.api_stock_chart, name="api_stock_chart"),
     path('staff-dashboard/', views.staff_dashboard, name='staff_dashboard'),
     path("new-bill/", views.new_bill, name="new_bill"),
     path('my_bills/', views.my_bills_list, name='bill_list'),
+    path("my_bills/<int:bill_id>/", views.bill_detail, name="bill_detail"),
+    path("api/bills/batch/", views.api_bill_batch, name="api_bill_batch"),
     path("edit-product/<int:product_id>/", views.edit_product, name="edit_product"),
     path("delete-product/<int:product_id>/", views.delete_product, name="delete_product"),
     path("add-product/", views.add_product, name="add_product"),
+    path("products/import/", views.import_products, name="import_products"),
+    path("products/export/", views.export_products, name="export_products"),
+    path("reports/sales/", views.sales_report, name="sales_report"),
+    path("api/stock/adjustments/", views.api_stock_adjustments, name="api_stock_adjustments"),
+    path("api/products/low-stock/", views.api_low_stock, name="api_low_stock"),
+    path("api/products/lookup/", views.api_product_lookup, name="api_product_lookup"),
+    path("api/products/scan/<str:code>/", views.api_product_scan, name="api_product_scan"),
     path("request-product/", views.request_product, name="request_product"),
     path("manage-users/", views.manage_users, name="manage_users"),
     # path("edit-user/<int:user_id>/", views.edit_user, name="edit_user"),
     path("delete-user/<int:user_id>/", views.delete_user, name="delete_user"),
     path("stock-history/<int:product_id>/", views.stock_history, name="stock_history"),
     path("transactions/", views.transactions_view, name="transactions"),
+    path("transactions/export/", views.export_transactions, name="export_transactions"),
     path("supplier/dashboard/", views.supplier_dashboard, name="supplier_dashboard"),
     path("supplier-request/<int:request_id>/approve/", views.approve_request, name="approve_request"),
     path("supplier-request/<int:request_id>/reject/", views.reject_request, name="reject_request"),
@@ -28,9 +39,11 @@ urlpatterns = [
     path("suppliers/reject/<int:supplier_id>/", views.reject_supplier, name="reject_supplier"),
     path("supplier/pending/", views.supplier_pending, name="supplier_pending"),
     path("supplier/orders/", views.supplier_orders, name="supplier_orders"),
+    path("api/purchase-orders/receive/", views.api_receive_delivery, name="api_receive_delivery"),
     path("supplier/request/", views.supplier_request_product, name="supplier_request_product"),
     path("supplier/requests/", views.supplier_requests, name="supplier_requests"),
     path("dashboard/supplier-requests/", views.admin_supplier_requests, name="admin_supplier_requests"),
+    path("dashboard/supplier-requests/bulk/", views.bulk_supplier_requests, name="bulk_supplier_requests"),
     path("dashboard/supplier-requests/<int:request_id>/approve/", views.approve_supplier_request, name="approve_supplier_request"),
     path("dashboard/supplier-requests/<int:request_id>/reject/", views.reject_supplier_request, name="reject_supplier_request"),
 
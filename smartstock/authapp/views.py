@@ -3,14 +3,27 @@ from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum, F
+from django.db.models import Sum
 from .models import CustomUser, PurchaseOrder, SupplierRequest, Transaction
 from .decorators import role_required
-from django.db.models import Q
-from django.core.paginator import Paginator
-from .models import Bill, BillItem, Product, Transaction
-from django.db import transaction
+from .pagination import approximate_count, keyset_paginate
+from .models import Bill, Product, Transaction, normalize_sku
+from django.db import IntegrityError, transaction
 from .models import Supplier
+from . import (
+    adjustments, approvals, catalog, dashboard, exports, idempotency, imports, inventory, receiving, rollups, search,
+    shards,
+)
+from .idempotency import key_from_request
+from .checkout import checkout, checkout_batch, reconcile
+from .snapshots import stock_at, with_running_balance
+from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_POST
+from datetime import date, datetime, time, timedelta
+import json
+import time as time_module
+import uuid
 
 User = get_user_model()
 
@@ -154,20 +167,15 @@ def logout_view(request):
 
 # ------------------ ADMIN DASHBOARD ------------------
 
+DASHBOARD_PRODUCTS_PER_PAGE = 50
+
+
 @login_required
 def admin_dashboard(request):
 
     if request.user.role != "admin":
         return render(request, "unauth.html", status=403)
 
-    pending_suppliers = Supplier.objects.filter(status="pending")
-    warning_message = None
-    if pending_suppliers.exists() and not request.session.get("request_warning_shown", False):
-        count = pending_suppliers.count()
-        warning_message = f"⚠️ {count} new supplier request(s) pending approval."
-        messages.warning(request, warning_message)
-        request.session["request_warning_shown"] = True 
-
     # Handle stock transaction form
     if request.method == "POST" and "transaction_form" in request.POST:
         product_id = request.POST.get("product")
@@ -175,26 +183,30 @@ def admin_dashboard(request):
         quantity = int(request.POST.get("quantity", 0))
         remarks = request.POST.get("remarks", "")
 
-        product = get_object_or_404(Product, id=product_id)
+        key = key_from_request(request)
 
-        if transaction_type == "in":
-            product.stock += quantity
-        elif transaction_type == "out":
-            if product.stock < quantity:
-                messages.error(request, "Not enough stock to remove.")
-                return redirect("admin_dashboard")
-            product.stock -= quantity
+        # ✅ A double-submitted form replays the original result
+        if idempotency.replayed("stock_transaction", key, request.user) is not None:
+            messages.info(request, "This stock movement was already recorded.")
+            return redirect("admin_dashboard")
 
-        product.save()
+        product = get_object_or_404(Product, id=product_id)
 
-        # Save history
-        Transaction.objects.create(
-            product=product,
-            type=transaction_type,
-            quantity=quantity,
-            remarks=remarks,
-            user=request.user,
-        )
+        try:
+            with transaction.atomic():
+                # ✅ stock = stock +/- quantity in the UPDATE itself, plus the ledger row
+                history = inventory.move_stock(
+                    product.id, transaction_type, quantity, user=request.user, remarks=remarks
+                )
+
+                if key:
+                    idempotency.record("stock_transaction", key, request.user, {"transaction_id": history.id})
+        except inventory.StockMovementError as e:
+            messages.error(request, str(e))
+            return redirect("admin_dashboard")
+        except IntegrityError:
+            messages.info(request, "This stock movement was already recorded.")
+            return redirect("admin_dashboard")
 
         messages.success(request, f"{transaction_type.upper()} recorded for {product.name}")
         return redirect("admin_dashboard")
@@ -212,34 +224,76 @@ def admin_dashboard(request):
         messages.success(request, "✅ Product added successfully!")
         return redirect("admin_dashboard")
 
+    # ✅ Counters, low stock and recent activity come from one cached block
+    summary = dashboard.get_summary()
+
+    warning_message = None
+    if summary["pending_suppliers"] and not request.session.get("request_warning_shown", False):
+        count = summary["pending_suppliers"]
+        warning_message = f"⚠️ {count} new supplier request(s) pending approval."
+        messages.warning(request, warning_message)
+        request.session["request_warning_shown"] = True 
+
+    # ✅ One page of the product table, newest first, by id
+    products = Product.objects.order_by("-id")
+    try:
+        before = int(request.GET.get("before", 0))
+    except ValueError:
+        before = 0
+    if before:
+        products = products.filter(id__lt=before)
+    products = list(products[:DASHBOARD_PRODUCTS_PER_PAGE + 1])
+    more = len(products) > DASHBOARD_PRODUCTS_PER_PAGE
+    products = products[:DASHBOARD_PRODUCTS_PER_PAGE]
+
     # Dashboard data
-    total_products = Product.objects.count()
-    total_stock = Product.objects.aggregate(total=Sum("stock"))["total"] or 0
-    low_stock_products = Product.objects.filter(stock__lte=F("min_stock"))
-    recent_transactions = Transaction.objects.order_by("-date")[:5]
-    transactions_count = Transaction.objects.count()
-    active_users = User.objects.filter( is_active=True,role__in=['staff', 'supplier']).count()
-    chart_labels = list(Product.objects.values_list("name", flat=True))
-    chart_data = list(Product.objects.values_list("stock", flat=True))
     context = {
-        "total_products": total_products,
-        "total_stock": total_stock,
-        "low_stock_products": low_stock_products,
-        "recent_transactions": recent_transactions,
-        "transactions_count": transactions_count,
-        "active_users": active_users,
-        "products": Product.objects.all(),
-        "chart_labels": chart_labels,
-        "chart_data": chart_data,
+        "total_products": summary["total_products"],
+        "total_stock": summary["total_stock"],
+        "low_stock_products": summary["low_stock_products"],
+        "low_stock_count": summary["low_stock_count"],
+        "recent_transactions": summary["recent_transactions"],
+        "transactions_count": summary["transactions_count"],
+        "active_users": summary["active_users"],
+        "products": products,
+        "products_before": products[-1].id if more else None,
+        "products_paged": bool(before),
         "warning_message": warning_message, 
-        "pending_suppliers": pending_suppliers, 
+        "pending_suppliers_count": summary["pending_suppliers"],
+        "idempotency_key": uuid.uuid4().hex,
     }
     return render(request, "admin_dashboard.html", context)
 
+def _chart_params(request):
+    try:
+        top = int(request.GET.get("top", dashboard.CHART_TOP_DEFAULT))
+    except ValueError:
+        top = dashboard.CHART_TOP_DEFAULT
+    top = min(max(top, 1), dashboard.CHART_TOP_MAX)
+    group = "category" if request.GET.get("group") == "category" else "product"
+    return top, group
+
+
+def _chart_etag(request):
+    latest, count = dashboard.chart_fingerprint()
+    top, group = _chart_params(request)
+    stamp = latest.timestamp() if latest else 0
+    return f"{stamp}-{count}-{top}-{group}"
+
+
+@login_required
+@role_required(["admin"])
+@condition(etag_func=_chart_etag)
+def api_stock_chart(request):
+    """Stock chart series for the dashboard; 304 while no product has changed."""
+    top, group = _chart_params(request)
+    return JsonResponse(dashboard.chart_series(top, group))
+
+
 @login_required
 @role_required(["admin"])
 def admin_supplier_requests(request):
-    requests = SupplierRequest.objects.all().order_by("-created_at")
+    requests = SupplierRequest.objects.select_related("supplier").order_by("-created_at")
     return render(request, "admin_supplier_requests.html", {"requests": requests})
 
 
@@ -250,49 +304,26 @@ from .models import SupplierRequest, Product, Transaction
 from .decorators import role_required
 
 
+def _approval_messages(request, result):
+    if result.approved:
+        names = ", ".join(f"'{req.product_name}'" for req in result.approved[:5])
+        more = f" and {len(result.approved) - 5} more" if len(result.approved) > 5 else ""
+        messages.success(request, f"✅ {names}{more} approved and stock updated successfully!")
+    for request_id, reason in result.skipped:
+        messages.warning(request, f"⚠️ Request #{request_id} was not approved: {reason}.")
+
+
 @login_required
 @role_required(["admin"])
 def approve_supplier_request(request, request_id):
     """Approve supplier request and update stock + transaction"""
-    req = get_object_or_404(SupplierRequest, id=request_id)
+    get_object_or_404(SupplierRequest, id=request_id)
 
-    if req.status != "pending":
-        messages.warning(request, f"⚠️ Request for '{req.product_name}' is already {req.status}.")
-        return redirect("admin_supplier_requests")
-
-    # ✅ Mark as approved
-    req.status = "approved"
-    req.save()
-
-    # ✅ Add or update product
-    product, created = Product.objects.get_or_create(
-        name=req.product_name,
-        defaults={
-            "category": "Supplier",
-            "stock": req.quantity,
-            "price": req.price_per_unit,
-            "description": req.description or "",
-        },
-    )
-
-    if not created:
-        product.stock += req.quantity
-        product.price = req.price_per_unit  # Optional: keep price updated
-        if req.description:
-            product.description = req.description
-        product.save()
-
-    # ✅ Record transaction
-    Transaction.objects.create(
-        product=product,
-        type="in",
-        quantity=req.quantity,
-        user=request.user,
-        remarks=f"Supplier '{req.supplier.name}' supplied {req.quantity} unit(s)."
-    )
+    # ✅ Locked, matched on SKU/name and added with an F() update (see approvals.py)
+    result = approvals.approve_requests([request_id], request.user)
+    _approval_messages(request, result)
 
-    # ✅ Success message and reset session warning
-    messages.success(request, f"✅ '{req.product_name}' approved and stock updated successfully!")
+    # ✅ Reset session warning
     request.session["request_warning_shown"] = False
 
     return redirect("admin_supplier_requests")
@@ -304,16 +335,47 @@ def reject_supplier_request(request, request_id):
     """Reject supplier request"""
     req = get_object_or_404(SupplierRequest, id=request_id)
 
-    if req.status != "pending":
-        messages.warning(request, f"⚠️ Request for '{req.product_name}' is already {req.status}.")
-        return redirect("admin_supplier_requests")
+    rejected, skipped = approvals.reject_requests([req.id])
+    if skipped:
+        messages.warning(request, f"⚠️ Request for '{req.product_name}' is {skipped[0][1]}.")
+    else:
+        messages.error(request, f"❌ Supplier request for '{req.product_name}' has been rejected.")
+    return redirect("admin_supplier_requests")
+
+
+SUPPLIER_REQUESTS_BULK_MAX = 1000
+
+
+@login_required
+@role_required(["admin"])
+@require_POST
+def bulk_supplier_requests(request):
+    """Approve or reject every ticked request on admin_supplier_requests in one go."""
+    try:
+        request_ids = sorted({int(pk) for pk in request.POST.getlist("request_ids")})
+    except ValueError:
+        request_ids = []
+    action = request.POST.get("action")
 
-    req.status = "rejected"
-    req.save()
+    if not request_ids or action not in ("approve", "reject"):
+        messages.warning(request, "⚠️ Tick at least one request, then choose Approve or Reject.")
+        return redirect("admin_supplier_requests")
+    if len(request_ids) > SUPPLIER_REQUESTS_BULK_MAX:
+        messages.warning(request, f"⚠️ At most {SUPPLIER_REQUESTS_BULK_MAX} requests at a time.")
+        return redirect("admin_supplier_requests")
 
-    messages.error(request, f"❌ Supplier request for '{req.product_name}' has been rejected.")
+    if action == "approve":
+        _approval_messages(request, approvals.approve_requests(request_ids, request.user))
+        request.session["request_warning_shown"] = False
+    else:
+        rejected, skipped = approvals.reject_requests(request_ids)
+        if rejected:
+            messages.error(request, f"❌ {len(rejected)} supplier request(s) rejected.")
+        for request_id, reason in skipped:
+            messages.warning(request, f"⚠️ Request #{request_id} was not rejected: {reason}.")
     return redirect("admin_supplier_requests")
 
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -334,6 +396,7 @@ def request_product(request):
         SupplierRequest.objects.create(
             supplier=supplier,
             product_name=request.POST.get("product_name"),
+            sku=normalize_sku(request.POST.get("sku")),
             description=request.POST.get("description"),
             price_per_unit=request.POST.get("price_per_unit"),
             quantity=request.POST.get("quantity"),
@@ -346,17 +409,98 @@ def request_product(request):
 
 # ------------------ PRODUCT MANAGEMENT ------------------
 
+LOW_STOCK_PAGE_MAX = 200
+
+
+@login_required
+@role_required(["admin", "staff"])
+def api_low_stock(request):
+    """Page through low-stock products only, by id: ?after=<last id>&limit=50."""
+    try:
+        after = int(request.GET.get("after", 0))
+        limit = min(max(int(request.GET.get("limit", 50)), 1), LOW_STOCK_PAGE_MAX)
+    except ValueError:
+        return JsonResponse({"error": "after and limit must be integers."}, status=400)
+
+    rows = list(
+        shards.low_stock(Product.objects.filter(id__gt=after)).order_by("id")
+        .values("id", "name", "category", "exact", "min_stock")[:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    for row in rows:
+        # Sharded products sell from their shards; report what is really left
+        row["stock"] = row.pop("exact")
+    return JsonResponse({
+        "results": rows,
+        "next_after": rows[-1]["id"] if more else None,
+    })
+
+
+LOOKUP_LIMIT_MAX = 25
+
+
+@login_required
+@role_required(["admin", "staff"])
+def api_product_lookup(request):
+    """Typeahead for the billing screen: ?q=<text>&limit=10.
+
+    Matching runs against the in-process catalogue index; only the matched
+    ids go to the database, for live price and stock.
+    """
+    query = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), LOOKUP_LIMIT_MAX)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer."}, status=400)
+
+    ids = catalog.index.search(query, limit) if query else []
+    rows = Product.objects.in_bulk(ids) if ids else {}
+    results = [
+        {
+            "id": pk,
+            "name": rows[pk].name,
+            "sku": rows[pk].sku,
+            "category": rows[pk].category,
+            "price": str(rows[pk].price),
+            "stock": rows[pk].stock,
+        }
+        for pk in ids if pk in rows
+    ]
+    return JsonResponse({"query": query, "results": results})
+
+
+@login_required
+@role_required(["admin", "staff"])
+def api_product_scan(request, code):
+    """Resolve a scanned barcode to its product, price and stock (one unique-index lookup)."""
+    rows = list(
+        Product.objects.filter(sku=normalize_sku(code))
+        .values("id", "sku", "name", "category", "price", "stock")[:1]
+    )
+    if not rows:
+        return JsonResponse({"error": f"No product with SKU {code}."}, status=404)
+    return JsonResponse(rows[0])
+
+
 @login_required
 def add_product(request):
     if request.method == "POST":
-        Product.objects.create(
-            name=request.POST.get("name"),
-            category=request.POST.get("category"),
-            stock=request.POST.get("stock"),
-            price=request.POST.get("price"),
-            description=request.POST.get("description"),
-            min_stock=request.POST.get("min_stock", 5),
-        )
+        try:
+            # Savepoint, so a taken SKU doesn't break an enclosing transaction
+            with transaction.atomic():
+                Product.objects.create(
+                    name=request.POST.get("name"),
+                    sku=request.POST.get("sku", ""),
+                    category=request.POST.get("category"),
+                    stock=request.POST.get("stock"),
+                    price=request.POST.get("price"),
+                    description=request.POST.get("description"),
+                    min_stock=request.POST.get("min_stock", 5),
+                )
+        except IntegrityError:
+            messages.error(request, "❌ Another product already uses that SKU.")
+            return render(request, "add_product.html")
         messages.success(request, "✅ Product added successfully!")
         return redirect("admin_dashboard")
     return render(request, "add_product.html")
@@ -366,18 +510,156 @@ def add_product(request):
 def edit_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     if request.method == "POST":
-        product.name = request.POST.get("name")
-        product.category = request.POST.get("category")
-        product.stock = request.POST.get("stock")
-        product.price = request.POST.get("price")
-        product.description = request.POST.get("description")
-        product.min_stock = request.POST.get("min_stock", 5)
-        product.save()
+        # ✅ Only applies if nobody (a bill, another admin) wrote the row since the form was loaded
+        try:
+            version = int(request.POST.get("version", 0))
+            stock = int(request.POST.get("stock"))
+        except (TypeError, ValueError):
+            messages.error(request, "❌ Stock must be a whole number.")
+            return render(request, "edit_product.html", {"product": product})
+        try:
+            inventory.update_product(
+                product.id,
+                version,
+                {
+                    "name": request.POST.get("name"),
+                    "sku": request.POST.get("sku"),
+                    "category": request.POST.get("category"),
+                    "price": request.POST.get("price"),
+                    "description": request.POST.get("description"),
+                    "min_stock": request.POST.get("min_stock", product.min_stock),
+                },
+                stock=stock,
+                user=request.user,
+            )
+        except inventory.StaleProductError as e:
+            messages.warning(request, f"⚠️ {e}")
+            return render(request, "edit_product.html", {"product": e.current}, status=409)
+        except IntegrityError:
+            messages.error(request, "❌ Another product already uses that SKU.")
+            return render(request, "edit_product.html", {"product": product})
         messages.success(request, "✅ Product updated successfully")
         return redirect("admin_dashboard")
     return render(request, "edit_product.html", {"product": product})
 
 
+IMPORT_REJECTS_SHOWN = 200
+
+
+@login_required
+@role_required(["admin"])
+def import_products(request):
+    """Upload a CSV/XLSX catalogue; rows are upserted on SKU in batches."""
+    context = {}
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if not upload:
+            messages.error(request, "❌ Choose a CSV or XLSX file to import.")
+            return redirect("import_products")
+
+        fmt = upload.name.rsplit(".", 1)[-1].lower()
+        try:
+            result = imports.import_products(upload.file, fmt, user=request.user)
+        except imports.ImportFileError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect("import_products")
+
+        if request.POST.get("report") and result.rejected:
+            response = HttpResponse(imports.rejection_report(result), content_type="text/csv")
+            response["Content-Disposition"] = 'attachment; filename="product-import-rejects.csv"'
+            return response
+
+        messages.success(
+            request,
+            f"✅ {result.rows} rows in {result.seconds:.1f}s ({result.rows_per_second} rows/s): "
+            f"{result.created} created, {result.updated} updated, {len(result.rejected)} rejected.",
+        )
+        context = {
+            "result": result,
+            "rejected": result.rejected[:IMPORT_REJECTS_SHOWN],
+        }
+    return render(request, "import_products.html", context)
+
+
+@login_required
+@role_required(["admin"])
+def export_products(request):
+    """Stream the catalogue as CSV, in the column layout import_products reads."""
+    chunks, content_type, extension = exports.export_products(compress=request.GET.get("gzip") == "1")
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    filename = f"products-{timezone.localdate():%Y%m%d}.{extension}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _report_day(value, default):
+    try:
+        return date.fromisoformat(value) if value else default
+    except ValueError:
+        return default
+
+
+@login_required
+@role_required(["admin"])
+def sales_report(request):
+    """Revenue and units per day and per category/product, from the daily rollups only."""
+    today = timezone.localdate()
+    start = _report_day(request.GET.get("from"), today.replace(day=1))
+    end = _report_day(request.GET.get("to"), today)
+    if end < start:
+        start, end = end, start
+    group = "product" if request.GET.get("group") == "product" else "category"
+
+    report = rollups.sales_report(start, end, group)
+    return render(request, "sales_report.html", {
+        **report,
+        "date_from": start.isoformat(),
+        "date_to": end.isoformat(),
+        "group": group,
+        "refreshed_at": rollups.last_refreshed(),
+    })
+
+
+ADJUSTMENT_MAX_COUNTS = 20000
+
+
+@login_required
+@role_required(["admin"])
+@require_POST
+def api_stock_adjustments(request):
+    """Post a stock-take: each SKU's stock becomes its counted quantity.
+
+    Body: {"counts": [{"sku": "...", "counted": 12}], "reason": "...", "dry_run": true}
+    With dry_run the differences are returned and nothing is written.
+    """
+    try:
+        payload = json.loads(request.body)
+        counts = payload["counts"]
+        if not isinstance(counts, list) or not all(isinstance(c, dict) for c in counts):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a 'counts' list."}, status=400)
+
+    if len(counts) > ADJUSTMENT_MAX_COUNTS:
+        return JsonResponse({"error": f"At most {ADJUSTMENT_MAX_COUNTS} counts per call."}, status=400)
+
+    dry_run = bool(payload.get("dry_run"))
+    result = adjustments.adjust_stock(
+        enumerate(counts, start=1),
+        user=request.user,
+        reason=str(payload.get("reason", ""))[:200],
+        dry_run=dry_run,
+    )
+    return JsonResponse({
+        "dry_run": dry_run,
+        "adjusted": result.adjusted,
+        "unchanged": result.unchanged,
+        "rejected": [{"index": line, "sku": sku, "error": error} for line, sku, error in result.rejected],
+        "diffs": result.diffs,
+        "elapsed_ms": round(result.seconds * 1000, 1),
+    })
+
+
 @login_required
 def delete_product(request, product_id):
     product = get_object_or_404(Product, id=product_id)
@@ -392,43 +674,90 @@ def delete_product(request, product_id):
 @role_required(['admin'])
 def stock_history(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    transactions = product.transactions.order_by("-date")
+    page = keyset_paginate(
+        product.transactions.select_related("user"), request.GET.get("cursor"), per_page=25
+    )
+    with_running_balance(product, page.object_list)
+
+    # ✅ Stock on a past date: nearest snapshot + ledger tail
+    as_of = request.GET.get("as_of")
+    stock_as_of = None
+    if as_of:
+        try:
+            end_of_day = datetime.combine(date.fromisoformat(as_of), time.max)
+            stock_as_of = stock_at(product, timezone.make_aware(end_of_day))
+        except ValueError:
+            as_of = None
+
     return render(request, "stock_history.html", {
         "product": product,
-        "transactions": transactions
+        "transactions": page,
+        "page": page,
+        "as_of": as_of,
+        "stock_as_of": stock_as_of,
     })
 
 @login_required
 def transactions_view(request):
     # ✅ Get all transactions
-    transactions = Transaction.objects.select_related("product", "user").order_by("-date")
+    transactions = Transaction.objects.select_related("product", "user")
 
     # ✅ Filtering
     transaction_type = request.GET.get("type")
     search_query = request.GET.get("q")
 
-    if transaction_type in ["in", "out"]:
-        transactions = transactions.filter(type=transaction_type)
+    if transaction_type not in ["in", "out"]:
+        transaction_type = None
 
+    page_obj = None
     if search_query:
-        transactions = transactions.filter(
-            Q(product__name__icontains=search_query) |
-            Q(user__username__icontains=search_query) |
-            Q(remarks__icontains=search_query)
+        # ✅ Ranked matches straight from the full-text index
+        page_obj = search.ranked_page(
+            transactions, search_query, transaction_type, request.GET.get("cursor"), per_page=10
         )
 
-    # ✅ Pagination
-    paginator = Paginator(transactions, 10)  # 10 per page
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    if page_obj is None:
+        if transaction_type:
+            transactions = transactions.filter(type=transaction_type)
+
+        if search_query:
+            # No full-text index on this database backend
+            transactions = search.filter_queryset(transactions, search_query)
+
+        # ✅ Keyset pagination on (date, id): page N costs the same as page 1
+        page_obj = keyset_paginate(transactions, request.GET.get("cursor"), per_page=10)
+
+    approx_total = None
+    if request.GET.get("count") and not search_query:
+        approx_total = approximate_count(transactions)
 
     return render(request, "transactions.html", {
         "page_obj": page_obj,
+        "approx_total": approx_total,
         "transaction_type": transaction_type,
         "search_query": search_query,
     })
 
 
+@login_required
+@role_required(['admin'])
+def export_transactions(request):
+    """Stream the ledger as CSV or NDJSON, honouring the transactions_view filters."""
+    fmt = request.GET.get("format", "csv")
+    if fmt not in exports.FORMATS:
+        fmt = "csv"
+    chunks, content_type, extension = exports.export_ledger(
+        fmt,
+        transaction_type=request.GET.get("type"),
+        search_query=request.GET.get("q"),
+        compress=request.GET.get("gzip") == "1",
+    )
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    filename = f"stock-ledger-{timezone.localdate():%Y%m%d}.{extension}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 # ------------------ USER MANAGEMENT ------------------
 
 @login_required
@@ -480,8 +809,8 @@ def staff_dashboard(request):
     # 🔹 Current product list (to verify updated stock after billing)
     products = Product.objects.all().order_by("name")
 
-    # 🔹 Low stock alerts
-    low_stock_products = Product.objects.filter(stock__lte=F("min_stock"))
+    # 🔹 Low stock alerts (partial index on is_low, exact for sharded products)
+    low_stock_products = shards.low_stock()
 
     context = {
          "total_products": total_products,
@@ -492,7 +821,7 @@ def staff_dashboard(request):
     }
     return render(request, "staff_dashboard.html", context)
 
-from .models import Product, Transaction, Bill, BillItem
+from .models import Product, Transaction, Bill
 
 
 @login_required
@@ -506,70 +835,117 @@ def new_bill(request):
             messages.error(request, "Please enter a customer name and select at least one product")
             return redirect("new_bill")
 
+        lines = []
+        for item in selected_products:
+            if ":" not in item:
+                continue
+            pid, idx = item.split(":", 1)
+            qty_str = request.POST.get(f"quantity_{idx}", "0")
+            try:
+                lines.append((int(pid), int(qty_str)))
+            except ValueError:
+                continue
+
         try:
-            with transaction.atomic():
-                bill = Bill.objects.create(customer_name=customer_name, created_by=request.user)
-
-                for item in selected_products:
-                    if ":" not in item:
-                        continue
-                    pid, idx = item.split(":", 1)
-                    qty_str = request.POST.get(f"quantity_{idx}", "0")
-                    try:
-                        qty = int(qty_str)
-                    except ValueError:
-                        qty = 0
-                    if qty <= 0:
-                        continue
-
-                    product = Product.objects.select_for_update().get(id=pid)  # ✅ lock row
-                    if product.stock < qty:
-                        raise ValueError(
-                            f"Not enough stock for {product.name}. Available: {product.stock}, Requested: {qty}"
-                        )
-
-                    # Create BillItem
-                    BillItem.objects.create(
-                        bill=bill,
-                        product=product,
-                        quantity=qty,
-                        price=product.price
-                    )
-
-                    # Reduce stock safely
-                    product.stock = F('stock') - qty
-                    product.save(update_fields=['stock'])
-
-                    # Refresh to get the actual integer value
-                    product.refresh_from_db()
-
-                    # Record transaction
-                    Transaction.objects.create(
-                        product=product,
-                        type="out",
-                        quantity=qty,
-                        user=request.user,
-                        remarks=f"Sale to {customer_name} on Bill #{bill.id}"
-                    )
-
-            messages.success(request, f"Bill #{bill.id} created successfully ✅")
+            # ✅ Locks all products at once (in id order) and writes in bulk
+            bill = checkout(customer_name, request.user, lines, idempotency_key=key_from_request(request))
+            if bill.replayed:
+                messages.info(request, f"Bill {bill.invoice_number} was already recorded ✅")
+            else:
+                messages.success(request, f"Bill {bill.invoice_number} created successfully ✅")
             return redirect("staff_dashboard")
         except ValueError as e:
             messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f"An unexpected error occurred: {e}")
 
-    # GET request
+    # GET request: the invoice number is only allocated when the bill is saved,
+    # and products are looked up as the cashier types (api_product_lookup)
+    return render(request, "new_bill.html", {
+        "idempotency_key": uuid.uuid4().hex,
+    })
+
+
+BATCH_MAX_BILLS = 5000
+
+
+@login_required
+@role_required(['staff'])
+@require_POST
+def api_bill_batch(request):
+    """Create many bills from a POS terminal in one call.
+
+    Body: {"bills": [{"customer_name": "...", "lines": [{"product_id": 1, "quantity": 2}]}]}
+    """
     try:
-        last_bill = Bill.objects.latest("id")
-        next_invoice_number = last_bill.id + 1
-    except Bill.DoesNotExist:
-        next_invoice_number = 1
+        payload = json.loads(request.body)
+        entries = payload["bills"]
+        if not isinstance(entries, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a 'bills' list."}, status=400)
+
+    if len(entries) > BATCH_MAX_BILLS:
+        return JsonResponse({"error": f"At most {BATCH_MAX_BILLS} bills per call."}, status=400)
+
+    started = time_module.perf_counter()
+    results = checkout_batch(entries, request.user)
+    elapsed = time_module.perf_counter() - started
+
+    created = sum(1 for r in results if r["ok"])
+    return JsonResponse({
+        "results": results,
+        "created": created,
+        "failed": len(results) - created,
+        "elapsed_ms": round(elapsed * 1000, 1),
+        "bills_per_second": round(len(results) / elapsed, 1) if elapsed else None,
+    })
 
-    products = Product.objects.all()
-    return render(request, "new_bill.html", {
-        "products": products,
-        "invoice_number": next_invoice_number
+
+RECEIVING_MAX_LINES = 2000
+
+
+@login_required
+@role_required(["admin", "staff"])
+@require_POST
+def api_receive_delivery(request):
+    """Post a supplier delivery note against its purchase orders.
+
+    Body: {"note": "DN-123", "lines": [{"order_id": 1, "quantity": 10}]}
+    A line without a quantity receives the whole order. Either every line
+    is posted or none is.
+    """
+    try:
+        payload = json.loads(request.body)
+        lines = payload["lines"]
+        if not isinstance(lines, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a 'lines' list."}, status=400)
+
+    if len(lines) > RECEIVING_MAX_LINES:
+        return JsonResponse({"error": f"At most {RECEIVING_MAX_LINES} lines per delivery note."}, status=400)
+
+    started = time_module.perf_counter()
+    try:
+        result = receiving.receive(
+            lines,
+            user=request.user,
+            note=str(payload.get("note", ""))[:100],
+            idempotency_key=key_from_request(request),
+        )
+    except receiving.ReceivingError as e:
+        return JsonResponse({
+            "error": str(e),
+            "rejected": [{"index": index, "order_id": order_id, "error": error} for index, order_id, error in e.errors],
+        }, status=400)
+
+    return JsonResponse({
+        "orders": result.orders,
+        "units": result.units,
+        "products": result.products,
+        "replayed": result.replayed,
+        "elapsed_ms": round((time_module.perf_counter() - started) * 1000, 1),
     })
 
 
@@ -580,9 +956,63 @@ def new_bill(request):
 #     return render(request, "my_bills.html", {"bills": bills})
 
 def my_bills_list(request):
-    
-    bills = Bill.objects.all().order_by('-date')  # Order by creation date, newest first
-    return render(request, "bill_list.html", {"bills": bills})
+    bills = Bill.objects.select_related("created_by")
+
+    # ✅ Filters
+    date_from = request.GET.get("from")
+    date_to = request.GET.get("to")
+    customer = request.GET.get("customer")
+
+    # Compare against day boundaries so the date index can be used
+    if date_from:
+        try:
+            start = datetime.combine(date.fromisoformat(date_from), time.min)
+            bills = bills.filter(date__gte=timezone.make_aware(start))
+        except ValueError:
+            date_from = None
+    if date_to:
+        try:
+            end = datetime.combine(date.fromisoformat(date_to) + timedelta(days=1), time.min)
+            bills = bills.filter(date__lt=timezone.make_aware(end))
+        except ValueError:
+            date_to = None
+    if customer:
+        bills = bills.filter(customer_name__icontains=customer)
+
+    # ✅ Keyset pagination, newest first (no COUNT, no OFFSET)
+    page = keyset_paginate(bills, request.GET.get("cursor"), per_page=25)
+
+    return render(request, "bill_list.html", {
+        "bills": page,
+        "page": page,
+        "date_from": date_from,
+        "date_to": date_to,
+        "customer": customer,
+    })
+
+
+@login_required
+@role_required(["staff", "admin"])
+def bill_detail(request, bill_id):
+    bill = get_object_or_404(Bill.objects.select_related("created_by"), id=bill_id)
+    items = bill.items.select_related("product")
+
+    # ✅ The sale's stock movements through the indexed bill link, not a remarks search
+    ledger = bill.transactions.select_related("product", "user").order_by("id")
+
+    # ✅ Items vs ledger: anything billed but not (or differently) taken out of stock
+    mismatches = reconcile(bill)
+    names = dict(Product.objects.filter(id__in=[pid for pid, _, _ in mismatches]).values_list("id", "name"))
+
+    return render(request, "bill_detail.html", {
+        "bill": bill,
+        "items": items,
+        "ledger": ledger,
+        "mismatches": [
+            {"product": names.get(pid, f"#{pid}"), "billed": billed, "moved": moved}
+            for pid, billed, moved in mismatches
+        ],
+    })
 
 
 
@@ -618,8 +1048,14 @@ def supplier_dashboard(request):
 @role_required(["supplier"])
 def update_order_status(request, order_id, status):
     order = get_object_or_404(PurchaseOrder, id=order_id, supplier__user=request.user)
-    order.status = status
-    order.save()
+
+    # ✅ Suppliers can only dispatch; delivery is confirmed when the store receives it
+    if status != "dispatched" or not receiving.can_transition(order.status, status):
+        messages.error(request, f"❌ Order #{order.id} is {order.status} and can't be marked as {status}.")
+        return redirect("supplier_dashboard")
+
+    # Conditional update so a delivery posted meanwhile isn't reverted
+    PurchaseOrder.objects.filter(id=order.id, status=order.status).update(status=status)
     messages.success(request, f"Order #{order.id} marked as {status} ✅")
     return redirect("supplier_dashboard")
 
@@ -706,6 +1142,7 @@ def supplier_request_product(request):
             SupplierRequest.objects.create(
                 supplier=supplier,
                 product_name=product_name,
+                sku=normalize_sku(request.POST.get("sku")),
                 description=description,
                 price_per_unit=float(price),
                 quantity=int(quantity),
@@ -730,37 +1167,19 @@ def supplier_requests(request):
     return render(request, "supplier_requests.html", {"requests": requests})
 
 @login_required
-@role_required(["supplier", "admin"])  # Only supplier or admin can approve
+@role_required(["admin"])  # Suppliers must not approve (and stock) their own requests
 def approve_request(request, request_id):
     if request.method == "POST":
         req = get_object_or_404(SupplierRequest, id=request_id)
 
-        # Mark the request as approved
-        req.status = "approved"
-        req.save()
-
-        # Update existing product or create new one
-        product, created = Product.objects.get_or_create(
-            name=req.product_name,
-            defaults={
-                "category": req.product_name,  # You can set category if needed
-                "stock": req.quantity,
-                "price": req.price_per_unit,
-                "description": req.description or "",
-                "min_stock": 5,
-            }
-        )
-
-        if not created:
-            # If product exists, just increase the stock
-            product.stock += req.quantity
-            # Optionally update price if you want latest supplier price
-            product.price = req.price_per_unit
-            product.save()
-
-        messages.success(request, f"✅ '{req.product_name}' approved and stock updated.")
+        # Same race-safe path as the admin approval: locked, F() increment, ledger row
+        result = approvals.approve_requests([req.id], request.user)
+        if result.approved:
+            messages.success(request, f"✅ '{req.product_name}' approved and stock updated.")
+        else:
+            messages.warning(request, f"⚠️ '{req.product_name}' is {result.skipped[0][1]}.")
     
-    return redirect("supplier_dashboard") 
+    return redirect("admin_supplier_requests")
 
 
 @login_required
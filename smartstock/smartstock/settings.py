@@ -124,3 +124,23 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'authapp.CustomUser'
 
 LOGIN_URL = "login"
+
+# Shared by every worker, so a dashboard or catalogue invalidation made in one
+# process reaches all of them. The table is created by migration 0019 (or
+# `manage.py createcachetable`); Redis or memcached can take its place.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "smartstock_cache",
+    }
+}
+
+# Replayed writes carrying the same Idempotency-Key are recognised for this long
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Invoice numbering: STORE_CODE prefixes every number. A block size of 1 keeps
+# the sequence gap-free (invoice series usually have to be) at one UPDATE per
+# bill; larger blocks let each worker hand out numbers from memory at the
+# cost of gaps when a worker restarts.
+STORE_CODE = "MAIN"
+INVOICE_NUMBER_BLOCK_SIZE = 1